@@ -0,0 +1,103 @@
+import time
+import random
+import asyncio
+
+from typing import Callable, Dict, List, Optional
+
+import aiohttp
+
+
+class Sample:
+    """One HTTP request made by a simulated player"""
+    __slots__ = ("kind", "status", "ttfb", "elapsed", "bytes")
+
+    def __init__(self, kind: str, status: int, ttfb: Optional[float], elapsed: float, size: int):
+        self.kind = kind
+        self.status = status
+        self.ttfb = ttfb
+        self.elapsed = elapsed
+        self.bytes = size
+
+
+class PlayerDriver:
+    """
+    Simulates `players` concurrent listeners against a running server.
+    Every listener picks tracks with a skewed popularity, starts them with
+    `Range: bytes=0-`, listens to part of the track and then either seeks
+    (byte range or `?t=seconds`), skips to another track or downloads it.
+    """
+    def __init__(self, base_url: str, tracks: List[dict], url_for: Callable[[dict], str],
+                 players: int, duration: float, seek_rate: float = 0.3, time_seek_rate: float = 0.5,
+                 download_rate: float = 0.05, listen_bytes: tuple = (256 * 1024, 2 * 1024 * 1024), seed: int = 0):
+        self.base_url = base_url.rstrip("/")
+        self.tracks = tracks
+        self.url_for = url_for
+        self.players = players
+        self.duration = duration
+        self.seek_rate = seek_rate
+        self.time_seek_rate = time_seek_rate
+        self.download_rate = download_rate
+        self.listen_bytes = listen_bytes
+        self.random = random.Random(seed)
+
+        # zipf-like popularity, a few tracks get most of the plays
+        self._weights = [1 / (rank + 1) for rank in range(len(tracks))]
+        self.samples: List[Sample] = []
+        self.started = self.finished = 0.0
+
+
+    async def run(self) -> List[Sample]:
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=60)
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            self.started = time.perf_counter()
+            deadline = self.started + self.duration
+            await asyncio.gather(*(self._player(session, deadline) for _ in range(self.players)))
+            self.finished = time.perf_counter()
+        return self.samples
+
+
+    async def _player(self, session: aiohttp.ClientSession, deadline: float) -> None:
+        while time.perf_counter() < deadline:
+            track = self.random.choices(self.tracks, weights=self._weights)[0]
+            url = self.base_url + self.url_for(track)
+
+            if self.random.random() < self.download_rate:
+                await self._request(session, "download", url, {}, None, deadline)
+                continue
+
+            await self._request(session, "play", url, {"Range": "bytes=0-"}, self._listen(), deadline)
+            while self.random.random() < self.seek_rate and time.perf_counter() < deadline:
+                if self.random.random() < self.time_seek_rate:
+                    seconds = round(self.random.uniform(0, track["duration"] * 0.95), 1)
+                    separator = "&" if "?" in url else "?"
+                    await self._request(session, "time_seek", f"{url}{separator}t={seconds}", {}, self._listen(), deadline)
+                else:
+                    offset = self.random.randrange(0, track["size"])
+                    await self._request(session, "seek", url, {"Range": f"bytes={offset}-"}, self._listen(), deadline)
+
+
+    def _listen(self) -> int:
+        return self.random.randint(*self.listen_bytes)
+
+
+    async def _request(self, session: aiohttp.ClientSession, kind: str, url: str, headers: Dict[str, str],
+                       limit: Optional[int], deadline: float) -> None:
+        """Read up to `limit` bytes (or everything) and close, the way a player abandons a response"""
+        started = time.perf_counter()
+        ttfb = None
+        received = 0
+        status = 0
+        try:
+            async with session.get(url, headers=headers) as response:
+                status = response.status
+                async for chunk in response.content.iter_any():
+                    if ttfb is None:
+                        ttfb = time.perf_counter() - started
+                    received += len(chunk)
+                    if (limit and received >= limit) or time.perf_counter() >= deadline:
+                        response.close()
+                        break
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            status = status or -1
+        self.samples.append(Sample(kind, status, ttfb, time.perf_counter() - started, received))
@@ -0,0 +1,158 @@
+import os
+import random
+import asyncio
+
+from typing import Dict, Optional
+
+from pyrogram import raw
+from pyrogram.errors import FloodWait, LimitInvalid, OffsetInvalid
+from pyrogram.file_id import FileId, FileType
+
+from bot.tgclient import Bot, botmanager
+from bot.utils import streamer
+from bot.utils.errors import FileNotFound
+
+
+MiB = 1024 * 1024
+
+
+class FaultProfile:
+    """Latency and failures injected into every GetFile of the fake backend"""
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, bandwidth: float = 0,
+                 flood_rate: float = 0, flood_seconds: int = 3, timeout_rate: float = 0, timeout: float = 1.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth  # bytes/sec per request, 0 for unlimited
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.timeout_rate = timeout_rate
+        self.timeout = timeout
+
+
+class FakeBackend:
+    """
+    Serves upload.GetFile from local files, standing in for Telegram.
+    Every media id maps to a file, requests are checked against the
+    GetFile alignment rules and counted.
+    """
+    def __init__(self, faults: FaultProfile, dc_id: int = 4):
+        self.faults = faults
+        self.dc_id = dc_id
+        self._files: Dict[int, str] = {}
+        self._messages: Dict[tuple, int] = {}  # (chat_id, msg_id) -> media id
+
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.floods = 0
+        self.timeouts = 0
+        self.invalid = 0
+        self.sessions = 0
+
+
+    def add_file(self, chat_id: int, msg_id: int, path: str) -> int:
+        media_id = len(self._files) + 1
+        self._files[media_id] = path
+        self._messages[(chat_id, msg_id)] = media_id
+        return media_id
+
+
+    async def get_file_ids(self, client, chat_id: int, message_id: int) -> Optional[FileId]:
+        """Replacement for streamer.get_file_ids, resolves without get_messages"""
+        await asyncio.sleep(self._delay())
+        media_id = self._messages.get((int(chat_id), int(message_id)))
+        if not media_id:
+            raise FileNotFound
+
+        file_id = FileId(file_type=FileType.AUDIO, dc_id=self.dc_id, media_id=media_id, access_hash=0, file_reference=b"bench")
+        setattr(file_id, 'file_name', os.path.basename(self._files[media_id]))
+        setattr(file_id, 'file_size', os.path.getsize(self._files[media_id]))
+        setattr(file_id, 'mime_type', 'audio/mpeg')
+        setattr(file_id, 'unique_id', f"bench{media_id}")
+        setattr(file_id, 'msg_key', (int(chat_id), int(message_id)))
+        return file_id
+
+
+    async def create_session(self, dc_id: int) -> "FakeMediaSession":
+        await asyncio.sleep(self._delay())
+        self.sessions += 1
+        return FakeMediaSession(self)
+
+
+    async def get_file(self, query: raw.functions.upload.GetFile) -> raw.types.upload.File:
+        self.requests += 1
+        faults = self.faults
+        offset, limit = query.offset, query.limit
+        if limit % 4096 or offset % 4096 or MiB % limit or offset // MiB != (offset + limit - 1) // MiB:
+            self.invalid += 1
+            raise LimitInvalid() if MiB % limit else OffsetInvalid()
+
+        roll = random.random()
+        if roll < faults.flood_rate:
+            self.floods += 1
+            raise FloodWait(value=faults.flood_seconds)
+        if roll < faults.flood_rate + faults.timeout_rate:
+            self.timeouts += 1
+            await asyncio.sleep(faults.timeout)
+            raise TimeoutError
+
+        path = self._files[query.location.id]
+        data = await asyncio.to_thread(self._read, path, offset, limit)
+        delay = self._delay()
+        if faults.bandwidth:
+            delay += len(data) / faults.bandwidth
+        await asyncio.sleep(delay)
+
+        self.bytes_fetched += len(data)
+        return raw.types.upload.File(type=raw.types.storage.FileUnknown(), mtime=0, bytes=data)
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "bytes_fetched": self.bytes_fetched,
+            "floods": self.floods,
+            "timeouts": self.timeouts,
+            "invalid_requests": self.invalid,
+            "sessions": self.sessions,
+        }
+
+
+    def _delay(self) -> float:
+        return max(0.0, random.gauss(self.faults.latency, self.faults.jitter))
+
+
+    @staticmethod
+    def _read(path: str, offset: int, limit: int) -> bytes:
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(limit)
+
+
+class FakeMediaSession:
+    """The part of pyrogram.session.Session that ByteStreamer and MediaSessionManager use"""
+    def __init__(self, backend: FakeBackend):
+        self.backend = backend
+
+
+    async def send(self, query, timeout: float = None, **kwargs):
+        if isinstance(query, raw.functions.upload.GetFile):
+            return await self.backend.get_file(query)
+        if isinstance(query, raw.functions.Ping):
+            return raw.types.Pong(msg_id=0, ping_id=query.ping_id)
+        raise RuntimeError(f"fake backend does not serve {type(query).__name__}")
+
+
+    async def stop(self) -> None:
+        pass
+
+
+async def add_fake_bots(backend: FakeBackend, count: int) -> None:
+    """Register `count` worker bots on the global botmanager, wired to the fake backend"""
+    streamer.get_file_ids = backend.get_file_ids
+    for i in range(count):
+        bot_id = await botmanager.add_worker_bot(f"{i}:bench-token", bot_id=f"bench_{i}")
+        bot: Bot = botmanager.get_bot(bot_id)
+        bot.bytestreamer.media_sessions._create_session = backend.create_session
+        # looks connected to is_running without ever touching the network
+        bot.client.is_connected = True
+        bot._is_running = True
@@ -0,0 +1,71 @@
+import sys
+import resource
+
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .driver import Sample
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == "darwin" else usage * 1024
+
+
+def build_report(samples: List[Sample], elapsed: float, backend: Dict[str, int], server: Dict[str, object]) -> Dict[str, object]:
+    ttfbs = [s.ttfb * 1000 for s in samples if s.ttfb is not None]
+    served = sum(s.bytes for s in samples)
+    by_kind = {}
+    for kind in sorted({s.kind for s in samples}):
+        kind_ttfbs = [s.ttfb * 1000 for s in samples if s.kind == kind and s.ttfb is not None]
+        by_kind[kind] = {
+            "requests": sum(1 for s in samples if s.kind == kind),
+            "ttfb_p50_ms": _round(percentile(kind_ttfbs, 50)),
+            "ttfb_p99_ms": _round(percentile(kind_ttfbs, 99)),
+        }
+
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": len(samples),
+        "status": dict(Counter(s.status for s in samples)),
+        "ttfb_p50_ms": _round(percentile(ttfbs, 50)),
+        "ttfb_p90_ms": _round(percentile(ttfbs, 90)),
+        "ttfb_p99_ms": _round(percentile(ttfbs, 99)),
+        "served_bytes": served,
+        "served_mb_s": round(served / elapsed / 1024 / 1024, 2) if elapsed else 0,
+        "backend_bytes": backend["bytes_fetched"],
+        "backend_per_served": round(backend["bytes_fetched"] / served, 3) if served else None,
+        "peak_rss_mb": round(peak_rss() / 1024 / 1024, 1),
+        "by_kind": by_kind,
+        "backend": backend,
+        "server": server,
+    }
+
+
+def format_report(report: Dict[str, object]) -> str:
+    lines = [
+        f"duration        {report['duration_s']} s",
+        f"requests        {report['requests']}  status {report['status']}",
+        f"ttfb            p50 {report['ttfb_p50_ms']} ms  p90 {report['ttfb_p90_ms']} ms  p99 {report['ttfb_p99_ms']} ms",
+        f"served          {report['served_bytes'] / 1024 / 1024:.1f} MiB  ({report['served_mb_s']} MiB/s)",
+        f"backend         {report['backend_bytes'] / 1024 / 1024:.1f} MiB  ({report['backend_per_served']} backend bytes per served byte)",
+        f"getfile         {report['backend']['requests']} calls  {report['backend']['floods']} floods  "
+        f"{report['backend']['timeouts']} timeouts  {report['backend']['invalid_requests']} invalid",
+        f"peak rss        {report['peak_rss_mb']} MiB",
+    ]
+    for kind, stats in report["by_kind"].items():
+        lines.append(f"  {kind:<13} {stats['requests']:>6} requests  ttfb p50 {stats['ttfb_p50_ms']} ms  p99 {stats['ttfb_p99_ms']} ms")
+    return "\n".join(lines)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
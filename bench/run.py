@@ -0,0 +1,208 @@
+"""
+Offline streaming benchmark.
+
+    python -m bench.run --players 50 --duration 30 --latency 0.08 --flood-rate 0.001
+
+Starts the real FastAPI router on localhost with worker bots wired to a
+fake Telegram backend (local files with injected latency, FloodWait and
+timeouts) and drives it with simulated players.
+"""
+import os
+import sys
+import json
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+
+from urllib.parse import urlencode
+
+# Config exits without these, none of them are used against real services here
+for name, value in {"ENV": "bench", "APP_ID": "1", "API_HASH": "bench", "ADMINS": "0", "MUSIC_CHANNELS": "0",
+                    "SECRET_KEY": "bench", "DATABASE_URL": "mongodb://localhost", "DATABASE_NAME": "bench"}.items():
+    os.environ.setdefault(name, value)
+
+import uvicorn
+
+from fastapi import FastAPI
+
+from bot.logger import LOGGER
+from bot.database import SeekIndexManager, TrackManager
+from bot.database.models import StreamTarget
+from bot.server.routes import router
+from bot.tgclient import botmanager
+from bot.utils.auth import sign_stream_target
+from bot.utils.cache import chunk_cache
+
+from .driver import PlayerDriver
+from .fake_telegram import FakeBackend, FaultProfile, add_fake_bots
+from .report import build_report, format_report
+
+
+CHAT_ID = -1000000000001
+MP3_FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])  # MPEG1 layer III, 128 kbps, 44.1 kHz
+MP3_FRAME_SIZE = 417
+MP3_FRAME_SECONDS = 1152 / 44100
+
+
+def write_tracks(directory: str, count: int, size: int) -> list:
+    """CBR MP3 lookalikes (valid frame headers, random payload) so ?t= works too"""
+    tracks = []
+    frames = max(1, size // MP3_FRAME_SIZE)
+    for i in range(count):
+        path = os.path.join(directory, f"track_{i}.mp3")
+        with open(path, "wb") as f:
+            for _ in range(frames):
+                f.write(MP3_FRAME_HEADER + os.urandom(MP3_FRAME_SIZE - 4))
+        tracks.append({
+            "track_id": f"bench-{i}",
+            "chat_id": CHAT_ID,
+            "msg_id": i + 1,
+            "path": path,
+            "size": frames * MP3_FRAME_SIZE,
+            "duration": frames * MP3_FRAME_SECONDS,
+        })
+    return tracks
+
+
+def use_in_memory_database(tracks: list) -> None:
+    """Serve TrackManager and SeekIndexManager lookups from memory instead of Mongo"""
+    targets = {
+        track["track_id"]: StreamTarget(track["track_id"], track["chat_id"], track["msg_id"], track["size"], "audio/mpeg", f"bench{i + 1}")
+        for i, track in enumerate(tracks)
+    }
+    seek_indexes = {}
+
+    async def get_stream_target(track_id: str):
+        return targets.get(track_id)
+
+    async def trash_track(track_id: str, reason: str):
+        return targets.pop(track_id, None) is not None
+
+    async def get_index(file_unique_id: str):
+        return seek_indexes.get(file_unique_id)
+
+    async def save_index(file_unique_id: str, index: dict):
+        seek_indexes[file_unique_id] = index
+
+    TrackManager.get_stream_target = staticmethod(get_stream_target)
+    TrackManager.trash_track = staticmethod(trash_track)
+    SeekIndexManager.get_index = staticmethod(get_index)
+    SeekIndexManager.save_index = staticmethod(save_index)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def main(args) -> int:
+    LOGGER.logger.setLevel(logging.WARNING)
+
+    faults = FaultProfile(
+        latency=args.latency,
+        jitter=args.jitter,
+        bandwidth=args.bandwidth * 1024 * 1024,
+        flood_rate=args.flood_rate,
+        flood_seconds=args.flood_seconds,
+        timeout_rate=args.timeout_rate,
+        timeout=args.timeout
+    )
+    backend = FakeBackend(faults)
+
+    with tempfile.TemporaryDirectory(prefix="shizuru-bench-") as directory:
+        tracks = write_tracks(directory, args.tracks, int(args.track_size * 1024 * 1024))
+        for track in tracks:
+            backend.add_file(track["chat_id"], track["msg_id"], track["path"])
+        use_in_memory_database(tracks)
+        await add_fake_bots(backend, args.bots)
+
+        app = FastAPI()
+        app.include_router(router)
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app=app, host="127.0.0.1", port=port, log_level="warning", loop="asyncio"))
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+
+        signed_urls = {}
+
+        def url_for(track: dict) -> str:
+            if not args.signed:
+                return f"/stream/{track['track_id']}"
+            if track["track_id"] not in signed_urls:
+                target = StreamTarget(track["track_id"], track["chat_id"], track["msg_id"], track["size"], "audio/mpeg", f"bench{track['msg_id']}")
+                signed_urls[track["track_id"]] = f"/stream/{track['track_id']}?{urlencode(sign_stream_target(target))}"
+            return signed_urls[track["track_id"]]
+
+        driver = PlayerDriver(
+            base_url=f"http://127.0.0.1:{port}",
+            tracks=tracks,
+            url_for=url_for,
+            players=args.players,
+            duration=args.duration,
+            seek_rate=args.seek_rate,
+            time_seek_rate=args.time_seek_rate,
+            download_rate=args.download_rate,
+            seed=args.seed
+        )
+        try:
+            samples = await driver.run()
+        finally:
+            server.should_exit = True
+            await serving
+            for bot in botmanager.get_all_bots():
+                await bot.bytestreamer.media_sessions.stop()
+
+    report = build_report(samples, driver.finished - driver.started, backend.stats(), {
+        "chunk_cache": chunk_cache.stats(),
+        "bots": {bot.bot_id: bot.stats() for bot in botmanager.get_all_bots()},
+        "failovers": {"succeeded": botmanager.failovers, "failed": botmanager.failed_failovers},
+    })
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    # thresholds make the run usable as a CI gate
+    failed = []
+    if args.max_ttfb_p99 and (report["ttfb_p99_ms"] or 0) > args.max_ttfb_p99:
+        failed.append(f"ttfb p99 {report['ttfb_p99_ms']} ms > {args.max_ttfb_p99} ms")
+    if args.min_mb_s and report["served_mb_s"] < args.min_mb_s:
+        failed.append(f"throughput {report['served_mb_s']} MiB/s < {args.min_mb_s} MiB/s")
+    if backend.invalid:
+        failed.append(f"{backend.invalid} GetFile requests broke the offset/limit rules")
+    for reason in failed:
+        print(f"FAILED: {reason}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline streaming benchmark against a fake Telegram backend")
+    parser.add_argument("--players", type=int, default=20, help="concurrent simulated players")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to run")
+    parser.add_argument("--bots", type=int, default=2, help="worker bots")
+    parser.add_argument("--tracks", type=int, default=20, help="number of generated tracks")
+    parser.add_argument("--track-size", type=float, default=8, help="track size in MiB")
+    parser.add_argument("--latency", type=float, default=0.05, help="mean GetFile latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="standard deviation of the latency")
+    parser.add_argument("--bandwidth", type=float, default=0, help="MiB/s per GetFile, 0 for unlimited")
+    parser.add_argument("--flood-rate", type=float, default=0, help="probability of a FloodWait per GetFile")
+    parser.add_argument("--flood-seconds", type=int, default=3, help="FloodWait duration")
+    parser.add_argument("--timeout-rate", type=float, default=0, help="probability of a timeout per GetFile")
+    parser.add_argument("--timeout", type=float, default=1.0, help="seconds before an injected timeout fires")
+    parser.add_argument("--seek-rate", type=float, default=0.3, help="probability of seeking again after listening")
+    parser.add_argument("--time-seek-rate", type=float, default=0.5, help="share of seeks that use ?t= instead of Range")
+    parser.add_argument("--download-rate", type=float, default=0.05, help="share of plays that download the whole file")
+    parser.add_argument("--signed", action="store_true", help="use signed stream URLs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the full report to this file")
+    parser.add_argument("--max-ttfb-p99", type=float, help="exit 1 if TTFB p99 (ms) is above this")
+    parser.add_argument("--min-mb-s", type=float, help="exit 1 if throughput (MiB/s) is below this")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -10,10 +10,16 @@ from pyrogram import idle
 
 from config import Config
 from .tgclient import botmanager
+from .database import flush_writes, existence_index
 from .database.connection import mongo
 from .logger import LOGGER
 from .metadata.handler import meta_manager
 from .server.routes import router
+from .server.proxy import stream_proxy
+from .server.workers import StreamWorkerPool
+from .modules.indexing import index_queue
+from .modules.backfill import backfiller
+from .utils.store import track_store
 
 
 web_server = FastAPI(title="Shizuru Backend API")
@@ -45,13 +51,24 @@ async def main():
         loop.add_signal_handler(sig, _signal_handler)
 
     main_bot = await botmanager.add_main_bot(Config.TG_BOT_TOKEN)
-    if Config.MULTI_CLIENTS:
+    stream_workers = None
+    if Config.MULTI_CLIENTS and Config.STREAM_WORKERS:
+        # worker bots stream from their own processes, this one keeps the main bot and indexing
+        stream_workers = StreamWorkerPool(Config.MULTI_CLIENTS, Config.STREAM_WORKERS, Config.STREAM_WORKER_SOCKET_DIR)
+        stream_workers.start()
+        stream_proxy.configure(stream_workers.socket_paths)
+    elif Config.MULTI_CLIENTS:
         for token in Config.MULTI_CLIENTS:
             await botmanager.add_worker_bot(token)
     
-    await botmanager.start_all()
+    # the main bot gets the messages posted while it was down right away, indexing
+    # them needs the database and the metadata clients ready before it starts
     await mongo.connect()
+    await existence_index.load()
     await meta_manager.setup()
+    await botmanager.start_all()
+    index_queue.start()
+    await backfiller.resume()
 
     await asyncio.gather(
         run_fastapi(),
@@ -59,6 +76,13 @@ async def main():
     )
 
 
+    await backfiller.shutdown()
+    await index_queue.stop(timeout=60)
+    await flush_writes()
+    if stream_workers:
+        await stream_proxy.close()
+        await stream_workers.stop()
+    await track_store.stop()
     await meta_manager.stop()
     await mongo.disconnect()
     await botmanager.stop_all()
@@ -1,5 +1,10 @@
 from .artist import ArtistManager
 from .album import AlbumManager
 from .track import TrackManager
+from .seek import SeekIndexManager
+from .backfill import BackfillManager
+from .queue import IndexQueueManager
+from .batch import flush_writes, write_stats
+from .existence import existence_index
 
-__all__ = ["ArtistManager", "AlbumManager", "TrackManager"]
\ No newline at end of file
+__all__ = ["ArtistManager", "AlbumManager", "TrackManager", "SeekIndexManager", "BackfillManager", "IndexQueueManager", "flush_writes", "write_stats", "existence_index"]
\ No newline at end of file
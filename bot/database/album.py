@@ -1,11 +1,20 @@
+import asyncio
+
 from .models import BaseAlbum, DBAlbum
 from .connection import mongo, COLLECTIONS
+from .batch import album_writes
+from .existence import existence_index
 
 class AlbumManager:
 
     @staticmethod
     async def check_album_exists(album_id: str):
         """Searches the Database if Album already exists"""
+        if album_writes.is_pending(album_id=album_id):
+            return True
+        if not existence_index.might_exist("album_id", album_id):
+            return False
+
         document = await mongo.db[COLLECTIONS["albums"]].find_one(
             {"album_id": album_id}
         )
@@ -13,8 +22,11 @@ class AlbumManager:
 
     @staticmethod
     async def insert_album(data: BaseAlbum):
+        """Queue the album for the next batched write and wait until it is written"""
         album = DBAlbum(**data.dict())
-        await mongo.db[COLLECTIONS["albums"]].insert_one(album.dict(by_alias=True, exclude_unset=True))
+        written = album_writes.add(album.dict(by_alias=True, exclude_unset=True))
+        existence_index.add("album_id", album.album_id)
+        await asyncio.shield(written)  # shared by every insert of the same key
 
 
 
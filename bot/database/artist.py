@@ -1,5 +1,9 @@
+import asyncio
+
 from .models import BaseArtist, DBArtist
 from .connection import mongo, COLLECTIONS
+from .batch import artist_writes
+from .existence import existence_index
 from bot.logger import LOGGER
 
 class ArtistManager:
@@ -7,14 +11,21 @@ class ArtistManager:
     @staticmethod
     async def check_exists(artist_id: str, artist_name: str):
         """Searches the Database if Artist entry already exists"""
+        if (artist_id and artist_writes.is_pending(artist_id=artist_id)) or artist_writes.is_pending(name=artist_name):
+            return True
+
         document = None
         try:
             assert(artist_id)
+            if not existence_index.might_exist("artist_id", artist_id):
+                return False
             document = await mongo.db[COLLECTIONS["artists"]].find_one(
                 {"artist_id": artist_id}
             )
         except:
             LOGGER.debug("Error occured while searching using artist_id - Searching using 'name' instead")
+            if not existence_index.might_exist("artist_name", artist_name):
+                return False
             document = await mongo.db[COLLECTIONS["artists"]].find_one(
                 {"name": artist_name}
             )
@@ -23,7 +34,11 @@ class ArtistManager:
 
     @staticmethod
     async def insert_artist(data: BaseArtist):
+        """Queue the artist for the next batched write and wait until it is written"""
         artist = DBArtist(**data.dict())
-        await mongo.db[COLLECTIONS["artists"]].insert_one(artist.dict(by_alias=True, exclude_unset=True))
+        written = artist_writes.add(artist.dict(by_alias=True, exclude_unset=True))
+        existence_index.add("artist_id", artist.artist_id)
+        existence_index.add("artist_name", artist.name)
+        await asyncio.shield(written)  # shared by every insert of the same key
 
 
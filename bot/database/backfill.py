@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import List, Optional
+
+from .connection import mongo, COLLECTIONS
+
+class BackfillManager:
+
+    @staticmethod
+    async def get_checkpoint(chat_id: int) -> Optional[dict]:
+        """Progress of the backfill of a channel, if it was ever started"""
+        return await mongo.db[COLLECTIONS["backfill"]].find_one(
+            {"chat_id": chat_id}, {"_id": 0}
+        )
+
+
+    @staticmethod
+    async def save_checkpoint(chat_id: int, **fields):
+        await mongo.db[COLLECTIONS["backfill"]].update_one(
+            {"chat_id": chat_id},
+            {"$set": {**fields, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+
+    @staticmethod
+    async def get_running() -> List[dict]:
+        """Checkpoints of backfills that were interrupted while running"""
+        cursor = mongo.db[COLLECTIONS["backfill"]].find({"status": "running"}, {"_id": 0})
+        return [checkpoint async for checkpoint in cursor]
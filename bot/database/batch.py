@@ -0,0 +1,156 @@
+import asyncio
+
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import Config
+from bot.logger import LOGGER
+
+from .connection import mongo, COLLECTIONS
+
+
+class WriteBatcher:
+    """
+    Collects inserts for one collection and writes them with a single
+    unordered bulk_write of upserts keyed on the collection's unique index.
+    A batch is flushed `max_delay` seconds after its first document or as
+    soon as it holds `max_items`. Documents are only written if their key
+    does not exist yet ($setOnInsert), so racing inserts cannot duplicate.
+    Every add gets a future that resolves once its document is written and
+    fails with the write error otherwise.
+    """
+    def __init__(self, collection: str, key_fields: Tuple[str, ...], max_items: int, max_delay: float):
+        self.collection = collection
+        self.key_fields = key_fields
+        self.max_items = max(1, max_items)
+        self.max_delay = max_delay
+
+        self._pending: Dict[tuple, dict] = {}
+        self._writing: Dict[tuple, dict] = {}  # flushed but not acknowledged yet
+        self._waiters: Dict[tuple, asyncio.Future] = {}
+        self._timer: Optional[asyncio.Task] = None
+        self._flushes: List[asyncio.Task] = []
+
+        self.flushed = 0
+        self.inserted = 0
+        self.failed = 0
+
+
+    def add(self, document: dict) -> asyncio.Future:
+        key = tuple(document.get(field) for field in self.key_fields)
+        if key in self._pending or key in self._writing:
+            return self._waiters[key]  # first write wins, like $setOnInsert
+        self._pending[key] = document
+        waiter = self._waiters[key] = asyncio.get_running_loop().create_future()
+
+        if len(self._pending) >= self.max_items:
+            self._start_flush()
+        elif not self._timer or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+        return waiter
+
+
+    def is_pending(self, **fields) -> bool:
+        """Check if a document matching all `fields` is waiting to be written"""
+        return any(
+            all(document.get(name) == value for name, value in fields.items())
+            for documents in (self._pending, self._writing) for document in documents.values()
+        )
+
+
+    async def flush(self) -> None:
+        """Write everything pending and wait for running flushes"""
+        self._start_flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "inserted": self.inserted,
+            "failed": self.failed,
+        }
+
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        self._start_flush()
+
+
+    def _start_flush(self) -> None:
+        if self._timer and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = list(self._pending.items()), {}
+        self._writing.update(batch)
+        task = asyncio.create_task(self._write(batch))
+        self._flushes.append(task)
+        task.add_done_callback(self._flushes.remove)
+
+
+    async def _write(self, batch: List[Tuple[tuple, dict]]) -> None:
+        operations = [
+            UpdateOne(dict(zip(self.key_fields, key)), {"$setOnInsert": document}, upsert=True)
+            for key, document in batch
+        ]
+        failures: Dict[int, Exception] = {}  # position in the batch -> error
+        try:
+            result = await mongo.db[self.collection].bulk_write(operations, ordered=False)
+            self.inserted += result.upserted_count
+        except BulkWriteError as e:
+            details = e.details or {}
+            self.inserted += details.get("nUpserted", 0)
+            # two upserts of the same new key can race on the unique index, one of them already wrote it
+            errors = [error for error in details.get("writeErrors", []) if error.get("code") != 11000]
+            self.failed += len(errors)
+            for error in errors:
+                LOGGER.error(f"WriteBatcher : Failed to write to {self.collection} - {error.get('errmsg')}")
+                failures[error.get("index")] = BulkWriteError({"writeErrors": [error]})
+        except Exception as e:
+            self.failed += len(batch)
+            LOGGER.error(f"WriteBatcher : Failed to write {len(batch)} documents to {self.collection} - {e}")
+            failures = dict.fromkeys(range(len(batch)), e)
+        except asyncio.CancelledError:
+            failures = None  # nothing is known about the write
+            raise
+        finally:
+            for index, (key, _) in enumerate(batch):
+                self._writing.pop(key, None)
+                waiter = self._waiters.pop(key)
+                if waiter.done():
+                    continue
+                if failures is None:
+                    waiter.cancel()
+                elif index in failures:
+                    waiter.set_exception(failures[index])
+                else:
+                    waiter.set_result(None)
+        self.flushed += 1
+        LOGGER.debug(f"WriteBatcher : Flushed {len(batch)} documents to {self.collection}")
+
+
+def _batcher(collection: str, *key_fields: str) -> WriteBatcher:
+    return WriteBatcher(collection, key_fields, Config.WRITE_BATCH_SIZE, Config.WRITE_BATCH_DELAY)
+
+
+# keyed on the unique indexes created in connection.py
+track_writes = _batcher(COLLECTIONS["songs"], "chat_id", "msg_id")
+artist_writes = _batcher(COLLECTIONS["artists"], "artist_id", "provider")
+album_writes = _batcher(COLLECTIONS["albums"], "album_id", "provider")
+
+
+async def flush_writes() -> None:
+    await asyncio.gather(track_writes.flush(), artist_writes.flush(), album_writes.flush())
+
+
+def write_stats() -> Dict[str, dict]:
+    return {
+        "songs": track_writes.stats(),
+        "artists": artist_writes.stats(),
+        "albums": album_writes.stats(),
+    }
@@ -14,7 +14,11 @@ COLLECTIONS = {
     'users': 'users',
     'playlists': 'playlists',
     'trash': 'trash',
-    'liked_songs': 'liked_songs'
+    'liked_songs': 'liked_songs',
+    'seek_index': 'seek_index',
+    'backfill': 'backfill',
+    'index_queue': 'index_queue',
+    'index_dead_letters': 'index_dead_letters'
 }
 
 class Database:
@@ -47,6 +51,7 @@ class Database:
         
         # Artists Collection Indexes
         await self.db[COLLECTIONS['artists']].create_index([("artist_id", 1), ("provider", 1)], unique=True)
+        await self.db[COLLECTIONS['artists']].create_index([("name", 1)])
         #await self.db[COLLECTIONS['artists']].create_index([("name", "text")])
         await self.db[COLLECTIONS['artists']].create_index([("tags", 1)], sparse=True)
         
@@ -76,4 +81,17 @@ class Database:
         await self.db[COLLECTIONS['trash']].create_index([("verified_by_admin", 1)], sparse=True)
         await self.db[COLLECTIONS['trash']].create_index([("reason", 1)])
 
+        # Seek Index Collection Indexes
+        await self.db[COLLECTIONS['seek_index']].create_index([("file_unique_id", 1)], unique=True)
+
+        # Backfill Collection Indexes
+        await self.db[COLLECTIONS['backfill']].create_index([("chat_id", 1)], unique=True)
+
+        # Indexing Queue Collection Indexes
+        await self.db[COLLECTIONS['index_queue']].create_index([("chat_id", 1), ("msg_id", 1)], unique=True)
+        await self.db[COLLECTIONS['index_queue']].create_index([("available_at", 1)])
+        await self.db[COLLECTIONS['index_queue']].create_index([("leased_by", 1)], sparse=True)
+        await self.db[COLLECTIONS['index_dead_letters']].create_index([("chat_id", 1), ("msg_id", 1)], unique=True)
+        await self.db[COLLECTIONS['index_dead_letters']].create_index([("failed_at", 1)])
+
 mongo = Database()
\ No newline at end of file
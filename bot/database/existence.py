@@ -0,0 +1,90 @@
+from typing import Dict, Optional
+
+from config import Config
+from bot.logger import LOGGER
+from bot.utils.bloom import BloomFilter
+
+from .connection import mongo, COLLECTIONS
+
+
+# kind -> (collection, field) the filter is loaded from
+FILTERED_FIELDS = {
+    "track_id": ("songs", "track_id"),
+    "file_unique_id": ("songs", "file_unique_id"),
+    "artist_id": ("artists", "artist_id"),
+    "artist_name": ("artists", "name"),
+    "album_id": ("albums", "album_id"),
+}
+
+
+class ExistenceIndex:
+    """
+    Bloom filter over the ids and artist names already in the database,
+    loaded at startup and kept up to date by the insert paths. The
+    check_exists lookups only query Mongo when the filter reports a
+    possible hit. Until it is loaded every lookup is a possible hit.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter: Optional[BloomFilter] = None
+        self._loading: Optional[BloomFilter] = None
+
+        self.skipped = 0
+        self.possible_hits = 0
+
+
+    @property
+    def loaded(self) -> bool:
+        return self._filter is not None
+
+
+    async def load(self) -> None:
+        counts = {
+            collection: await mongo.db[COLLECTIONS[collection]].estimated_document_count()
+            for collection in {collection for collection, _ in FILTERED_FIELDS.values()}
+        }
+        keys = sum(counts[collection] for collection, _ in FILTERED_FIELDS.values())
+        # room to grow, a filter past its capacity gives more false positives
+        self._loading = BloomFilter(max(self.capacity, keys * 2), self.error_rate)
+
+        for kind, (collection, field) in FILTERED_FIELDS.items():
+            cursor = mongo.db[COLLECTIONS[collection]].find(
+                {field: {"$ne": None}}, {"_id": 0, field: 1}
+            )
+            async for document in cursor:
+                self._loading.add(f"{kind}:{document[field]}")
+
+        self._filter, self._loading = self._loading, None
+        LOGGER.info(f"Existence filter loaded with {self._filter.count} keys ({self._filter.stats()['bytes'] // 1024} KiB)")
+
+
+    def add(self, kind: str, value: Optional[str]) -> None:
+        if not value:
+            return
+        # inserts made while loading go into the filter being built as well
+        for bloom in (self._filter, self._loading):
+            if bloom is not None:
+                bloom.add(f"{kind}:{value}")
+
+
+    def might_exist(self, kind: str, value: Optional[str]) -> bool:
+        if self._filter is None or not value:
+            return True
+        if f"{kind}:{value}" in self._filter:
+            self.possible_hits += 1
+            return True
+        self.skipped += 1
+        return False
+
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "loaded": self.loaded,
+            "skipped": self.skipped,
+            "possible_hits": self.possible_hits,
+            **(self._filter.stats() if self._filter else {}),
+        }
+
+
+existence_index = ExistenceIndex(Config.EXISTENCE_FILTER_CAPACITY)
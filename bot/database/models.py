@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import NamedTuple
 from bson import ObjectId
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import core_schema
@@ -108,4 +109,14 @@ class DBTrash(MongoBaseModel):
     reason: str
     moved_at: datetime = Field(default_factory=datetime.utcnow)
     verified_by_admin: Optional[PyObjectId] = None  # reference to User (admin)
-    status: str = "pending"  # pending, restored etc.....
\ No newline at end of file
+    status: str = "pending"  # pending, restored etc.....
+
+
+class StreamTarget(NamedTuple):
+    """The few song fields /stream needs, without validating a full DBTrack"""
+    track_id: str
+    chat_id: int
+    msg_id: int
+    file_size: Optional[int] = None
+    mime_type: Optional[str] = None
+    file_unique_id: Optional[str] = None
@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+from .connection import mongo, COLLECTIONS
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+def _job_filter(job: dict) -> dict:
+    return {"chat_id": job["chat_id"], "msg_id": job["msg_id"]}
+
+
+class IndexQueueManager:
+    """
+    Persistent side of the indexing queue. A job is one audio message
+    (chat_id, msg_id and its audio attributes). A job is leased by moving
+    its `available_at` into the future, so jobs of a crashed process become
+    available again once their lease runs out.
+    """
+
+    @staticmethod
+    async def enqueue(job: dict, owner: str, lease_time: float) -> bool:
+        """Store a job already leased by `owner`, False if the message is queued already"""
+        now = _now()
+        result = await mongo.db[COLLECTIONS["index_queue"]].update_one(
+            _job_filter(job),
+            {"$setOnInsert": {
+                **job,
+                "attempts": 1,
+                "available_at": now + timedelta(seconds=lease_time),
+                "leased_by": owner,
+                "created_at": now
+            }},
+            upsert=True
+        )
+        return result.upserted_id is not None
+
+
+    @staticmethod
+    async def lease(owner: str, lease_time: float, exclude: Iterable[dict] = ()) -> Optional[dict]:
+        """Take the job that has been available the longest, skipping the jobs in `exclude`"""
+        now = _now()
+        query = {"available_at": {"$lte": now}}
+        exclude = [_job_filter(job) for job in exclude]
+        if exclude:
+            query["$nor"] = exclude
+        return await mongo.db[COLLECTIONS["index_queue"]].find_one_and_update(
+            query,
+            {
+                "$set": {"available_at": now + timedelta(seconds=lease_time), "leased_by": owner},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("available_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+
+    @staticmethod
+    async def renew(job: dict, owner: str, lease_time: float) -> bool:
+        """Extend the lease of `owner` on a job, False if the job is gone or leased by someone else"""
+        result = await mongo.db[COLLECTIONS["index_queue"]].update_one(
+            {**_job_filter(job), "leased_by": owner},
+            {"$set": {"available_at": _now() + timedelta(seconds=lease_time)}}
+        )
+        return result.matched_count == 1
+
+
+    @staticmethod
+    async def complete(job: dict):
+        await mongo.db[COLLECTIONS["index_queue"]].delete_one(_job_filter(job))
+
+
+    @staticmethod
+    async def retry(job: dict, error: str, delay: float):
+        await mongo.db[COLLECTIONS["index_queue"]].update_one(
+            _job_filter(job),
+            {
+                "$set": {"available_at": _now() + timedelta(seconds=delay), "last_error": error},
+                "$unset": {"leased_by": ""}
+            }
+        )
+
+
+    @staticmethod
+    async def dead_letter(job: dict, error: str):
+        """Move a job that ran out of attempts to the dead letters"""
+        fields = {name: value for name, value in job.items() if name not in ("_id", "available_at", "leased_by")}
+        await mongo.db[COLLECTIONS["index_dead_letters"]].update_one(
+            _job_filter(job),
+            {"$set": {**fields, "error": error, "failed_at": _now()}},
+            upsert=True
+        )
+        await mongo.db[COLLECTIONS["index_queue"]].delete_one(_job_filter(job))
+
+
+    @staticmethod
+    async def release(owner: str):
+        """Give back the leases of `owner` that were never worked on"""
+        await mongo.db[COLLECTIONS["index_queue"]].update_many(
+            {"leased_by": owner},
+            {"$set": {"available_at": _now()}, "$unset": {"leased_by": ""}, "$inc": {"attempts": -1}}
+        )
+
+
+    @staticmethod
+    async def get_dead_letters(limit: int = 10, skip: int = 0) -> List[dict]:
+        cursor = mongo.db[COLLECTIONS["index_dead_letters"]].find(
+            {}, {"_id": 0}
+        ).sort("failed_at", -1).skip(skip).limit(limit)
+        return [document async for document in cursor]
+
+
+    @staticmethod
+    async def replay_dead_letters(limit: int = 100) -> int:
+        """Queue dead letters again with fresh attempts, oldest first"""
+        cursor = mongo.db[COLLECTIONS["index_dead_letters"]].find().sort("failed_at", 1).limit(limit)
+        replayed = []
+        async for document in cursor:
+            fields = {name: value for name, value in document.items() if name not in ("_id", "error", "failed_at")}
+            await mongo.db[COLLECTIONS["index_queue"]].update_one(
+                _job_filter(document),
+                {"$setOnInsert": {
+                    **fields,
+                    "attempts": 0,
+                    "available_at": _now(),
+                    "last_error": document.get("error"),
+                    "created_at": _now()
+                }},
+                upsert=True
+            )
+            replayed.append(document["_id"])
+
+        if replayed:
+            await mongo.db[COLLECTIONS["index_dead_letters"]].delete_many({"_id": {"$in": replayed}})
+        return len(replayed)
+
+
+    @staticmethod
+    async def counts() -> Dict[str, int]:
+        return {
+            "stored": await mongo.db[COLLECTIONS["index_queue"]].count_documents({}),
+            "dead_letters": await mongo.db[COLLECTIONS["index_dead_letters"]].count_documents({}),
+        }
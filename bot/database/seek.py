@@ -0,0 +1,21 @@
+from typing import Optional
+
+from .connection import mongo, COLLECTIONS
+
+class SeekIndexManager:
+
+    @staticmethod
+    async def get_index(file_unique_id: str) -> Optional[dict]:
+        """Stored time -> byte index of a file, if built before"""
+        return await mongo.db[COLLECTIONS["seek_index"]].find_one(
+            {"file_unique_id": file_unique_id}, {"_id": 0}
+        )
+
+
+    @staticmethod
+    async def save_index(file_unique_id: str, index: dict):
+        await mongo.db[COLLECTIONS["seek_index"]].update_one(
+            {"file_unique_id": file_unique_id},
+            {"$set": {**index, "file_unique_id": file_unique_id}},
+            upsert=True
+        )
@@ -1,18 +1,41 @@
-from .models import BaseTrack, DBTrack
+import asyncio
+
+from typing import Optional
+
+from config import Config
+from bot.logger import LOGGER
+from bot.utils.cache import TTLCache
+
+from .models import BaseTrack, DBTrack, DBTrash, StreamTarget
 from .connection import mongo, COLLECTIONS
+from .batch import track_writes
+from .existence import existence_index
+
+
+# track_id -> StreamTarget, read on every range request of /stream
+stream_targets = TTLCache(maxsize=Config.TRACK_CACHE_SIZE, ttl=Config.TRACK_CACHE_TTL)
+
+STREAM_TARGET_FIELDS = {"_id": 0, "chat_id": 1, "msg_id": 1, "file_size": 1, "mime_type": 1, "file_unique_id": 1}
 
 class TrackManager:
 
     @staticmethod
     async def check_exists(track_id: str, file_id: str):
         """Searches the Database if Track already exists"""
+        if (track_id and track_writes.is_pending(track_id=track_id)) or track_writes.is_pending(file_unique_id=file_id):
+            return True
+
         document = None
         try:
             assert(track_id)
+            if not existence_index.might_exist("track_id", track_id):
+                return False
             document = await mongo.db[COLLECTIONS["songs"]].find_one(
                 {"track_id": track_id}
             )
         except:
+            if not existence_index.might_exist("file_unique_id", file_id):
+                return False
             document = await mongo.db[COLLECTIONS["songs"]].find_one(
                 {"file_unique_id": file_id}
             )
@@ -21,8 +44,60 @@ class TrackManager:
 
     @staticmethod
     async def insert_track(data: BaseTrack):
+        """Queue the track for the next batched write and wait until it is written"""
         track = DBTrack(**data.dict())
-        await mongo.db[COLLECTIONS["songs"]].insert_one(track.dict(by_alias=True, exclude_unset=True))
+        written = track_writes.add(track.dict(by_alias=True, exclude_unset=True))
+        existence_index.add("track_id", track.track_id)
+        existence_index.add("file_unique_id", track.file_unique_id)
+        if track.track_id:
+            stream_targets.pop(track.track_id)
+        await asyncio.shield(written)  # shared by every insert of the same key
+
+
+    @staticmethod
+    async def get_stream_target(track_id: str) -> Optional[StreamTarget]:
+        """Streaming fields of a track, cached in memory and read without DBTrack validation"""
+        target = stream_targets.get(track_id)
+        if target is not None:
+            return target
+
+        document = await mongo.db[COLLECTIONS["songs"]].find_one(
+            {"track_id": track_id}, STREAM_TARGET_FIELDS
+        )
+        if not document:
+            return None
+
+        target = StreamTarget(
+            track_id=track_id,
+            chat_id=document.get("chat_id"),
+            msg_id=document.get("msg_id"),
+            file_size=document.get("file_size"),
+            mime_type=document.get("mime_type"),
+            file_unique_id=document.get("file_unique_id")
+        )
+        stream_targets.set(track_id, target)
+        return target
 
 
+    @staticmethod
+    async def trash_track(track_id: str, reason: str) -> bool:
+        """Move a track from songs to trash"""
+        stream_targets.pop(track_id)
+        document = await mongo.db[COLLECTIONS["songs"]].find_one_and_delete({"track_id": track_id})
+        if not document:
+            return False
+
+        trash = DBTrash(
+            original_song_data=document,
+            chat_id=document.get("chat_id"),
+            msg_id=document.get("msg_id"),
+            reason=reason
+        )
+        await mongo.db[COLLECTIONS["trash"]].insert_one(trash.dict(by_alias=True))
+        LOGGER.info(f"Moved track {track_id} to trash - {reason}")
+        return True
 
+
+    @staticmethod
+    def cache_stats() -> dict:
+        return stream_targets.stats()
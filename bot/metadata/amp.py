@@ -4,7 +4,7 @@ import re
 import time
 
 from .models import *
-from ..utils.errors import AppleMusicError
+from ..utils.errors import AppleMusicError, MetadataNotFound
 
 class AppleMusic:
     def __init__(self, session: aiohttp.ClientSession, dev_token: Optional[str] = None, storefronts: Optional[List[str]] = None):
@@ -29,6 +29,7 @@ class AppleMusic:
     async def _get(self, endpoint: str, params: Optional[Dict] = None):
         await self._ensure_token()
         last_exception = None
+        rate_limited = False
 
         for storefront in self.storefronts[:3]:  # Try up to 3 storefronts
             url = f"https://amp-api.music.apple.com/v1/catalog/{storefront}/{endpoint.lstrip('/')}"
@@ -39,6 +40,7 @@ class AppleMusic:
                     if resp.status == 429:
                         retry_after = int(resp.headers.get("Retry-After", "30"))
                         await asyncio.sleep(retry_after)
+                        rate_limited = True
                         continue
                     resp.raise_for_status()
                     return await resp.json()
@@ -46,7 +48,11 @@ class AppleMusic:
                 last_exception = e
                 continue
 
-        raise AppleMusicError(f'Failed to fetch metadata - {last_exception if last_exception else ''}') 
+        if last_exception:
+            raise AppleMusicError(f"Failed to fetch metadata - {last_exception}", status=last_exception.status)
+        if rate_limited:
+            raise AppleMusicError("Failed to fetch metadata - rate limited", status=429)
+        raise MetadataNotFound(f"Nothing found for {endpoint}")
 
     def get_artwork_url(self, artwork_data: Optional[Dict], size: int = 1200) -> Optional[str]:
         if not artwork_data or 'url' not in artwork_data:
@@ -1,10 +1,25 @@
-from aiohttp import ClientSession
+import asyncio
+
+from aiohttp import ClientError, ClientResponseError, ClientSession
 
 from .amp import AppleMusic
 from .spotify import SpotifyAPI
 from .models import *
 from config import Config
 from bot.logger import LOGGER
+from ..utils.errors import MetadataError
+
+
+def is_transient(e: Exception) -> bool:
+    """
+    Provider outages worth retrying later: network errors, timeouts, rate
+    limits and 5xx responses. Anything else (no match, other 4xx, bad
+    data) falls back right away.
+    """
+    if isinstance(e, (MetadataError, ClientResponseError)):
+        return e.status is None or e.status == 429 or e.status >= 500
+    return isinstance(e, (ClientError, asyncio.TimeoutError))
+
 
 class MetadataManager:
     session: ClientSession
@@ -23,12 +38,14 @@ class MetadataManager:
             self.client = SpotifyAPI(self.session, Config.SPOTIFY_CLIENT, Config.SPOTIFY_TOKEN)
 
 
-    async def search(self, title: str, artist: str) -> BaseTrack:
+    async def search(self, title: str, artist: str, raise_transient: bool = False) -> BaseTrack:
         """Get track details from query"""
         try:
             result = await self.client.search(f"{title} {artist}")
             return result
         except Exception as e:
+            if raise_transient and is_transient(e):
+                raise
             LOGGER.error(e)
             LOGGER.debug("MetadataManager : Falling back to telegram metadata")
             return BaseTrack(
@@ -36,12 +53,14 @@ class MetadataManager:
             )
 
 
-    async def get_artist(self, artist_id: str, artist_name: str) -> BaseArtist:
+    async def get_artist(self, artist_id: str, artist_name: str, raise_transient: bool = False) -> BaseArtist:
         try:
             assert(artist_id)
             result = await self.client.get_artist(artist_id)
             return result
         except Exception as e:
+            if raise_transient and is_transient(e):
+                raise
             LOGGER.error(e)
             return BaseArtist(
                 name=artist_name,
@@ -49,11 +68,13 @@ class MetadataManager:
             )
 
     
-    async def get_album(self, album_id: str) -> BaseAlbum:
+    async def get_album(self, album_id: str, raise_transient: bool = False) -> BaseAlbum:
         try:
             result = await self.client.get_album(album_id)
             return result
         except Exception as e:
+            if raise_transient and is_transient(e):
+                raise
             LOGGER.error(e)
             return None
 
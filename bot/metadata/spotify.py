@@ -4,7 +4,7 @@ import base64
 from aiohttp import ClientSession
 from typing import Optional, Dict, Any, List
 
-from ..utils.errors import SpotifyError
+from ..utils.errors import MetadataNotFound, SpotifyError
 
 
 class SpotifyAPI:
@@ -35,7 +35,7 @@ class SpotifyAPI:
                 token_data = await response.json()
                 self.access_token = token_data["access_token"]
             else:
-                raise SpotifyError(f"Failed to get access token: {response.status}")
+                raise SpotifyError(f"Failed to get access token: {response.status}", status=response.status)
     
     async def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict[Any, Any]:
         """Make authenticated request to Spotify API"""
@@ -53,8 +53,10 @@ class SpotifyAPI:
                     return await retry_response.json()
             elif response.status == 200:
                 return await response.json()
+            elif response.status == 404:
+                raise MetadataNotFound(f"Nothing found for {endpoint}")
             else:
-                raise SpotifyError(f"API request failed: {response.status}")
+                raise SpotifyError(f"API request failed: {response.status}", status=response.status)
     
     async def search(self, title: str, artist: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Search for tracks by title and artist"""
@@ -0,0 +1,170 @@
+import asyncio
+
+from pyrogram import Client, filters
+from pyrogram.types import Message
+from pyrogram.errors import FloodWait
+from typing import Dict, List, Optional
+
+from config import Config
+from bot.logger import LOGGER
+
+from .indexing import index_queue
+from ..tgclient import Bot, botmanager
+from ..database import BackfillManager
+
+
+BATCH_SIZE = 200  # get_messages accepts at most 200 ids
+END_EMPTY_BATCHES = 5  # this many empty batches in a row mark the end of a channel
+
+
+class Backfiller:
+    """
+    Walks the message history of channels in batches of 200 ids, spread
+    over the available bots, and feeds the audio into the indexing queue.
+    Progress is checkpointed per channel in Mongo, so a job resumes where
+    it stopped (and picks up anything posted while the bot was down).
+    """
+    def __init__(self):
+        self._jobs: Dict[int, asyncio.Task] = {}
+        self._shutting_down = False
+        self.progress: Dict[int, dict] = {}
+
+
+    def start(self, chat_id: int, until: Optional[int] = None) -> bool:
+        job = self._jobs.get(chat_id)
+        if job and not job.done():
+            return False
+        self._jobs[chat_id] = asyncio.create_task(self._run(chat_id, until))
+        return True
+
+
+    def stop(self, chat_id: Optional[int] = None) -> int:
+        stopped = 0
+        for job_chat_id, job in self._jobs.items():
+            if (chat_id is None or job_chat_id == chat_id) and not job.done():
+                job.cancel()
+                stopped += 1
+        return stopped
+
+
+    async def shutdown(self) -> None:
+        """Stop every job but keep them marked as running, so they resume on the next start"""
+        self._shutting_down = True
+        self.stop()
+        await asyncio.gather(*self._jobs.values(), return_exceptions=True)
+
+
+    async def resume(self) -> None:
+        """Restart the jobs that were running when the bot went down"""
+        for checkpoint in await BackfillManager.get_running():
+            LOGGER.info(f"Backfill : Resuming {checkpoint['chat_id']} after message {checkpoint.get('last_msg_id', 0)}")
+            self.start(checkpoint["chat_id"], checkpoint.get("until"))
+
+
+    def status(self) -> str:
+        if not self.progress:
+            return "No backfill started yet"
+        lines = []
+        for chat_id, progress in self.progress.items():
+            lines.append(
+                f"{chat_id} : {progress['status']}, at message {progress['last_msg_id']}, "
+                f"{progress['scanned']} scanned, {progress['queued']} queued, {progress['flood_waits']} flood waits"
+            )
+        return "\n".join(lines)
+
+
+    async def _run(self, chat_id: int, until: Optional[int]) -> None:
+        checkpoint = await BackfillManager.get_checkpoint(chat_id) or {}
+        progress = self.progress[chat_id] = {
+            "status": "running",
+            "last_msg_id": checkpoint.get("last_msg_id", 0),
+            "scanned": checkpoint.get("scanned", 0),
+            "queued": checkpoint.get("queued", 0),
+            "flood_waits": 0,
+        }
+        await BackfillManager.save_checkpoint(chat_id, status="running", until=until)
+
+        # resume right after the last real message, trailing gaps are scanned again
+        next_id = progress["last_msg_id"] + 1
+        empty_batches = 0
+        try:
+            while not (until and next_id > until):
+                bots = botmanager.get_available_bots(max(1, Config.BACKFILL_PARALLEL)) or [botmanager.get_main_bot()]
+                batches = []
+                for bot in bots:
+                    end_id = next_id + BATCH_SIZE - 1
+                    if until:
+                        end_id = min(end_id, until)
+                    if next_id > end_id:
+                        break
+                    batches.append((bot, list(range(next_id, end_id + 1))))
+                    next_id = end_id + 1
+
+                results = await asyncio.gather(*(self._fetch(bot, chat_id, ids, progress) for bot, ids in batches))
+                for messages in results:
+                    messages = [message for message in messages if message and not message.empty]
+                    empty_batches = 0 if messages else empty_batches + 1
+                    for message in messages:
+                        progress["scanned"] += 1
+                        progress["last_msg_id"] = max(progress["last_msg_id"], message.id)
+                        # skips messages that are already queued, waits while indexing is behind
+                        if await index_queue.push(message):
+                            progress["queued"] += 1
+
+                await BackfillManager.save_checkpoint(
+                    chat_id, last_msg_id=progress["last_msg_id"], scanned=progress["scanned"], queued=progress["queued"]
+                )
+                if not until and empty_batches >= END_EMPTY_BATCHES:
+                    break
+                await asyncio.sleep(Config.BACKFILL_DELAY)
+
+            progress["status"] = "done"
+            LOGGER.info(f"Backfill : Finished {chat_id} at message {progress['last_msg_id']}, {progress['queued']} tracks queued")
+        except asyncio.CancelledError:
+            progress["status"] = "running" if self._shutting_down else "stopped"
+            raise
+        except Exception as e:
+            progress["status"] = "failed"
+            LOGGER.error(f"Backfill : Failed on {chat_id} after message {progress['last_msg_id']} - {e}")
+        finally:
+            await BackfillManager.save_checkpoint(chat_id, status=progress["status"])
+
+
+    @staticmethod
+    async def _fetch(bot: Bot, chat_id: int, ids: List[int], progress: dict) -> List[Message]:
+        while True:
+            try:
+                messages = await bot.client.get_messages(chat_id, ids)
+                return messages if isinstance(messages, list) else [messages]
+            except FloodWait as e:
+                progress["flood_waits"] += 1
+                LOGGER.warning(f"Backfill : Bot {bot.bot_id} hit FloodWait of {e.value}s on {chat_id}")
+                await asyncio.sleep(e.value + 1)
+
+
+backfiller = Backfiller()
+
+
+@Client.on_message(filters.command("backfill") & filters.user(list(Config.ADMINS)))
+async def backfill_command(c: Client, msg: Message):
+    """
+    /backfill [chat_id] [until_msg_id] - index the history of MUSIC_CHANNELS (or one of them)
+    /backfill status - show progress
+    /backfill stop [chat_id] - stop running jobs
+    """
+    args = msg.command[1:]
+    if args and args[0] == "status":
+        return await msg.reply_text(backfiller.status())
+
+    try:
+        if args and args[0] == "stop":
+            stopped = backfiller.stop(int(args[1]) if len(args) > 1 else None)
+            return await msg.reply_text(f"Stopped {stopped} backfill jobs")
+
+        chat_ids = [int(args[0])] if args else list(Config.MUSIC_CHANNELS)
+        until = int(args[1]) if len(args) > 1 else None
+    except ValueError:
+        return await msg.reply_text("Usage: /backfill [chat_id] [until_msg_id] | status | stop [chat_id]")
+
+    started = [chat_id for chat_id in chat_ids if backfiller.start(chat_id, until)]
+    await msg.reply_text(f"Backfill started for {started or 'nothing (already running)'}")
@@ -1,57 +1,280 @@
+import os
+import uuid
+import asyncio
+
 from pyrogram import Client, filters
-from pyrogram.types import Message
-from typing import Tuple
+from pyrogram.types import Document, Message
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 from pyrogram.enums import MessageMediaType
 
+from config import Config
+from bot.logger import LOGGER
+
+from ..tgclient import botmanager
 from ..utils.queue import AsyncQueueProcessor
+from ..utils.singleflight import SingleFlight
+from ..utils.tags import probe_tags
+from ..utils.errors import FileNotFound
+from ..utils.scheduler import Priority
 from ..metadata.handler import meta_manager
-from ..database import AlbumManager, ArtistManager, TrackManager
+from ..metadata.models import BaseAlbum, BaseArtist
+from ..database import AlbumManager, ArtistManager, TrackManager, IndexQueueManager, existence_index
 
-async def handle_tracks(data: Tuple[Client, Message]):
-    c, msg = data
 
-    if msg.media == MessageMediaType.AUDIO:
-        audio_data = msg.audio
-        
-        title = audio_data.title
-        artist = audio_data.performer
+# audio files posted as documents
+AUDIO_EXTENSIONS = (".mp3", ".flac", ".m4a", ".ogg", ".opus", ".wav", ".aac")
 
-        metadata = await meta_manager.search(title, artist)
+# tracks of one artist/album indexed at the same time share the lookup of
+# it, the inserts that follow are idempotent upserts
+metadata_flights = SingleFlight()
 
-        metadata.chat_id = msg.chat.id
-        metadata.msg_id = msg.id
-        metadata.file_unique_id = audio_data.file_unique_id
-        metadata.mime_type = audio_data.mime_type
-        metadata.file_size = audio_data.file_size
 
+def is_audio_document(document: Document) -> bool:
+    if document.mime_type and document.mime_type.startswith("audio/"):
+        return True
+    return bool(document.file_name) and document.file_name.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def name_from_file(file_name: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(title, artist) from a `Artist - Title.ext` style file name"""
+    if not file_name:
+        return None, None
+    stem = os.path.splitext(file_name)[0].replace("_", " ").strip()
+    artist, separator, title = stem.partition(" - ")
+    if separator and artist.strip() and title.strip():
+        return title.strip(), artist.strip()
+    return stem or None, None
+
+
+async def probe_job_tags(job: dict) -> dict:
+    """Tags of the file itself, read from its first and last few KiB in the background priority"""
+    bot = botmanager.get_stream_bot(job["chat_id"], job["msg_id"]) or botmanager.get_main_bot()
+    file_id = await bot.bytestreamer.get_file_properties(job["chat_id"], job["msg_id"])
+
+    async def read(start: int, end: int) -> bytes:
+        return await bot.bytestreamer.read_range(file_id, start, end, "indexing", Priority.PREFETCH)
+
+    return await probe_tags(read, job["file_size"])
+
+
+async def missing_artist(artist_id: Optional[str], artist_name: str) -> Optional[BaseArtist]:
+    """Details of an artist not in the database yet, None if it is there"""
+    if await ArtistManager.check_exists(artist_id, artist_name):
+        return None
+    return await meta_manager.get_artist(artist_id, artist_name, raise_transient=True)
 
-        song_exist = await TrackManager.check_exists(
-            metadata.track_id, metadata.file_unique_id
-        )
 
-        if song_exist:
+async def missing_album(album_id: str) -> Optional[BaseAlbum]:
+    """Details of an album not in the database yet, None if it is there"""
+    if await AlbumManager.check_album_exists(album_id):
+        return None
+    return await meta_manager.get_album(album_id, raise_transient=True)
+
+
+async def handle_tracks(job: dict):
+    """
+    Index one queued audio message. Everything is fetched before anything
+    is written, so a job failing halfway can simply be run again.
+    """
+    tags = {}
+    if not (job["title"] and job["performer"]) and job["file_size"]:
+        # documents and audio without Telegram tags, read the file's own tags
+        try:
+            tags = await probe_job_tags(job)
+        except FileNotFound:
+            LOGGER.warning(f"Indexing : Message {job['msg_id']} of {job['chat_id']} is gone, skipping it")
             return
 
-        await TrackManager.insert_track(metadata)
+    file_title, file_artist = name_from_file(job.get("file_name"))
+    title = job["title"] or tags.get("title") or file_title
+    artist = job["performer"] or tags.get("artist") or file_artist or ""
+    if not title:
+        LOGGER.warning(f"Indexing : No title for message {job['msg_id']} of {job['chat_id']}, skipping it")
+        return
+
+    metadata = await meta_manager.search(title, artist, raise_transient=True)
+    if metadata.provider == "null":
+        # no provider match, keep what the file says about itself
+        metadata.album = metadata.album or tags.get("album")
+        metadata.isrc = metadata.isrc or tags.get("isrc")
+    if not metadata.duration:
+        metadata.duration = tags.get("duration") or (job["duration"] * 1000 if job.get("duration") else None)
+
+    metadata.chat_id = job["chat_id"]
+    metadata.msg_id = job["msg_id"]
+    metadata.file_unique_id = job["file_unique_id"]
+    metadata.mime_type = job["mime_type"]
+    metadata.file_size = job["file_size"]
+
+
+    song_exist = await TrackManager.check_exists(
+        metadata.track_id, metadata.file_unique_id
+    )
+
+    if song_exist:
+        return
+
+    artist_data = await metadata_flights.do(
+        ("artist", metadata.artist_id or metadata.artist),
+        lambda: missing_artist(metadata.artist_id, metadata.artist)
+    )
+
+    album_data = None
+    if metadata.album_id:
+        album_data = await metadata_flights.do(
+            ("album", metadata.album_id),
+            lambda: missing_album(metadata.album_id)
+        )
+
+    # returns once every write landed, a failed one fails the job
+    inserts = [TrackManager.insert_track(metadata)]
+    if artist_data:
+        inserts.append(ArtistManager.insert_artist(artist_data))
+    if album_data:
+        inserts.append(AlbumManager.insert_album(album_data))
+    await asyncio.gather(*inserts)
 
-        artist_exist = await ArtistManager.check_exists(
-            metadata.artist_id, metadata.artist
+
+class IndexQueue:
+    """
+    Durable indexing queue. Every message is stored in Mongo before it is
+    handed to the in-memory worker pool and only removed once indexed, so
+    nothing queued is lost on a restart. Failed jobs come back after an
+    exponential backoff and land in the dead letters after
+    INDEXING_MAX_ATTEMPTS, jobs of a dead process come back when their
+    lease runs out. The lease is renewed when a worker picks the job up,
+    so a job that waited in memory for longer than the lease is skipped
+    if another process took it over in the meantime.
+    """
+    def __init__(self, handler: Callable[[dict], Awaitable[None]], poll_interval: float = 5):
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.owner = uuid.uuid4().hex  # leases taken by this process
+        self.processor = AsyncQueueProcessor(
+            self._run,
+            workers=Config.INDEXING_WORKERS,
+            maxsize=Config.INDEXING_QUEUE_SIZE,
+            name="Indexing"
         )
-        if not artist_exist:
-            artist_data = await meta_manager.get_artist(
-                metadata.artist_id, metadata.artist
-            )
-            await ArtistManager.insert_artist(artist_data)
-        
-        if metadata.album_id:
-            album_exist = await AlbumManager.check_album_exists(metadata.album_id)
-            if not album_exist:
-                album_data = await meta_manager.get_album(metadata.album_id)
-                await AlbumManager.insert_album(album_data)
+        self._feeder: Optional[asyncio.Task] = None
+        self._held: Dict[Tuple[int, int], dict] = {}  # (chat_id, msg_id) -> job waiting or running here
+
+        self.retried = 0
+        self.dead_lettered = 0
+
+
+    @staticmethod
+    def job_from_message(msg: Message) -> Optional[dict]:
+        """The parts of a message needed to index it"""
+        if msg.media == MessageMediaType.AUDIO:
+            media = msg.audio
+        elif msg.media == MessageMediaType.DOCUMENT and is_audio_document(msg.document):
+            media = msg.document  # no tags from Telegram, they are probed from the file
+        else:
+            return None
+        return {
+            "chat_id": msg.chat.id,
+            "msg_id": msg.id,
+            "title": getattr(media, "title", None),
+            "performer": getattr(media, "performer", None),
+            "file_name": media.file_name,
+            "file_unique_id": media.file_unique_id,
+            "mime_type": media.mime_type,
+            "file_size": media.file_size,
+            "duration": getattr(media, "duration", None),
+        }
+
+
+    def start(self) -> None:
+        """Pick up the jobs left over by earlier runs and failed jobs due for a retry"""
+        if not self._feeder or self._feeder.done():
+            self._feeder = asyncio.create_task(self._feed())
+
+
+    async def push(self, msg: Message) -> bool:
+        """Queue a message, False if it is not indexable or already queued"""
+        job = self.job_from_message(msg)
+        if not job:
+            return False
+        if not await IndexQueueManager.enqueue(job, self.owner, Config.INDEXING_LEASE_TIME):
+            return False
+        job["attempts"] = 1
+        await self._hand_over(job)  # waits while indexing is behind
+        return True
+
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        if self._feeder:
+            self._feeder.cancel()
+            await asyncio.gather(self._feeder, return_exceptions=True)
+        await self.processor.stop(timeout)
+        # whatever was not drained is picked up right away by the next run
+        await IndexQueueManager.release(self.owner)
+
+
+    async def stats(self) -> Dict[str, object]:
+        return {
+            "workers": self.processor.stats(),
+            **await IndexQueueManager.counts(),
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "existence_filter": existence_index.stats(),
+        }
+
+
+    async def _feed(self) -> None:
+        while True:
+            if self.processor.queue.full():
+                await asyncio.sleep(1)
+                continue
+            try:
+                # jobs held here are not leased again when their lease runs out before they run
+                job = await IndexQueueManager.lease(self.owner, Config.INDEXING_LEASE_TIME, self._held.values())
+            except Exception as e:
+                LOGGER.error(f"Indexing : Failed to lease a job - {e}")
+                job = None
+            if not job:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._hand_over(job)
+
+
+    async def _hand_over(self, job: dict) -> None:
+        self._held[(job["chat_id"], job["msg_id"])] = job
+        await self.processor.add_item(job)
+
+
+    async def _run(self, job: dict) -> None:
+        try:
+            # the lease was taken when the job was queued, it starts over now the job runs
+            if not await IndexQueueManager.renew(job, self.owner, Config.INDEXING_LEASE_TIME):
+                LOGGER.info(f"Indexing : Message {job['msg_id']} of {job['chat_id']} was taken over while queued, skipping it")
+                return
+            try:
+                await self.handler(job)
+            except Exception as e:
+                await self._fail(job, f"{type(e).__name__}: {e}")
+                raise
+            await IndexQueueManager.complete(job)
+        finally:
+            self._held.pop((job["chat_id"], job["msg_id"]), None)
+
+
+    async def _fail(self, job: dict, error: str) -> None:
+        if job["attempts"] >= Config.INDEXING_MAX_ATTEMPTS:
+            self.dead_lettered += 1
+            LOGGER.warning(f"Indexing : Message {job['msg_id']} of {job['chat_id']} moved to the dead letters after {job['attempts']} attempts")
+            await IndexQueueManager.dead_letter(job, error)
+            return
+
+        delay = min(Config.INDEXING_RETRY_DELAY * 2 ** (job["attempts"] - 1), 3600)
+        self.retried += 1
+        LOGGER.info(f"Indexing : Retrying message {job['msg_id']} of {job['chat_id']} in {delay:.0f}s")
+        await IndexQueueManager.retry(job, error, delay)
 
 
-processor = AsyncQueueProcessor(handle_tracks)
+index_queue = IndexQueue(handle_tracks)
 
 @Client.on_message(filters.audio | filters.document)
 async def handle_music(c: Client, msg: Message):
-    await processor.add_item((c, msg))
\ No newline at end of file
+    await index_queue.push(msg)
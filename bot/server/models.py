@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from typing import List
 
 
 class UserLogin(BaseModel):
@@ -8,4 +9,7 @@ class UserLogin(BaseModel):
 class UserRegister(BaseModel):
     username: str
     email: str
-    password: str
\ No newline at end of file
+    password: str
+
+class PrefetchRequest(BaseModel):
+    track_ids: List[str]
\ No newline at end of file
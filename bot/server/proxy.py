@@ -0,0 +1,164 @@
+import bisect
+import hashlib
+
+from typing import Dict, Iterator, List, Optional
+
+import aiohttp
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from bot.logger import LOGGER
+
+from .streaming import client_key
+
+
+# request headers a worker needs to answer a /stream request
+FORWARD_HEADERS = ("range", "if-range", "if-none-match")
+# response headers that belong to a single hop
+HOP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "server", "date"}
+
+
+def _hash(key: str) -> int:
+    return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+
+class StreamProxy:
+    """
+    Front process side of the streaming workers. Requests are routed to a
+    worker by consistent hashing on the track id (so a track keeps hitting
+    the same chunk cache) and relayed over the worker's unix socket.
+    Unreachable workers are skipped in ring order.
+
+    Every streamed byte passes through this process's event loop, so the
+    relay caps the total /stream throughput at what one core can copy; the
+    workers only spread the Telegram fetching and caching. Past that, put
+    a reverse proxy hashing on the track id in front of the worker sockets,
+    which serve /stream themselves.
+    """
+    def __init__(self, replicas: int = 64):
+        self.replicas = replicas
+        self._ring: List[int] = []
+        self._ring_workers: List[int] = []
+        self._sessions: List[aiohttp.ClientSession] = []
+
+        self.forwarded = 0
+        self.rerouted = 0
+        self.failed = 0
+
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._sessions)
+
+
+    def configure(self, socket_paths: List[str]) -> None:
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=5)
+        self._sessions = [
+            aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=path, limit=0), timeout=timeout)
+            for path in socket_paths
+        ]
+        points = sorted(
+            (_hash(f"worker-{worker}-{replica}"), worker)
+            for worker in range(len(socket_paths)) for replica in range(self.replicas)
+        )
+        self._ring = [point for point, _ in points]
+        self._ring_workers = [worker for _, worker in points]
+
+
+    async def close(self) -> None:
+        for session in self._sessions:
+            await session.close()
+        self._sessions = []
+
+
+    def workers_for(self, key: str) -> Iterator[int]:
+        """Workers in ring order starting at the owner of `key`"""
+        start = bisect.bisect(self._ring, _hash(key)) % len(self._ring)
+        seen = set()
+        for i in range(len(self._ring)):
+            worker = self._ring_workers[(start + i) % len(self._ring)]
+            if worker not in seen:
+                seen.add(worker)
+                yield worker
+
+
+    async def forward(self, key: str, request: Request) -> Response:
+        headers = {name: request.headers[name] for name in FORWARD_HEADERS if name in request.headers}
+        # keep the listener identity for the worker's fair scheduler
+        headers["x-forwarded-for"] = client_key(request)
+
+        for attempt, worker in enumerate(self.workers_for(key)):
+            try:
+                upstream = await self._sessions[worker].request(
+                    request.method, f"http://worker{request.url.path}",
+                    params=list(request.query_params.multi_items()),
+                    headers=headers,
+                    allow_redirects=False
+                )
+            except aiohttp.ClientConnectionError as e:
+                LOGGER.warning(f"Streaming worker {worker} unreachable, trying the next one - {e}")
+                continue
+
+            self.forwarded += 1
+            if attempt:
+                self.rerouted += 1
+            response_headers = {
+                name: value for name, value in upstream.headers.items() if name.lower() not in HOP_HEADERS
+            }
+            if request.method == "HEAD" or upstream.status in (204, 304):
+                upstream.release()
+                return Response(status_code=upstream.status, headers=response_headers)
+            return StreamingResponse(self._relay(upstream), status_code=upstream.status, headers=response_headers)
+
+        self.failed += 1
+        raise HTTPException(status_code=503, detail="No streaming worker available")
+
+
+    async def post_json(self, key: str, path: str, payload: dict) -> Optional[dict]:
+        """POST to the worker owning `key`, None if no worker answered"""
+        for worker in self.workers_for(key):
+            try:
+                async with self._sessions[worker].post(f"http://worker{path}", json=payload) as response:
+                    return await response.json()
+            except aiohttp.ClientError as e:
+                LOGGER.warning(f"Streaming worker {worker} failed {path} - {e}")
+        return None
+
+
+    async def worker_stats(self) -> Dict[int, object]:
+        stats = {}
+        for worker, session in enumerate(self._sessions):
+            try:
+                async with session.get("http://worker/stats") as response:
+                    stats[worker] = await response.json()
+            except aiohttp.ClientError as e:
+                stats[worker] = {"error": str(e)}
+        return stats
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "forwarded": self.forwarded,
+            "rerouted": self.rerouted,
+            "failed": self.failed,
+        }
+
+
+    @staticmethod
+    async def _relay(upstream: aiohttp.ClientResponse):
+        complete = False
+        try:
+            async for chunk in upstream.content.iter_any():
+                yield chunk
+            complete = True
+        finally:
+            if complete:
+                upstream.release()
+            else:
+                # dropping the connection lets the worker see the listener leave
+                # and cancel its pending GetFile requests
+                upstream.close()
+
+
+stream_proxy = StreamProxy()
@@ -1,15 +1,27 @@
+import time
+
 from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from fastapi import Response, Depends
 from typing import List
+from urllib.parse import quote, urlencode
 
+from ..database import TrackManager, IndexQueueManager, write_stats
 from ..database.connection import mongo
-from ..database.models import DBTrack, DBArtist, DBAlbum, DBUser
-from ..utils.web import paginate, parse_range_header
+from ..database.models import DBTrack, DBArtist, DBAlbum, DBUser, StreamTarget
+from ..utils.web import paginate, parse_range_header, etag_matches
+from ..utils.errors import FileNotFound, RangeNotSatisfiable
 from ..utils.auth import *
 from ..tgclient import botmanager
+from ..utils.cache import chunk_cache
+from ..utils.streamer import chunk_flights
+from ..utils.store import track_store, iter_file_range
+from ..utils.scheduler import Priority
+from ..modules.indexing import index_queue
 
-from .models import UserLogin, UserRegister
+from .models import UserLogin, UserRegister, PrefetchRequest
+from .proxy import stream_proxy
+from .streaming import failover_stream, plan_stream_parts, prepare_stripes, striped_stream, prefetcher, seek_indexer, cancel_on_disconnect, client_key
 
 
 router = APIRouter()
@@ -58,59 +70,245 @@ async def get_album(id: str):
     return DBAlbum(**album)
 
 
-@router.get("/stream/{track_id}")
-async def stream_song(track_id: str, request: Request):
-    track = await mongo.db["songs"].find_one({"track_id": track_id})
-    if not track:
+async def _get_stream_target(track_id: str) -> StreamTarget:
+    target = await TrackManager.get_stream_target(track_id)
+    if not target:
         raise HTTPException(status_code=404, detail="Track not found")
-
-    db_track = DBTrack(**track)
-    if not db_track.chat_id or not db_track.msg_id:
+    if not target.chat_id or not target.msg_id:
         raise HTTPException(status_code=400, detail="Missing chat_id/msg_id")
+    return target
 
-    bot = botmanager.get_available_bot()
+
+async def _get_stream_bot(target: StreamTarget):
+    """Pick a bot for the track and resolve the file on it"""
+    bot = botmanager.get_stream_bot(target.chat_id, target.msg_id)
 
     if not bot or not bot.bytestreamer:
         raise HTTPException(status_code=503, detail="Streaming bot unavailable")
 
-    file_id = await bot.bytestreamer.get_file_properties(db_track.chat_id, db_track.msg_id)
-    file_size = file_id.file_size or db_track.file_size or 10 * 1024 * 1024
+    try:
+        file_id = await bot.bytestreamer.get_file_properties(target.chat_id, target.msg_id)
+    except FileNotFound:
+        # the message is gone from the channel, keep the track out of listings
+        await TrackManager.trash_track(target.track_id, "file_not_found")
+        raise HTTPException(status_code=404, detail="Track file not found")
+    botmanager.remember_stream(target.chat_id, target.msg_id, bot, file_id.dc_id)
+    return bot, file_id
 
-    range_header = request.headers.get("range")
-    start_byte, end_byte = parse_range_header(range_header, file_size)
 
-    chunk_size = 512 * 1024
-    offset = start_byte - (start_byte % chunk_size)
-    first_part_cut = start_byte - offset
-    last_part_cut = (end_byte % chunk_size) + 1
-    total_bytes = end_byte - start_byte + 1
+@router.get("/stream-url/{track_id}")
+async def get_stream_url(track_id: str):
+    """Short-lived signed /stream URL that is served without a database lookup"""
+    if not Config.SECRET_KEY:
+        raise HTTPException(status_code=503, detail="Signed stream URLs are not configured")
+    target = await _get_stream_target(track_id)
+    params = sign_stream_target(target)
+    return {"url": f"/stream/{quote(track_id)}?{urlencode(params)}", "expires": params["exp"]}
 
-    part_count = ((end_byte - offset) // chunk_size) + 1
 
-    stream_gen = bot.bytestreamer.yield_file(
-        file_id=file_id,
-        index=0,
-        offset=offset,
-        first_part_cut=first_part_cut,
-        last_part_cut=last_part_cut,
-        part_count=part_count,
-        chunk_size=chunk_size
-    )
+@router.api_route("/stream/{track_id}", methods=["GET", "HEAD"])
+async def stream_song(track_id: str, request: Request):
+    if stream_proxy.enabled:
+        return await stream_proxy.forward(track_id, request)
+
+    # signed URLs carry everything needed, so the hot path skips Mongo
+    signed = "sig" in request.query_params
+    if signed:
+        if not Config.SECRET_KEY:
+            raise HTTPException(status_code=503, detail="Signed stream URLs are not configured")
+        target = verify_stream_signature(track_id, request.query_params)
+        if not target:
+            raise HTTPException(status_code=403, detail="Invalid or expired stream URL")
+    else:
+        target = await _get_stream_target(track_id)
+
+    # size and ETag come from the database (or the signed URL) so probes never reach Telegram
+    bot = file_id = None
+    file_size = target.file_size
+    file_unique_id = target.file_unique_id
+    if not file_size or not file_unique_id:
+        bot, file_id = await _get_stream_bot(target)
+        file_size = file_id.file_size or file_size or 10 * 1024 * 1024
+        file_unique_id = file_unique_id or file_id.unique_id
+
+    headers = {"Accept-Ranges": "bytes"}
+    if signed:
+        # shared caches can key on the signed URL until it expires
+        headers["Cache-Control"] = f"public, max-age={max(0, int(request.query_params['exp']) - int(time.time()))}"
+    etag = f'"{file_unique_id}"' if file_unique_id else None
+    if etag:
+        headers["ETag"] = etag
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
 
-    headers = {
-        "Content-Range": f"bytes {start_byte}-{end_byte}/{file_size}",
-        "Accept-Ranges": "bytes",
-        "Content-Length": str(total_bytes)
-    }
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None  # representation changed, send the full file
+
+    try:
+        byte_range = parse_range_header(range_header, file_size)
+    except RangeNotSatisfiable:
+        headers["Content-Range"] = f"bytes */{file_size}"
+        return Response(status_code=416, headers=headers)
+
+    # ?t=seconds starts the response at the first frame at or after that time
+    seek_time = request.query_params.get("t")
+    if seek_time is not None:
+        try:
+            seconds = float(seek_time)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid seek time")
+        if not seconds >= 0 or not file_unique_id:
+            raise HTTPException(status_code=400, detail="Invalid seek time")
+
+        if not bot:
+            bot, file_id = await _get_stream_bot(target)
+        try:
+            seek_byte = await seek_indexer.resolve(bot, file_id, file_unique_id, file_size, seconds, client_key(request))
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+        if seek_byte is None:
+            raise HTTPException(status_code=400, detail="Time seek is not supported for this track")
+        byte_range = (seek_byte, file_size - 1)
+
+    if byte_range:
+        start_byte, end_byte = byte_range
+        status_code = 206  # Partial Content
+        headers["Content-Range"] = f"bytes {start_byte}-{end_byte}/{file_size}"
+    else:
+        start_byte, end_byte = 0, file_size - 1
+        status_code = 200
+
+    total_bytes = end_byte - start_byte + 1
+    headers["Content-Length"] = str(total_bytes)
+    media_type = target.mime_type or "audio/mpeg"
+
+    if request.method == "HEAD" or total_bytes <= 0:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+
+    # hot tracks are served straight from the local store
+    stored_file = track_store.open_track(file_unique_id)
+    if stored_file:
+        return StreamingResponse(
+            iter_file_range(stored_file, start_byte, end_byte),
+            status_code=status_code,
+            media_type=media_type,
+            headers=headers
+        )
+
+    if not bot:
+        bot, file_id = await _get_stream_bot(target)
+
+    # plain playback sends a Range (or a seek time), downloads either ask for it or send none
+    listener = client_key(request)
+    is_download = "download" in request.query_params or not (range_header or seek_time)
+    priority = Priority.BULK if is_download else Priority.PLAYBACK
+
+    stripes = []
+    if Config.STRIPED_STREAMING and total_bytes >= Config.STRIPE_MIN_SIZE * 1024 * 1024:
+        stripe_bots = botmanager.get_available_bots(Config.STRIPE_WIDTH)
+        if len(stripe_bots) > 1:
+            # resolved before the headers go out, a failing bot only narrows the stripe
+            stripes = await prepare_stripes(stripe_bots, target.chat_id, target.msg_id)
+
+    if len(stripes) > 1:
+        parts, first_part_cut, last_part_cut = plan_stream_parts(start_byte, end_byte)
+        stream_gen = striped_stream(
+            stripes=stripes,
+            parts=parts,
+            first_part_cut=first_part_cut,
+            last_part_cut=last_part_cut,
+            client=listener,
+            priority=priority
+        )
+    else:
+        stream_gen = failover_stream(
+            bot=bot,
+            file_id=file_id,
+            chat_id=target.chat_id,
+            msg_id=target.msg_id,
+            start_byte=start_byte,
+            end_byte=end_byte,
+            client=listener,
+            priority=priority
+        )
+
+    if start_byte == 0:
+        stream_gen = track_store.record_play(file_unique_id, bot, file_id, file_size, stream_gen)
 
     return StreamingResponse(
-        stream_gen,
-        status_code=206,  # Partial Content
-        media_type=db_track.mime_type or "audio/mpeg",
+        cancel_on_disconnect(stream_gen),
+        status_code=status_code,
+        media_type=media_type,
         headers=headers
     )
 
 
+@router.post("/prefetch", status_code=202)
+async def prefetch_songs(data: PrefetchRequest):
+    track_ids = data.track_ids[:Config.PREFETCH_MAX_TRACKS]
+    if stream_proxy.enabled:
+        # warm the chunk cache of the worker that will serve each track
+        shards = {}
+        for track_id in track_ids:
+            shards.setdefault(next(stream_proxy.workers_for(track_id)), []).append(track_id)
+        results = [await stream_proxy.post_json(ids[0], "/prefetch", {"track_ids": ids}) for ids in shards.values()]
+        return {"queued": sum(result.get("queued", 0) for result in results if result)}
+
+    cursor = mongo.db["songs"].find(
+        {"track_id": {"$in": track_ids}},
+        {"_id": 0, "chat_id": 1, "msg_id": 1, "file_size": 1, "file_unique_id": 1}
+    )
+    tracks = [track async for track in cursor if track.get("chat_id") and track.get("msg_id")]
+    return {"queued": prefetcher.schedule(tracks)}
+
+
+@router.get("/stats")
+async def get_stats():
+    if stream_proxy.enabled:
+        return {
+            "stream_proxy": stream_proxy.stats(),
+            "writes": write_stats(),
+            "indexing": await index_queue.stats(),
+            "workers": await stream_proxy.worker_stats(),
+        }
+    return {
+        "bots": {bot.bot_id: bot.stats() for bot in botmanager.get_all_bots()},
+        "failovers": {"succeeded": botmanager.failovers, "failed": botmanager.failed_failovers},
+        "track_cache": TrackManager.cache_stats(),
+        "writes": write_stats(),
+        "indexing": await index_queue.stats(),
+        "chunk_cache": chunk_cache.stats(),
+        "chunk_flights": chunk_flights.stats(),
+        "track_store": track_store.stats(),
+        "prefetch": prefetcher.stats(),
+        "seek_index": seek_indexer.stats(),
+        "file_id_cache": {
+            bot.bot_id: bot.bytestreamer.file_id_cache.stats() for bot in botmanager.get_all_bots()
+        },
+        "schedulers": {
+            bot.bot_id: bot.bytestreamer.scheduler.stats() for bot in botmanager.get_all_bots()
+        },
+        "media_sessions": {
+            bot.bot_id: bot.bytestreamer.media_sessions.stats() for bot in botmanager.get_all_bots()
+        },
+    }
+
+
+@router.get("/admin/dead-letters")
+async def get_dead_letters(limit: int = 10, page: int = 1, admin = Depends(get_current_admin)):
+    """Messages that failed indexing INDEXING_MAX_ATTEMPTS times, with the last error"""
+    paging = paginate(limit, page)
+    return await IndexQueueManager.get_dead_letters(paging["limit"], paging["skip"])
+
+
+@router.post("/admin/dead-letters/replay")
+async def replay_dead_letters(limit: int = 100, admin = Depends(get_current_admin)):
+    return {"replayed": await IndexQueueManager.replay_dead_letters(limit)}
+
+
 @router.post("/register")
 async def register(user: UserRegister):
     if await mongo.db["users"].find_one({"username": user.username}):
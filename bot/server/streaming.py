@@ -0,0 +1,353 @@
+import anyio
+import struct
+import asyncio
+
+from collections import deque
+from fastapi import Request
+from typing import AsyncGenerator, Deque, Dict, List, Optional, Set, Tuple
+
+from pyrogram.errors import FloodWait, InternalServerError
+from pyrogram.file_id import FileId
+
+from config import Config
+from bot.logger import LOGGER
+
+from ..tgclient import Bot, botmanager
+from ..database import SeekIndexManager
+from ..utils.cache import TTLCache
+from ..utils.errors import RangeNotSatisfiable
+from ..utils.seek import build_seek_index, find_frame_start, seek_offset
+from ..utils.singleflight import SingleFlight
+from ..utils.streamer import cut_chunk, consume_task_exception, plan_parts
+from ..utils.store import track_store
+from ..utils.scheduler import Priority
+
+
+# errors after which a stream is moved to another bot
+FAILOVER_ERRORS = (TimeoutError, ConnectionError, OSError, FloodWait, InternalServerError)
+# short FloodWaits a bot may sit out before its stream is moved anyway
+MAX_FLOOD_RETRIES = 2
+
+
+async def cancel_on_disconnect(stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """
+    Relay a stream, closing it (and with it every pending GetFile) when the
+    client disconnects. Starlette cancels the body on http.disconnect through
+    an anyio cancel scope, which cancels every later await of this task as
+    well, so chunks are read in their own task and the cleanup is shielded.
+    """
+    next_chunk = None
+    try:
+        while True:
+            next_chunk = asyncio.ensure_future(stream.__anext__())
+            next_chunk.add_done_callback(consume_task_exception)
+            # not awaited directly, anyio repeats its cancel on whatever this task
+            # awaits and would keep cancelling the stream's own cleanup
+            await asyncio.wait({next_chunk})
+            try:
+                chunk = next_chunk.result()
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            if next_chunk and not next_chunk.done():
+                LOGGER.debug("Client disconnected, cancelling pending Telegram requests")
+                next_chunk.cancel()
+            if next_chunk:
+                await asyncio.gather(next_chunk, return_exceptions=True)
+            await stream.aclose()
+
+
+def client_key(request: Request) -> str:
+    """
+    Identify a listener for fair scheduling. X-Forwarded-For is only taken
+    from the stream proxy (requests over a worker's unix socket have no
+    client address) or from TRUSTED_PROXIES, anyone else could pick a new
+    identity per request and escape the per-client budget.
+    """
+    host = request.client.host if request.client else None
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and (host is None or host in Config.TRUSTED_PROXIES):
+        # the last address is the one the trusted hop saw
+        return forwarded.split(",")[-1].strip()
+    return host or "unknown"
+
+
+def plan_stream_parts(start_byte: int, end_byte: int):
+    """plan_parts with the configured chunk sizes"""
+    return plan_parts(start_byte, end_byte, Config.STREAM_MIN_CHUNK * 1024, Config.STREAM_MAX_CHUNK * 1024)
+
+
+async def failover_stream(bot: Bot, file_id: FileId, chat_id: int, msg_id: int, start_byte: int, end_byte: int, client: str = "", priority: Priority = Priority.PLAYBACK) -> AsyncGenerator[bytes, None]:
+    """
+    Stream a range from one bot, moving to another healthy bot if it
+    disconnects, times out or gets a long FloodWait. The new bot resumes
+    from the exact byte already sent, so the response is not cut.
+    """
+    position = start_byte
+    tried = {bot.bot_id}
+    flood_retries = 0
+    while True:
+        parts, first_part_cut, last_part_cut = plan_stream_parts(position, end_byte)
+        try:
+            async for chunk in bot.bytestreamer.yield_file(
+                file_id=file_id,
+                index=0,
+                parts=parts,
+                first_part_cut=first_part_cut,
+                last_part_cut=last_part_cut,
+                client=client,
+                priority=priority
+            ):
+                position += len(chunk)
+                yield chunk
+            return
+        except FAILOVER_ERRORS as e:
+            if isinstance(e, FloodWait) and e.value < Config.CIRCUIT_FLOOD_THRESHOLD and flood_retries < MAX_FLOOD_RETRIES:
+                flood_retries += 1
+                LOGGER.info(f"Bot {bot.bot_id} got a short FloodWait of {e.value}s, resuming at byte {position} ({flood_retries}/{MAX_FLOOD_RETRIES})")
+                await asyncio.sleep(e.value)
+                continue
+
+            next_bot = botmanager.get_stream_bot(chat_id, msg_id, exclude=tried)
+            if not next_bot:
+                botmanager.failed_failovers += 1
+                LOGGER.error(f"No bot left to take over stream of {chat_id}/{msg_id} at byte {position}")
+                raise
+            try:
+                next_file_id = await next_bot.bytestreamer.get_file_properties(chat_id, msg_id)
+            except Exception as resolve_error:
+                botmanager.failed_failovers += 1
+                LOGGER.error(f"Bot {next_bot.bot_id} failed to resolve {chat_id}/{msg_id} for failover - {resolve_error}")
+                raise e
+
+            botmanager.failovers += 1
+            LOGGER.warning(f"Stream of {chat_id}/{msg_id} moved from {bot.bot_id} to {next_bot.bot_id} at byte {position} - {e!r}")
+            botmanager.remember_stream(chat_id, msg_id, next_bot, next_file_id.dc_id)
+            tried.add(next_bot.bot_id)
+            bot, file_id = next_bot, next_file_id
+            flood_retries = 0
+
+
+async def prepare_stripes(bots: List[Bot], chat_id: int, msg_id: int) -> List[tuple]:
+    """
+    Resolve the file on every bot of a striped stream (file_reference is
+    bound to the bot) -> [(bot, file_id, media_session, location)].
+    Bots that fail, or whose preparation is cancelled, are left out.
+    """
+    resolved = await asyncio.gather(
+        *(_prepare_bot(bot, chat_id, msg_id) for bot in bots), return_exceptions=True
+    )
+    stripes = []
+    for bot, result in zip(bots, resolved):
+        if isinstance(result, BaseException):
+            LOGGER.warning(f"Striped stream : Dropping bot {bot.bot_id} - {type(result).__name__}: {result}")
+            continue
+        stripes.append((bot, *result))
+    return stripes
+
+
+async def striped_stream(stripes: List[tuple], parts: List[Tuple[int, int]], first_part_cut: int, last_part_cut: int, client: str = "", priority: Priority = Priority.BULK) -> AsyncGenerator[bytes, None]:
+    """
+    Stream a range by spreading its parts round-robin over the bots of
+    `stripes` (from prepare_stripes), reassembling the parts in order.
+    """
+    LOGGER.debug(f"Striped stream of {len(parts)} parts over {len(stripes)} bots")
+
+    for bot, *_ in stripes:
+        bot.increment_workload()
+
+    window = max(1, Config.STREAM_READ_AHEAD) * len(stripes)
+    pending: Deque[asyncio.Task] = deque()
+    part_count = len(parts)
+    scheduled = 0
+    current_part = 1
+    try:
+        while current_part <= part_count:
+            while len(pending) < window and scheduled < part_count:
+                bot, file_id, media_session, location = stripes[scheduled % len(stripes)]
+                part_offset, part_size = parts[scheduled]
+                task = asyncio.create_task(
+                    bot.bytestreamer.get_chunk(file_id, media_session, location, part_offset, part_size, client, priority))
+                task.add_done_callback(consume_task_exception)
+                pending.append(task)
+                scheduled += 1
+
+            chunk = await pending.popleft()
+            if not chunk:
+                break
+            yield cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut)
+            current_part += 1
+    except Exception as e:
+        LOGGER.error(f"Error while streaming striped file: {e}")
+        raise
+    finally:
+        for task in pending:
+            task.cancel()
+        for bot, *_ in stripes:
+            bot.decrement_workload()
+
+
+async def _prepare_bot(bot: Bot, chat_id: int, msg_id: int):
+    streamer = bot.bytestreamer
+    file_id = await streamer.get_file_properties(chat_id, msg_id)
+    media_session = await streamer.generate_media_session(bot.client, file_id)
+    location = await streamer.get_location(file_id)
+    return file_id, media_session, location
+
+
+class Prefetcher:
+    """
+    Warms the chunk cache with the first parts of tracks a client will play
+    next. Runs in the background with limited concurrency, one part at a
+    time, and backs off whenever the chosen bot is busy with live streams.
+    """
+    def __init__(self, concurrency: int, part_count: int, max_load: float):
+        self.part_count = part_count
+        self.max_load = max_load
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._pending: Set[Tuple[int, int]] = set()
+
+        self.prefetched = 0
+        self.skipped = 0
+        self.failed = 0
+
+
+    def schedule(self, tracks: List[dict]) -> int:
+        """Queue songs documents (chat_id, msg_id, file_size, file_unique_id) for prefetching"""
+        queued = 0
+        for track in tracks:
+            file_key = (int(track["chat_id"]), int(track["msg_id"]))
+            if file_key in self._pending or track_store.contains(track.get("file_unique_id")):
+                continue
+            self._pending.add(file_key)
+            task = asyncio.create_task(self._prefetch(file_key, track.get("file_size")))
+            task.add_done_callback(consume_task_exception)
+            queued += 1
+        return queued
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "prefetched": self.prefetched,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "pending": len(self._pending),
+        }
+
+
+    async def _prefetch(self, file_key: Tuple[int, int], file_size: Optional[int]) -> None:
+        chat_id, msg_id = file_key
+        try:
+            async with self._semaphore:
+                bot = botmanager.get_stream_bot(chat_id, msg_id)
+                if not bot or bot.load > self.max_load:
+                    self.skipped += 1
+                    return
+
+                streamer = bot.bytestreamer
+                file_id = await streamer.get_file_properties(chat_id, msg_id)
+                botmanager.remember_stream(chat_id, msg_id, bot, file_id.dc_id)
+                file_size = file_id.file_size or file_size
+                if not file_size:
+                    self.skipped += 1
+                    return
+
+                # same plan as a stream from byte 0, so the player hits these parts exactly
+                parts, _, _ = plan_stream_parts(0, file_size - 1)
+                media_session = await streamer.generate_media_session(bot.client, file_id)
+                location = await streamer.get_location(file_id)
+                for offset, limit in parts[:self.part_count]:
+                    if bot.load > self.max_load:
+                        self.skipped += 1
+                        return
+                    await streamer.get_chunk(file_id, media_session, location, offset, limit, "prefetch", Priority.PREFETCH)
+                self.prefetched += 1
+        except Exception as e:
+            self.failed += 1
+            LOGGER.debug(f"Prefetch of {chat_id}/{msg_id} failed - {e}")
+        finally:
+            self._pending.discard(file_key)
+
+
+class SeekIndexer:
+    """
+    Resolves `?t=seconds` to a byte offset on a frame boundary.
+    The time -> byte index of a track is built once from its headers
+    (read through the chunk cache), stored in Mongo by file_unique_id
+    and kept in memory for the tracks being played.
+    """
+    def __init__(self, cache_size: int = 2000, cache_ttl: int = 6 * 3600, scan_window: int = 64 * 1024):
+        self.scan_window = scan_window
+        self._indexes = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._flights = SingleFlight()
+
+        self.built = 0
+        self.unsupported = 0
+
+
+    async def resolve(self, bot: Bot, file_id: FileId, file_unique_id: str, file_size: int, seconds: float, client: str = "") -> Optional[int]:
+        """Byte offset of the first frame at or after `seconds`, None if the format has no usable index"""
+        async def read(start: int, end: int) -> bytes:
+            return await bot.bytestreamer.read_range(file_id, start, min(end, file_size - 1), client, Priority.PLAYBACK)
+
+        index = await self.get_index(file_unique_id, file_size, read)
+        if not index:
+            return None
+        if index.get("duration") and seconds >= index["duration"]:
+            raise RangeNotSatisfiable
+
+        offset = max(seek_offset(index, seconds), index["audio_start"])
+        if offset >= file_size:
+            raise RangeNotSatisfiable
+
+        # these parts are the ones the stream starts with, so they are cached for it
+        window = await read(offset, offset + self.scan_window - 1)
+        frame = find_frame_start(window, index["format"])
+        return offset + frame if frame is not None else offset
+
+
+    async def get_index(self, file_unique_id: str, file_size: int, read) -> Optional[dict]:
+        index = self._indexes.get(file_unique_id)
+        if index is not None:
+            return index or None
+        return await self._flights.do(file_unique_id, lambda: self._load_index(file_unique_id, file_size, read))
+
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "built": self.built,
+            "unsupported": self.unsupported,
+            "cache": self._indexes.stats(),
+        }
+
+
+    async def _load_index(self, file_unique_id: str, file_size: int, read) -> Optional[dict]:
+        index = await SeekIndexManager.get_index(file_unique_id)
+        if not index:
+            try:
+                index = await build_seek_index(read, file_size)
+            except (IndexError, ValueError, struct.error) as e:
+                LOGGER.warning(f"Failed to build seek index for {file_unique_id} - {e}")
+                index = None
+
+            if index:
+                await SeekIndexManager.save_index(file_unique_id, index)
+                self.built += 1
+                LOGGER.debug(f"Built {index['format']} seek index for {file_unique_id} ({len(index['points'])} points)")
+            else:
+                self.unsupported += 1
+
+        # unsupported files are remembered as {} so they are not probed again
+        self._indexes.set(file_unique_id, index or {})
+        return index
+
+
+prefetcher = Prefetcher(
+    concurrency=Config.PREFETCH_CONCURRENCY,
+    part_count=Config.PREFETCH_PARTS,
+    max_load=Config.PREFETCH_MAX_LOAD
+)
+
+seek_indexer = SeekIndexer()
@@ -0,0 +1,115 @@
+import os
+import asyncio
+import multiprocessing
+
+from typing import List, Optional
+
+from config import Config
+from bot.logger import LOGGER
+
+
+class StreamWorkerPool:
+    """
+    Streaming worker processes, each owning a shard of the MULTI_CLIENTS
+    bots and serving /stream on its own unix socket. Workers that exit
+    are restarted, the front process routes requests with StreamProxy.
+    """
+    def __init__(self, tokens: List[str], workers: int, socket_dir: str):
+        self.workers = max(1, min(workers, len(tokens)))
+        self.shards = [tokens[i::self.workers] for i in range(self.workers)]
+        self.socket_paths = [os.path.join(socket_dir, f"stream-{i}.sock") for i in range(self.workers)]
+        self.socket_dir = socket_dir
+
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._monitor_task: Optional[asyncio.Task] = None
+        self.restarts = 0
+
+
+    def start(self) -> None:
+        os.makedirs(self.socket_dir, exist_ok=True)
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor_task = asyncio.create_task(self._monitor())
+        LOGGER.info(f"Started {self.workers} streaming workers with {[len(shard) for shard in self.shards]} bots")
+
+
+    async def stop(self, timeout: float = 10) -> None:
+        if self._monitor_task:
+            self._monitor_task.cancel()
+        for process in self._processes:
+            if process and process.is_alive():
+                process.terminate()  # SIGTERM, uvicorn shuts the worker down gracefully
+        for process in self._processes:
+            if process:
+                await asyncio.to_thread(process.join, timeout)
+                if process.is_alive():
+                    process.kill()
+
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in self._processes if process and process.is_alive()),
+            "restarts": self.restarts,
+        }
+
+
+    def _spawn(self, index: int) -> None:
+        path = self.socket_paths[index]
+        if os.path.exists(path):
+            os.remove(path)
+        process = self._context.Process(
+            target=run_worker, args=(index, self.shards[index], path), name=f"stream-worker-{index}", daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+
+    async def _monitor(self, interval: float = 5) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self._processes):
+                if process and not process.is_alive():
+                    LOGGER.warning(f"Streaming worker {index} exited with code {process.exitcode}, restarting")
+                    self.restarts += 1
+                    self._spawn(index)
+
+
+def run_worker(index: int, tokens: List[str], socket_path: str) -> None:
+    """Entry point of a streaming worker process"""
+    # per worker directories, the stores are not shared between processes
+    if Config.TRACK_STORE_DIR:
+        Config.TRACK_STORE_DIR = os.path.join(Config.TRACK_STORE_DIR, f"worker-{index}")
+    if Config.CHUNK_CACHE_DIR:
+        Config.CHUNK_CACHE_DIR = os.path.join(Config.CHUNK_CACHE_DIR, f"worker-{index}")
+
+    asyncio.run(_serve_worker(index, tokens, socket_path))
+
+
+async def _serve_worker(index: int, tokens: List[str], socket_path: str) -> None:
+    # imported here so the singletons above are built with the worker's Config
+    import uvicorn
+
+    from fastapi import FastAPI
+
+    from bot.tgclient import botmanager
+    from bot.database.connection import mongo
+    from bot.utils.store import track_store
+    from .routes import router
+
+    for token in tokens:
+        await botmanager.add_worker_bot(token)
+    await botmanager.start_all()
+    await mongo.connect()
+
+    app = FastAPI(title=f"Shizuru Stream Worker {index}")
+    app.include_router(router)
+    server = uvicorn.Server(uvicorn.Config(app=app, uds=socket_path, log_level="warning", loop="asyncio"))
+    LOGGER.info(f"Streaming worker {index} serving on {socket_path} with {len(tokens)} bots")
+    try:
+        await server.serve()
+    finally:
+        await track_store.stop()
+        await mongo.disconnect()
+        await botmanager.stop_all()
@@ -1,14 +1,21 @@
+import time
+import random
 import asyncio
 import logging
 
 from enum import Enum
 from pyrogram import Client
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Set, Union
 
 from config import Config
 from bot.logger import LOGGER
 
 from .utils.streamer import ByteStreamer
+from .utils.cache import TTLCache
+
+
+EWMA_ALPHA = 0.2
+MIN_THROUGHPUT = 256 * 1024  # assumed bytes/sec for bots without samples yet
 
 
 class BotType(Enum):
@@ -25,6 +32,14 @@ class Bot:
         self.bot_type = bot_type
         self.bot_id = bot_id or self._generate_bot_id(bot_token, bot_type)
         self.workload = 0
+        self.inflight_bytes = 0
+        self.flood_wait_until = 0.0  # monotonic deadline of the last FloodWait
+
+        # moving averages of GetFile results, used for load balancing
+        self.throughput = 0.0  # bytes/sec
+        self.error_rate = 0.0
+        self.bytes_sent = 0
+        self.circuit_open_until = 0.0
         
         self._client: Optional[Client] = None
         self._is_running = False
@@ -106,7 +121,18 @@ class Bot:
     @property
     def is_available(self) -> bool:
         """Check if bot is available for work"""
-        return self.is_running and self.workload < 100
+        return self.is_running and not self.circuit_open and self.workload < 100
+
+    @property
+    def circuit_open(self) -> bool:
+        """Check if bot is taken out of rotation (throttled or failing)"""
+        return time.monotonic() < self.circuit_open_until
+
+    @property
+    def load(self) -> float:
+        """Estimated seconds needed to drain the bytes in flight"""
+        throughput = max(self.throughput, MIN_THROUGHPUT)
+        return (self.inflight_bytes / throughput) + (self.workload * 0.05)
 
     
     async def start(self) -> None:
@@ -114,6 +140,10 @@ class Bot:
             await self.client.start()
             self._is_running = True
             LOGGER.info(f"Bot {self.bot_id} started successfully")
+
+            self.bytestreamer.media_sessions.start()
+            if Config.PREWARM_MEDIA_SESSIONS:
+                asyncio.create_task(self.bytestreamer.media_sessions.prewarm())
         except Exception as e:
             LOGGER.error(f"Failed to start bot {self.bot_id}: {e}")
             self._is_running = False
@@ -121,6 +151,7 @@ class Bot:
     
     async def stop(self) -> None:
         try:
+            await self.bytestreamer.media_sessions.stop()
             if self._client and self._client.is_connected:
                 await self.client.stop()
             self._is_running = False
@@ -135,9 +166,58 @@ class Bot:
     def decrement_workload(self) -> None:
         """Decrement workload"""
         self.workload = max(0, self.workload - 1)
+
+    def add_inflight(self, size: int) -> None:
+        """Track bytes requested from Telegram but not received yet"""
+        self.inflight_bytes = max(0, self.inflight_bytes + size)
+
+    def record_flood_wait(self, seconds: int) -> None:
+        """Remember until when Telegram asked this bot to back off"""
+        self.flood_wait_until = max(self.flood_wait_until, time.monotonic() + seconds)
+        LOGGER.warning(f"Bot {self.bot_id} hit FloodWait of {seconds}s")
+        self.record_error()
+        if seconds >= Config.CIRCUIT_FLOOD_THRESHOLD:
+            self.open_circuit(seconds)
+
+    def record_transfer(self, size: int, elapsed: float) -> None:
+        """Update throughput and error rate after a successful GetFile"""
+        self.bytes_sent += size
+        if elapsed > 0:
+            rate = size / elapsed
+            self.throughput = rate if not self.throughput else (1 - EWMA_ALPHA) * self.throughput + EWMA_ALPHA * rate
+        self.error_rate *= (1 - EWMA_ALPHA)
+
+    def record_error(self) -> None:
+        """Update error rate after a failed GetFile, opening the circuit if it gets too high"""
+        self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+        if self.error_rate >= Config.CIRCUIT_ERROR_RATE and not self.circuit_open:
+            self.open_circuit(Config.CIRCUIT_COOLDOWN)
+
+    def open_circuit(self, seconds: float) -> None:
+        """Take the bot out of rotation for `seconds`"""
+        self.circuit_open_until = max(self.circuit_open_until, time.monotonic() + seconds)
+        # start half-way to the threshold once the bot is back in rotation
+        self.error_rate = min(self.error_rate, Config.CIRCUIT_ERROR_RATE / 2)
+        LOGGER.warning(f"Bot {self.bot_id} taken out of rotation for {seconds}s")
+
+    def stats(self) -> dict:
+        return {
+            "running": bool(self.is_running),
+            "workload": self.workload,
+            "inflight_bytes": self.inflight_bytes,
+            "throughput": round(self.throughput),
+            "bytes_sent": self.bytes_sent,
+            "error_rate": round(self.error_rate, 4),
+            "flood_wait_remaining": round(self.flood_wait_remaining, 1),
+            "circuit_open": self.circuit_open,
+        }
+
+    @property
+    def flood_wait_remaining(self) -> float:
+        return max(0.0, self.flood_wait_until - time.monotonic())
     
     def __repr__(self) -> str:
-        return f"Bot(id={self.bot_id}, type={self.bot_type.value}, workload={self.workload})"
+        return f"Bot(id={self.bot_id}, type={self.bot_type.value}, workload={self.workload}, load={self.load:.2f})"
 
 
 
@@ -147,6 +227,12 @@ class BotManager:
         self._main_bot: Optional[Bot] = None
         self._worker_bots: Dict[str, Bot] = {}  # keep a seperated dict (might get usefull)
         self._is_running = False
+
+        # routing hints for streams, keyed by (chat_id, msg_id)
+        self._stream_affinity = TTLCache(maxsize=Config.FILE_ID_CACHE_SIZE, ttl=Config.FILE_ID_CACHE_TTL)
+        self._file_dcs = TTLCache(maxsize=Config.FILE_ID_CACHE_SIZE, ttl=24 * 60 * 60)
+        self.failovers = 0
+        self.failed_failovers = 0
     
 
     async def add_main_bot(self, bot_token: str) -> str:
@@ -233,20 +319,67 @@ class BotManager:
 
     
     def get_available_bot(self) -> Optional[Bot]:
-        """Get an available worker bot with least workload"""
+        """Get an available worker bot with least load"""
         available = [bot for bot in self._bots.values() if bot.is_available]
         if not available:
             return None
-        # Return bot with least workload
-        return min(available, key=lambda b: b.workload)
+        # Return bot with least load
+        return min(available, key=lambda b: b.load)
+    
+
+    def get_stream_bot(self, chat_id: int, msg_id: int, exclude: Optional[Set[str]] = None) -> Optional[Bot]:
+        """
+        Pick a bot for streaming a file. Bots that already streamed the file,
+        have it resolved or hold a media session for its DC are preferred,
+        in-flight bytes and recent FloodWaits count against a bot.
+        """
+        available = [
+            bot for bot in self._bots.values()
+            if bot.is_available and not (exclude and bot.bot_id in exclude)
+        ]
+        if not available:
+            return None
+
+        file_key = (int(chat_id), int(msg_id))
+        sticky_bot_id = self._stream_affinity.get(file_key)
+        dc_id = self._file_dcs.get(file_key)
+
+        def score(bot: Bot) -> float:
+            points = 0.0
+            if bot.bot_id == sticky_bot_id:
+                points += 4
+            if file_key in bot.bytestreamer.file_id_cache:
+                points += 3
+            if dc_id and bot.bytestreamer.media_sessions.has_session(dc_id):
+                points += 2
+            points -= bot.load
+            points -= bot.flood_wait_remaining / 5
+            points -= bot.error_rate * 5
+            return points
+
+        return max(available, key=score)
+
+
+    def remember_stream(self, chat_id: int, msg_id: int, bot: Bot, dc_id: int) -> None:
+        """Record which bot served a file (and its DC) for later routing"""
+        file_key = (int(chat_id), int(msg_id))
+        self._stream_affinity.set(file_key, bot.bot_id)
+        self._file_dcs.set(file_key, dc_id)
+    
+
+    def get_available_bots(self, count: int) -> List[Bot]:
+        """Get up to `count` available bots ordered by load"""
+        available = [bot for bot in self._bots.values() if bot.is_available]
+        return sorted(available, key=lambda b: b.load)[:count]
     
 
     def get_random_bot(self) -> Optional[Bot]:
-        """Get a random available worker bot"""
+        """Get a random available worker bot, weighted towards idle and healthy bots"""
         available = [bot for bot in self._bots.values() if bot.is_available]
         if not available:
             return None
-        return random.choice(available)
+        weights = [(1 - bot.error_rate) / (1 + bot.load) for bot in available]
+        return random.choices(available, weights=weights)[0]
     
     
     def get_all_bots(self) -> List[Bot]:
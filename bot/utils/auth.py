@@ -1,10 +1,17 @@
+import hmac
+import json
+import time
+import base64
+import hashlib
+
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer
-from typing import Optional
+from typing import Mapping, Optional
 from ..database.connection import mongo
+from ..database.models import StreamTarget
 
 from config import Config
 
@@ -47,6 +54,54 @@ def decode_access_token(token: str):
     return jwt.decode(token, Config.SECRET_KEY, algorithms=[Config.SECRET_ALGORITHM])
 
 
+def _stream_signature(target: StreamTarget, expires: int) -> str:
+    # missing fields are signed as "" like they appear in the URL, 0 stays "0"; a JSON
+    # list keeps the fields apart whatever they contain (a track id may hold "\n")
+    fields = ["" if value is None else str(value) for value in (*target, expires)]
+    message = json.dumps(fields, separators=(",", ":")).encode()
+    digest = hmac.new(Config.SECRET_KEY.encode(), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+def sign_stream_target(target: StreamTarget, expires_in: int = None) -> dict:
+    """
+    Query params of a signed /stream URL. Expiry is rounded up to 5 minutes
+    so URLs issued close together are identical and cache well.
+    """
+    expires = int(time.time()) + (expires_in or Config.STREAM_URL_EXPIRE * 60)
+    expires += -expires % 300
+    return {
+        "chat_id": target.chat_id,
+        "msg_id": target.msg_id,
+        "size": "" if target.file_size is None else target.file_size,
+        "mime": target.mime_type or "",
+        "uid": target.file_unique_id or "",
+        "exp": expires,
+        "sig": _stream_signature(target, expires),
+    }
+
+def verify_stream_signature(track_id: str, params: Mapping[str, str]) -> Optional[StreamTarget]:
+    """StreamTarget of a signed /stream URL, None if the signature is invalid or expired"""
+    try:
+        expires = int(params["exp"])
+        target = StreamTarget(
+            track_id=track_id,
+            chat_id=int(params["chat_id"]),
+            msg_id=int(params["msg_id"]),
+            file_size=int(params["size"]) if params.get("size", "") != "" else None,
+            mime_type=params.get("mime") or None,
+            file_unique_id=params.get("uid") or None
+        )
+    except (KeyError, ValueError):
+        return None
+
+    if expires < time.time():
+        return None
+    # bytes, comparing str raises TypeError on non-ASCII input
+    if not hmac.compare_digest(_stream_signature(target, expires).encode(), params.get("sig", "").encode()):
+        return None
+    return target
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
         payload = decode_access_token(token)
@@ -58,4 +113,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
             raise HTTPException(status_code=401, detail="User not found")
         return user
     except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+
+async def get_current_admin(user = Depends(get_current_user)):
+    if not user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admins only")
+    return user
@@ -0,0 +1,45 @@
+import math
+import hashlib
+
+from typing import Dict
+
+
+class BloomFilter:
+    """
+    Set membership in a fixed bit array. A miss is certain, a hit only
+    means the key was probably added (about `error_rate` false positives
+    while no more than `capacity` keys are added).
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self._bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keys": self.count,
+            "capacity": self.capacity,
+            "bytes": len(self._bits),
+        }
+
+
+    def _positions(self, key: str):
+        # double hashing, every position is derived from one 128 bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
@@ -0,0 +1,328 @@
+import os
+import time
+import asyncio
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from config import Config
+from bot.logger import LOGGER
+
+
+# (file_unique_id, aligned offset, chunk_size)
+ChunkKey = Tuple[str, int, int]
+
+
+class ChunkCache:
+    """
+    Two tier cache for the raw parts fetched with upload.GetFile.
+    Memory tier is an LRU bounded by bytes, evicted parts are spilled
+    to the (optional) disk tier which has its own byte budget.
+    """
+    def __init__(self, memory_limit: int, disk_dir: Optional[str] = None, disk_limit: int = 0):
+        self.memory_limit = memory_limit
+        self.disk_dir = disk_dir
+        self.disk_limit = disk_limit if disk_dir else 0
+
+        self._memory: "OrderedDict[ChunkKey, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: "OrderedDict[ChunkKey, int]" = OrderedDict()  # key -> size on disk
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_limit:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.memory_limit > 0 or self.disk_limit > 0
+
+
+    async def get(self, key: ChunkKey) -> Optional[bytes]:
+        chunk, tier = await self._lookup(key)
+        self._count(tier)
+        return chunk
+
+
+    async def find(self, unique_id: str, offset: int, limit: int, max_chunk: int) -> Optional[bytes]:
+        """
+        Get a part, or slice it out of a larger cached part that contains it
+        (parts are power of two sized and aligned to their own size)
+        """
+        size = limit
+        while size <= max_chunk:
+            base = offset - (offset % size)
+            chunk, tier = await self._lookup((unique_id, base, size))
+            if chunk is not None:
+                self._count(tier)
+                if size == limit:
+                    return chunk
+                return chunk[offset - base:offset - base + limit]
+            size *= 2
+
+        self._count(None)
+        return None
+
+
+    async def _lookup(self, key: ChunkKey) -> Tuple[Optional[bytes], Optional[str]]:
+        chunk = self._memory.get(key)
+        if chunk is not None:
+            self._memory.move_to_end(key)
+            return chunk, "memory"
+
+        if key in self._disk:
+            chunk = await asyncio.to_thread(self._read_disk, key)
+            if chunk is not None:
+                # a put may have evicted it from the disk tier while it was read
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                # promoting it can push other parts out of memory, they go to disk
+                for spill_key, spill_chunk in self._put_memory(key, chunk):
+                    await self._put_disk(spill_key, spill_chunk)
+                return chunk, "disk"
+            self._drop_disk(key)
+
+        return None, None
+
+
+    def _count(self, tier: Optional[str]) -> None:
+        if tier == "memory":
+            self.hits += 1
+        elif tier == "disk":
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+
+
+    async def put(self, key: ChunkKey, chunk: bytes) -> None:
+        if not chunk or not self.enabled:
+            return
+        spilled = self._put_memory(key, chunk)
+        for spill_key, spill_chunk in spilled:
+            await self._put_disk(spill_key, spill_chunk)
+
+
+    def stats(self) -> Dict[str, int]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+            "memory_items": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "disk_items": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+    def _put_memory(self, key: ChunkKey, chunk: bytes) -> list:
+        """Insert into the memory tier and return the parts pushed out of it"""
+        if len(chunk) > self.memory_limit:
+            return [(key, chunk)]
+
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key))
+        self._memory[key] = chunk
+        self._memory_bytes += len(chunk)
+
+        spilled = []
+        while self._memory_bytes > self.memory_limit:
+            old_key, old_chunk = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old_chunk)
+            spilled.append((old_key, old_chunk))
+        return spilled
+
+
+    async def _put_disk(self, key: ChunkKey, chunk: bytes) -> None:
+        if not self.disk_limit or len(chunk) > self.disk_limit:
+            self.evictions += 1
+            return
+        if key in self._disk:
+            self._disk.move_to_end(key)
+            return
+
+        try:
+            await asyncio.to_thread(self._write_disk, key, chunk)
+        except OSError as e:
+            LOGGER.error(f"ChunkCache : Failed to spill chunk to disk - {e}")
+            return
+
+        self._disk[key] = len(chunk)
+        self._disk_bytes += len(chunk)
+
+        while self._disk_bytes > self.disk_limit:
+            old_key, _ = next(iter(self._disk.items()))
+            self._drop_disk(old_key)
+            self.evictions += 1
+
+
+    def _path(self, key: ChunkKey) -> str:
+        unique_id, offset, chunk_size = key
+        return os.path.join(self.disk_dir, f"{unique_id}_{offset}_{chunk_size}.part")
+
+
+    def _read_disk(self, key: ChunkKey) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+    def _write_disk(self, key: ChunkKey, chunk: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(chunk)
+        os.replace(tmp_path, path)
+
+
+    def _drop_disk(self, key: ChunkKey) -> None:
+        size = self._disk.pop(key, None)
+        if size is None:
+            return
+        self._disk_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+    def _load_disk_index(self) -> None:
+        """Rebuild the disk tier from a previous run (oldest first)"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if not name.endswith(".part"):
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                continue
+            try:
+                unique_id, offset, chunk_size = name[:-len(".part")].rsplit("_", 2)
+                key = (unique_id, int(offset), int(chunk_size))
+                stat = os.stat(path)
+            except (ValueError, OSError):
+                continue
+            entries.append((stat.st_mtime, key, stat.st_size))
+
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+        while self._disk_bytes > self.disk_limit:
+            old_key, _ = next(iter(self._disk.items()))
+            self._drop_disk(old_key)
+
+        LOGGER.debug(f"ChunkCache : Loaded {len(self._disk)} chunks from disk")
+
+
+class TTLCache:
+    """
+    Size bounded LRU where every entry expires `ttl` seconds after it was stored.
+    Entries also remember when they were last read, so callers can refresh
+    only the ones that are still in use before they expire.
+    """
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [value, expires_at, last_access]
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        if entry[1] <= now:
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        entry[2] = now
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        last_access = self._data[key][2] if key in self._data else now
+        self._data[key] = [value, now + (ttl or self.ttl), last_access]
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+    def pop(self, key: Hashable) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+    def purge(self) -> int:
+        """Drop every expired entry"""
+        now = time.monotonic()
+        expired = [key for key, entry in self._data.items() if entry[1] <= now]
+        for key in expired:
+            del self._data[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+
+    def expiring(self, within: float, active_within: float) -> List[Hashable]:
+        """Keys that expire in the next `within` seconds and were read in the last `active_within` seconds"""
+        now = time.monotonic()
+        return [
+            key for key, entry in self._data.items()
+            if now < entry[1] <= now + within and entry[2] >= now - active_within
+        ]
+
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0,
+            "items": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+chunk_cache = ChunkCache(
+    memory_limit=Config.CHUNK_CACHE_SIZE * 1024 * 1024,
+    disk_dir=Config.CHUNK_CACHE_DIR,
+    disk_limit=Config.CHUNK_CACHE_DISK_SIZE * 1024 * 1024
+)
@@ -1,8 +1,23 @@
-class SpotifyError(Exception):
+from typing import Optional
+
+
+class MetadataError(Exception):
+    """A failed provider request, `status` is the HTTP status if there was a response"""
+    def __init__(self, message: str = "", status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+class SpotifyError(MetadataError):
     pass
 
-class AppleMusicError(Exception):
+class AppleMusicError(MetadataError):
+    pass
+
+class MetadataNotFound(Exception):
     pass
 
 class FileNotFound(Exception):
+    pass
+
+class RangeNotSatisfiable(Exception):
     pass
\ No newline at end of file
@@ -1,36 +1,75 @@
 import asyncio
-from typing import Callable, Awaitable, Any
+from typing import Callable, Awaitable, Any, Dict, List, Optional
+
+from bot.logger import LOGGER
 
 class AsyncQueueProcessor:
-    def __init__(self, handler: Callable[[Any], Awaitable[None]]):
-        self.queue = asyncio.Queue()
+    """
+    Runs `handler` over queued items with a pool of `workers` tasks.
+    The queue holds at most `maxsize` items so producers wait when indexing
+    falls behind.
+    """
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], workers: int = 1, maxsize: int = 0, name: str = "queue"):
+        self.queue = asyncio.Queue(maxsize)
         self.handler = handler  # the core function
-        self.processing_task = None
+        self.workers = max(1, workers)
+        self.name = name
+        self.processing_tasks: List[asyncio.Task] = []
+        self._closed = False
+
+        self.processed = 0
+        self.failed = 0
 
     def start(self):
-        if not self.processing_task or self.processing_task.done():
-            self.processing_task = asyncio.create_task(self._process())
+        self.processing_tasks = [task for task in self.processing_tasks if not task.done()]
+        while len(self.processing_tasks) < self.workers:
+            self.processing_tasks.append(asyncio.create_task(self._process()))
 
     async def _process(self):
         while True:
             item = await self.queue.get()
             if item is None:
+                self.queue.task_done()
                 break  # stop signal
             try:
                 await self.handler(item)
+                self.processed += 1
             except Exception as e:
-                print(f"Error processing item: {e}")
-            self.queue.task_done()
+                self.failed += 1
+                LOGGER.error(f"{self.name} : Error processing item - {e}", exc_info=True)
+            finally:
+                self.queue.task_done()
 
     async def add_item(self, item: Any):
-        await self.queue.put(item)
+        if self._closed:
+            LOGGER.warning(f"{self.name} : Dropping item added after shutdown")
+            return
         self.start()
+        await self.queue.put(item)  # waits while the queue is full
 
     async def add_items(self, items: list[Any]):
         for item in items:
             await self.add_item(item)
 
-    async def stop(self):
-        await self.queue.put(None)
-        if self.processing_task:
-            await self.processing_task
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queue.qsize(),
+            "workers": len([task for task in self.processing_tasks if not task.done()]),
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Stop taking items, let the workers drain the queue and exit"""
+        self._closed = True
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            LOGGER.warning(f"{self.name} : {self.queue.qsize()} items left undrained after {timeout}s")
+            for task in self.processing_tasks:
+                task.cancel()
+        else:
+            for _ in self.processing_tasks:
+                await self.queue.put(None)
+        await asyncio.gather(*self.processing_tasks, return_exceptions=True)
+        self.processing_tasks = []
@@ -0,0 +1,169 @@
+import heapq
+import asyncio
+import itertools
+
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Dict, Hashable, List, Optional, Tuple
+
+
+class Priority(IntEnum):
+    PLAYBACK = 0  # a listener is waiting on these bytes
+    BULK = 1      # full downloads
+    PREFETCH = 2  # background work (prefetch, hot track store)
+
+
+class FairScheduler:
+    """
+    Admission control for the GetFile calls of one bot.
+    At most `bot_budget` bytes are in flight for the bot and `client_budget`
+    bytes per client. Waiting calls are served by priority class first and
+    by weighted fair queuing (virtual finish time per client) inside a class,
+    so one client with many downloads cannot starve the others. A waiting
+    call acquired with a `key` can be promoted when a caller with a higher
+    priority ends up waiting on it (a shared GetFile).
+    """
+    def __init__(self, bot_budget: int, client_budget: int):
+        self.bot_budget = bot_budget
+        self.client_budget = client_budget
+
+        self._inflight = 0
+        self._client_inflight: Dict[str, int] = {}
+        self._client_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._waiters: List[Tuple[int, float, int, str, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._keyed: Dict[Hashable, asyncio.Future] = {}  # key -> future of its waiting call
+
+        self.admitted = 0
+        self.queued = 0
+        self.cancelled = 0
+        self.promoted = 0
+
+
+    @asynccontextmanager
+    async def slot(self, client: str, priority: Priority, size: int, key: Optional[Hashable] = None):
+        client = await self.acquire(client, priority, size, key)
+        try:
+            yield
+        finally:
+            self.release(client, size)
+
+
+    async def acquire(self, client: str, priority: Priority, size: int, key: Optional[Hashable] = None) -> str:
+        """Wait for room for `size` bytes, returns the client the call was admitted for"""
+        finish = max(self._virtual_time, self._client_finish.get(client, 0.0)) + size
+        self._client_finish[client] = finish
+
+        if not self._waiters and self._can_admit(client, size):
+            self._admit(client, size, finish)
+            return client
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), finish, next(self._sequence), client, size, future))
+        if key is not None:
+            self._keyed[key] = future
+        self.queued += 1
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(future.result(), size)  # admitted right before being cancelled
+            else:
+                self._waiters = [w for w in self._waiters if w[5] is not future]
+                heapq.heapify(self._waiters)
+                self.cancelled += 1
+            raise
+        finally:
+            if key is not None and self._keyed.get(key) is future:
+                del self._keyed[key]
+
+
+    def promote(self, key: Hashable, client: str, priority: Priority) -> bool:
+        """
+        Move the waiting call of `key` up to `priority`, charged to `client`
+        from now on. False if it is admitted already or waits at that
+        priority or higher.
+        """
+        future = self._keyed.get(key)
+        if future is None or future.done():
+            return False
+        for index, waiter in enumerate(self._waiters):
+            if waiter[5] is future:
+                break
+        else:
+            return False
+        if waiter[0] <= priority:
+            return False
+
+        _, _, sequence, old_client, size, _ = waiter
+        finish = max(self._virtual_time, self._client_finish.get(client, 0.0)) + size
+        self._client_finish[client] = finish
+        self._waiters[index] = (int(priority), finish, sequence, client, size, future)
+        heapq.heapify(self._waiters)
+        if old_client not in self._client_inflight and not any(w[3] == old_client for w in self._waiters):
+            self._client_finish.pop(old_client, None)
+        self.promoted += 1
+        self._dispatch()
+        return True
+
+
+    def release(self, client: str, size: int) -> None:
+        self._inflight -= size
+        remaining = self._client_inflight.get(client, 0) - size
+        if remaining > 0:
+            self._client_inflight[client] = remaining
+        else:
+            self._client_inflight.pop(client, None)
+            if not any(w[3] == client for w in self._waiters):
+                self._client_finish.pop(client, None)
+        self._dispatch()
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inflight_bytes": self._inflight,
+            "waiting": len(self._waiters),
+            "clients": len(self._client_inflight),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "cancelled": self.cancelled,
+            "promoted": self.promoted,
+        }
+
+
+    def _can_admit(self, client: str, size: int) -> bool:
+        # a single call bigger than a budget is still let through when nothing is in flight
+        client_inflight = self._client_inflight.get(client, 0)
+        if client_inflight and client_inflight + size > self.client_budget:
+            return False
+        return not self._inflight or self._inflight + size <= self.bot_budget
+
+
+    def _admit(self, client: str, size: int, finish: float) -> None:
+        self._inflight += size
+        self._client_inflight[client] = self._client_inflight.get(client, 0) + size
+        self._virtual_time = max(self._virtual_time, finish - size)
+        self.admitted += 1
+
+
+    def _dispatch(self) -> None:
+        """Admit waiters in (priority, finish) order, skipping clients over their own budget"""
+        blocked = []
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            _, finish, _, client, size, future = waiter
+            if future.done():
+                continue
+            if not self._can_admit(client, size):
+                if self._inflight and self._inflight + size > self.bot_budget:
+                    heapq.heappush(self._waiters, waiter)
+                    break  # the bot is full, keep the order for the next release
+                blocked.append(waiter)
+                continue
+            self._admit(client, size, finish)
+            future.set_result(client)
+
+        for waiter in blocked:
+            heapq.heappush(self._waiters, waiter)
@@ -0,0 +1,251 @@
+import struct
+
+from typing import Awaitable, Callable, List, Optional
+
+
+# (start, end) inclusive -> bytes
+Reader = Callable[[int, int], Awaitable[bytes]]
+
+MP3_BITRATES = {
+    # (version is MPEG1, layer) -> kbps by index
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def parse_mp3_header(data: bytes, pos: int) -> Optional[dict]:
+    """Parse the 4 byte MPEG audio frame header at `pos`"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    version = (b1 >> 3) & 0x03  # 3 = MPEG1, 2 = MPEG2, 0 = MPEG2.5
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+    mono = (b3 >> 6) == 3
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "samples": samples,
+        "mono": mono,
+        "length": length,
+    }
+
+
+def find_mp3_frame(data: bytes, start: int = 0) -> Optional[int]:
+    """Offset of the first frame header in `data` that is followed by another valid frame"""
+    pos = data.find(b"\xff", start)
+    while pos != -1 and pos + 4 <= len(data):
+        header = parse_mp3_header(data, pos)
+        if header and header["length"] > 4:
+            following = pos + header["length"]
+            if following + 4 > len(data) or parse_mp3_header(data, following):
+                return pos
+        pos = data.find(b"\xff", pos + 1)
+    return None
+
+
+def _crc8(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def _flac_frame_header_length(data: bytes, pos: int) -> Optional[int]:
+    """Length of the FLAC frame header at `pos` (including CRC-8) if it is valid"""
+    if pos + 6 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xFE) != 0xF8:
+        return None
+    block_code, rate_code = data[pos + 2] >> 4, data[pos + 2] & 0x0F
+    channels, sample_size = data[pos + 3] >> 4, (data[pos + 3] >> 1) & 0x07
+    if block_code == 0 or rate_code == 15 or channels > 10 or sample_size in (3, 7) or data[pos + 3] & 0x01:
+        return None
+
+    # UTF-8 style coded frame/sample number
+    first = data[pos + 4]
+    leading_ones = 0
+    while leading_ones < 8 and first & (0x80 >> leading_ones):
+        leading_ones += 1
+    if leading_ones == 1 or leading_ones > 7:
+        return None
+    extra = max(0, leading_ones - 1)
+
+    length = 5 + extra
+    length += {6: 1, 7: 2}.get(block_code, 0)
+    length += {12: 1, 13: 2, 14: 2}.get(rate_code, 0)
+    if pos + length + 1 > len(data):
+        return None
+    if _crc8(data[pos:pos + length]) != data[pos + length]:
+        return None
+    return length + 1
+
+
+def find_flac_frame(data: bytes, start: int = 0) -> Optional[int]:
+    """Offset of the first FLAC frame header (sync code + valid CRC-8) in `data`"""
+    pos = data.find(b"\xff", start)
+    while pos != -1:
+        if _flac_frame_header_length(data, pos):
+            return pos
+        pos = data.find(b"\xff", pos + 1)
+    return None
+
+
+def find_frame_start(data: bytes, audio_format: str) -> Optional[int]:
+    if audio_format == "flac":
+        return find_flac_frame(data)
+    return find_mp3_frame(data)
+
+
+async def build_seek_index(read: Reader, file_size: int) -> Optional[dict]:
+    """
+    Build a compact time -> byte index for an MP3 or FLAC file.
+    Uses the FLAC SEEKTABLE or the MP3 Xing/VBRI TOC, falling back to a
+    linear map for CBR files. Only the headers are read, big metadata
+    (cover art) is skipped without downloading it.
+    """
+    head = await read(0, min(file_size, 64 * 1024) - 1)
+    offset = 0
+    if head[:3] == b"ID3" and len(head) >= 10:
+        size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        offset = 10 + size + (10 if head[5] & 0x10 else 0)
+        head = await read(offset, min(file_size, offset + 64 * 1024) - 1)
+
+    if head[:4] == b"fLaC":
+        return await _flac_index(read, file_size, offset)
+    return _mp3_index(head, offset, file_size)
+
+
+async def _flac_index(read: Reader, file_size: int, offset: int) -> Optional[dict]:
+    position = offset + 4
+    sample_rate = total_samples = 0
+    seek_points = []
+    while position + 4 <= file_size:
+        block_header = await read(position, position + 3)
+        last = block_header[0] & 0x80
+        block_type = block_header[0] & 0x7F
+        length = int.from_bytes(block_header[1:4], "big")
+        body_start = position + 4
+
+        if block_type == 0:  # STREAMINFO
+            info = await read(body_start, body_start + length - 1)
+            packed = int.from_bytes(info[10:18], "big")
+            sample_rate = packed >> 44
+            total_samples = packed & 0xFFFFFFFFF
+        elif block_type == 3:  # SEEKTABLE
+            table = await read(body_start, body_start + length - 1)
+            for i in range(0, len(table) - 17, 18):
+                sample, byte_offset, _ = struct.unpack(">QQH", table[i:i + 18])
+                if sample != 0xFFFFFFFFFFFFFFFF:
+                    seek_points.append((sample, byte_offset))
+
+        position = body_start + length
+        if last:
+            break
+
+    if not sample_rate:
+        return None
+
+    audio_start = position
+    duration = total_samples / sample_rate if total_samples else None
+    points = [[round(sample / sample_rate, 3), audio_start + byte_offset] for sample, byte_offset in seek_points]
+    if not points or points[0][0] != 0:
+        points.insert(0, [0, audio_start])
+    if duration:
+        points.append([round(duration, 3), file_size])
+    return {"format": "flac", "duration": duration, "audio_start": audio_start, "points": points}
+
+
+def _mp3_index(head: bytes, offset: int, file_size: int) -> Optional[dict]:
+    frame_pos = find_mp3_frame(head)
+    if frame_pos is None:
+        return None
+    header = parse_mp3_header(head, frame_pos)
+    audio_start = offset + frame_pos
+    audio_bytes = file_size - audio_start
+
+    if header["mpeg1"]:
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+
+    xing_pos = frame_pos + 4 + side_info
+    if head[xing_pos:xing_pos + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(head[xing_pos + 4:xing_pos + 8], "big")
+        pos = xing_pos + 8
+        frames = toc = None
+        if flags & 0x1:
+            frames = int.from_bytes(head[pos:pos + 4], "big")
+            pos += 4
+        if flags & 0x2:
+            audio_bytes = int.from_bytes(head[pos:pos + 4], "big") or audio_bytes
+            pos += 4
+        if flags & 0x4:
+            toc = head[pos:pos + 100]
+        if frames:
+            duration = frames * header["samples"] / header["sample_rate"]
+            points = [[0, audio_start]]
+            if toc and len(toc) == 100:
+                points = [[round(duration * i / 100, 3), audio_start + toc[i] * audio_bytes // 256] for i in range(100)]
+            points.append([round(duration, 3), audio_start + audio_bytes])
+            return {"format": "mp3", "duration": duration, "audio_start": audio_start, "points": points}
+
+    vbri_pos = frame_pos + 4 + 32
+    if head[vbri_pos:vbri_pos + 4] == b"VBRI":
+        (_, _, _, vbri_bytes, frames, entries, scale, entry_size, frames_per_entry) = struct.unpack(
+            ">HHHIIHHHH", head[vbri_pos + 4:vbri_pos + 26]
+        )
+        duration = frames * header["samples"] / header["sample_rate"]
+        points = [[0, audio_start]]
+        position = audio_start
+        table = head[vbri_pos + 26:vbri_pos + 26 + entries * entry_size]
+        for i in range(len(table) // entry_size):
+            position += int.from_bytes(table[i * entry_size:(i + 1) * entry_size], "big") * scale
+            seconds = (i + 1) * frames_per_entry * header["samples"] / header["sample_rate"]
+            points.append([round(min(seconds, duration), 3), min(position, file_size)])
+        return {"format": "mp3", "duration": duration, "audio_start": audio_start, "points": points}
+
+    # CBR, bytes grow linearly with time
+    duration = audio_bytes * 8 / header["bitrate"]
+    return {
+        "format": "mp3",
+        "duration": duration,
+        "audio_start": audio_start,
+        "points": [[0, audio_start], [round(duration, 3), file_size]],
+    }
+
+
+def seek_offset(index: dict, seconds: float) -> int:
+    """Approximate byte offset for a time, interpolated between the index points"""
+    points: List[list] = index["points"]
+    if seconds <= points[0][0]:
+        return points[0][1]
+    for (t0, b0), (t1, b1) in zip(points, points[1:]):
+        if t0 <= seconds <= t1:
+            if t1 == t0:
+                return b0
+            return int(b0 + (b1 - b0) * (seconds - t0) / (t1 - t0))
+    return points[-1][1]
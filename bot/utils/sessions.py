@@ -0,0 +1,183 @@
+import asyncio
+import random
+
+from pyrogram import Client, raw
+from pyrogram.errors import AuthBytesInvalid
+from pyrogram.session import Session, Auth
+from typing import Dict, List, Optional
+
+from bot.logger import LOGGER
+
+
+class MediaSessionManager:
+    """
+    Pools of media sessions per DC for a single client.
+    Sessions are created lazily (or pre-warmed at startup), handed out
+    round-robin and pinged periodically so dead ones get replaced.
+    """
+    def __init__(self, client: Client, pool_size: int = 1, keepalive: int = 0):
+        self.client = client
+        self.pool_size = max(1, pool_size)
+        self.keepalive = keepalive
+
+        self._pools: Dict[int, List[Session]] = {}
+        self._cursor: Dict[int, int] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._growing: Dict[int, asyncio.Task] = {}
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self.reconnects = 0
+
+
+    def has_session(self, dc_id: int) -> bool:
+        return bool(self._pools.get(dc_id))
+
+
+    async def get(self, dc_id: int) -> Session:
+        """Get a media session for the DC, creating the first one if needed"""
+        pool = self._pools.get(dc_id)
+        if not pool:
+            async with self._lock(dc_id):
+                pool = self._pools.get(dc_id)
+                if not pool:
+                    pool = self._pools[dc_id] = [await self._create_session(dc_id)]
+                    self.client.media_sessions[dc_id] = pool[0]
+
+        if len(pool) < self.pool_size:
+            self._grow(dc_id)
+
+        cursor = self._cursor.get(dc_id, 0)
+        self._cursor[dc_id] = cursor + 1
+        return pool[cursor % len(pool)]
+
+
+    async def prewarm(self) -> None:
+        """Fill the pools for every DC ahead of the first listener"""
+        test_mode = await self.client.storage.test_mode()
+        dc_ids = (1, 2, 3) if test_mode else (1, 2, 3, 4, 5)
+        results = await asyncio.gather(*(self._fill(dc_id) for dc_id in dc_ids), return_exceptions=True)
+        for dc_id, result in zip(dc_ids, results):
+            if isinstance(result, Exception):
+                LOGGER.warning(f"Failed to pre-warm media session for DC {dc_id} - {result}")
+        LOGGER.info(f"Pre-warmed media sessions for DCs {[dc for dc in dc_ids if self.has_session(dc)]}")
+
+
+    def start(self) -> None:
+        if self.keepalive and (not self._keepalive_task or self._keepalive_task.done()):
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+
+    async def stop(self) -> None:
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+        for task in self._growing.values():
+            task.cancel()
+
+        sessions = [session for pool in self._pools.values() for session in pool]
+        for dc_id in self._pools:
+            self.client.media_sessions.pop(dc_id, None)
+        self._pools.clear()
+        await asyncio.gather(*(session.stop() for session in sessions), return_exceptions=True)
+
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "sessions": {dc_id: len(pool) for dc_id, pool in self._pools.items()},
+            "reconnects": self.reconnects,
+        }
+
+
+    def _lock(self, dc_id: int) -> asyncio.Lock:
+        if dc_id not in self._locks:
+            self._locks[dc_id] = asyncio.Lock()
+        return self._locks[dc_id]
+
+
+    def _grow(self, dc_id: int) -> None:
+        """Add one more session to the pool in the background"""
+        task = self._growing.get(dc_id)
+        if task and not task.done():
+            return
+
+        async def grow():
+            try:
+                session = await self._create_session(dc_id)
+            except Exception as e:
+                LOGGER.warning(f"Failed to grow media session pool for DC {dc_id} - {e}")
+                return
+            self._pools.setdefault(dc_id, []).append(session)
+
+        self._growing[dc_id] = asyncio.create_task(grow())
+
+
+    async def _fill(self, dc_id: int) -> None:
+        await self.get(dc_id)
+        while len(self._pools[dc_id]) < self.pool_size:
+            self._pools[dc_id].append(await self._create_session(dc_id))
+
+
+    async def _create_session(self, dc_id: int) -> Session:
+        client = self.client
+        if dc_id != await client.storage.dc_id():
+            media_session = Session(client,
+                                    dc_id,
+                                    await Auth(client, dc_id, await client.storage.test_mode()).create(),
+                                    await client.storage.test_mode(),
+                                    is_media=True)
+            await media_session.start()
+            for _ in range(6):
+                exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+                try:
+                    await media_session.send(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
+                    break
+                except AuthBytesInvalid:
+                    LOGGER.debug(f'Invalid authorization bytes for DC {dc_id}!')
+                    continue
+            else:
+                await media_session.stop()
+                raise AuthBytesInvalid
+        else:
+            media_session = Session(client,
+                                    dc_id,
+                                    await client.storage.auth_key(),
+                                    await client.storage.test_mode(),
+                                    is_media=True)
+            await media_session.start()
+        LOGGER.debug(f"Created media session for DC {dc_id}")
+        return media_session
+
+
+    async def _keepalive_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive)
+            for dc_id, pool in list(self._pools.items()):
+                for session in list(pool):
+                    try:
+                        await session.send(raw.functions.Ping(ping_id=random.getrandbits(63)), timeout=10)
+                    except Exception as e:
+                        LOGGER.warning(f"Media session for DC {dc_id} is unresponsive, reconnecting - {e}")
+                        await self._replace(dc_id, session)
+
+
+    async def _replace(self, dc_id: int, session: Session) -> None:
+        try:
+            await session.stop()
+        except Exception:
+            pass
+        try:
+            fresh = await self._create_session(dc_id)
+        except Exception as e:
+            LOGGER.error(f"Failed to reconnect media session for DC {dc_id} - {e}")
+            if session in self._pools.get(dc_id, []):
+                self._pools[dc_id].remove(session)
+            if self.client.media_sessions.get(dc_id) is session:
+                self.client.media_sessions.pop(dc_id)
+            return
+
+        pool = self._pools.get(dc_id, [])
+        if session in pool:
+            pool[pool.index(session)] = fresh
+        else:
+            pool.append(fresh)
+        if self.client.media_sessions.get(dc_id) is session:
+            self.client.media_sessions[dc_id] = fresh
+        self.reconnects += 1
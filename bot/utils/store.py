@@ -0,0 +1,210 @@
+import os
+import time
+import asyncio
+
+from collections import OrderedDict
+from typing import AsyncGenerator, BinaryIO, Dict, Optional
+
+from pyrogram.file_id import FileId
+
+from config import Config
+from bot.logger import LOGGER
+
+from .cache import TTLCache
+from .streamer import plan_parts
+from .scheduler import Priority
+
+
+class TrackStore:
+    """
+    Full local copies of the most played tracks.
+    A track is copied in the background once it was started `play_threshold`
+    times within `play_window` seconds, copies are evicted LRU once the
+    store grows past `size_limit` bytes.
+    """
+    def __init__(self, directory: Optional[str], size_limit: int, play_threshold: int, play_window: int):
+        self.directory = directory
+        self.size_limit = size_limit if directory else 0
+        self.play_threshold = max(1, play_threshold)
+        self.play_window = play_window
+
+        self._files: "OrderedDict[str, int]" = OrderedDict()  # file_unique_id -> size, LRU
+        self._bytes = 0
+        self._plays = TTLCache(maxsize=10000, ttl=play_window)  # file_unique_id -> (first play, plays)
+        self._filling: Dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.fills = 0
+        self.evictions = 0
+
+        if self.size_limit:
+            os.makedirs(self.directory, exist_ok=True)
+            self._load_index()
+
+
+    @property
+    def enabled(self) -> bool:
+        return self.size_limit > 0
+
+
+    def contains(self, unique_id: Optional[str]) -> bool:
+        return bool(unique_id) and unique_id in self._files
+
+
+    def open_track(self, unique_id: Optional[str]) -> Optional[BinaryIO]:
+        """
+        Open the local copy of a track, if stored. The open file keeps the
+        data readable even if the copy is evicted while it is being served.
+        """
+        if not self.contains(unique_id):
+            return None
+        try:
+            f = open(self._path(unique_id), "rb")
+        except OSError:
+            return None
+        self._files.move_to_end(unique_id)
+        self.hits += 1
+        return f
+
+
+    def record_play(self, unique_id: Optional[str], bot, file_id: FileId, file_size: int, stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+        """
+        Count a play of `stream` (served from the first byte). Once the track
+        is hot enough, it is copied when the stream ends, so the parts the
+        listener just fetched are read back from the chunk cache instead of
+        being downloaded a second time.
+        """
+        if not self.enabled or not unique_id or unique_id in self._files or unique_id in self._filling:
+            return stream
+        if not file_size or file_size > self.size_limit:
+            return stream
+
+        # the window starts at the first play and does not move with later ones
+        now = time.monotonic()
+        first_play, plays = self._plays.get(unique_id) or (now, 0)
+        plays += 1
+        if plays < self.play_threshold:
+            self._plays.set(unique_id, (first_play, plays), ttl=max(first_play + self.play_window - now, 0.001))
+            return stream
+
+        self._plays.pop(unique_id)
+        return self._fill_after(stream, unique_id, bot, file_id, file_size)
+
+
+    async def _fill_after(self, stream: AsyncGenerator[bytes, None], unique_id: str, bot, file_id: FileId, file_size: int) -> AsyncGenerator[bytes, None]:
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            if unique_id not in self._files and unique_id not in self._filling:
+                self._filling[unique_id] = asyncio.create_task(self._fill(unique_id, bot, file_id, file_size))
+
+
+    async def stop(self) -> None:
+        for task in self._filling.values():
+            task.cancel()
+        await asyncio.gather(*self._filling.values(), return_exceptions=True)
+
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "fills": self.fills,
+            "evictions": self.evictions,
+            "filling": len(self._filling),
+            "items": len(self._files),
+            "bytes": self._bytes,
+        }
+
+
+    def _path(self, unique_id: str) -> str:
+        return os.path.join(self.directory, f"{unique_id}.track")
+
+
+    async def _fill(self, unique_id: str, bot, file_id: FileId, file_size: int) -> None:
+        path = self._path(unique_id)
+        tmp_path = f"{path}.tmp"
+        written = 0
+        try:
+            # the same parts a listener playing from the start asks for, so the ones
+            # still in the chunk cache are reused, only the rest is downloaded
+            parts, first_part_cut, last_part_cut = plan_parts(0, file_size - 1, Config.STREAM_MIN_CHUNK * 1024, Config.STREAM_MAX_CHUNK * 1024)
+            with open(tmp_path, "wb") as f:
+                async for chunk in bot.bytestreamer.yield_file(file_id, 0, parts, first_part_cut, last_part_cut, "track-store", Priority.PREFETCH):
+                    await asyncio.to_thread(f.write, chunk)
+                    written += len(chunk)
+
+            if written != file_size:
+                raise IOError(f"expected {file_size} bytes, got {written}")
+            os.replace(tmp_path, path)
+        except asyncio.CancelledError:
+            self._remove(tmp_path)
+            raise
+        except Exception as e:
+            LOGGER.error(f"TrackStore : Failed to store track {unique_id} - {e}")
+            self._remove(tmp_path)
+            return
+        finally:
+            self._filling.pop(unique_id, None)
+
+        self._files[unique_id] = written
+        self._bytes += written
+        self.fills += 1
+        LOGGER.info(f"TrackStore : Stored hot track {unique_id} ({written} bytes)")
+        self._evict()
+
+
+    def _evict(self) -> None:
+        while self._bytes > self.size_limit and self._files:
+            unique_id, size = self._files.popitem(last=False)
+            self._bytes -= size
+            self._remove(self._path(unique_id))
+            self.evictions += 1
+
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+    def _load_index(self) -> None:
+        """Pick up copies from a previous run (least recently used first)"""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                self._remove(path)
+            elif name.endswith(".track"):
+                stat = os.stat(path)
+                entries.append((stat.st_atime, name[:-len(".track")], stat.st_size))
+
+        for _, unique_id, size in sorted(entries):
+            self._files[unique_id] = size
+            self._bytes += size
+        self._evict()
+        LOGGER.debug(f"TrackStore : Loaded {len(self._files)} stored tracks")
+
+
+async def iter_file_range(f: BinaryIO, start_byte: int, end_byte: int, chunk_size: int = 256 * 1024) -> AsyncGenerator[bytes, None]:
+    """Yield an inclusive byte range of an open local file, reading off the event loop, and close it"""
+    try:
+        position = start_byte
+        while position <= end_byte:
+            chunk = await asyncio.to_thread(os.pread, f.fileno(), min(chunk_size, end_byte + 1 - position), position)
+            if not chunk:
+                break
+            yield chunk
+            position += len(chunk)
+    finally:
+        f.close()
+
+
+track_store = TrackStore(
+    directory=Config.TRACK_STORE_DIR,
+    size_limit=Config.TRACK_STORE_SIZE * 1024 * 1024,
+    play_threshold=Config.TRACK_STORE_PLAYS,
+    play_window=Config.TRACK_STORE_WINDOW
+)
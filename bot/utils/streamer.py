@@ -1,15 +1,79 @@
+import time
 import asyncio
 
-from pyrogram.errors import AuthBytesInvalid
+from collections import deque
+from pyrogram.errors import FileReferenceExpired, FloodWait
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
-from pyrogram.session import Session, Auth
-from typing import Dict, Union, AsyncGenerator, Optional
+from pyrogram.session import Session
+from typing import Deque, Dict, List, Tuple, Union, AsyncGenerator, Optional
 from .errors import FileNotFound
+from .cache import chunk_cache, TTLCache
+from .singleflight import SingleFlight
+from .sessions import MediaSessionManager
+from .scheduler import FairScheduler, Priority
 from pyrogram import Client, utils, raw
 
+from config import Config
 from bot.logger import LOGGER
 
 
+# shared by every bot, parts are identified by file_unique_id
+chunk_flights = SingleFlight()
+# cache key -> scheduler of the bot running that shared GetFile
+chunk_flight_schedulers: Dict[tuple, FairScheduler] = {}
+
+
+def consume_task_exception(task: asyncio.Task) -> None:
+    """Retrieve the exception of read-ahead tasks that were never awaited"""
+    if not task.cancelled():
+        task.exception()
+
+
+def cut_chunk(chunk: bytes, current_part: int, part_count: int, first_part_cut: int, last_part_cut: int) -> bytes:
+    """Trim a part to the requested byte range"""
+    if part_count == 1:
+        return chunk[first_part_cut:last_part_cut]
+    elif current_part == 1:
+        return chunk[first_part_cut:]
+    elif current_part == part_count:
+        return chunk[:last_part_cut]
+    return chunk
+
+
+def plan_parts(start_byte: int, end_byte: int, min_chunk: int, max_chunk: int) -> Tuple[List[Tuple[int, int]], int, int]:
+    """
+    Split an inclusive byte range into GetFile parts -> (parts, first_part_cut, last_part_cut)
+    where parts is a list of (offset, limit).
+
+    The first part is `min_chunk` so the first byte arrives quickly, later
+    parts double up to `max_chunk` for long sequential reads. Every limit is
+    a power of two and every offset a multiple of its limit, which keeps
+    Telegram's rules (4 KiB divisible offset/limit, limit divides 1 MiB,
+    no part crosses a 1 MiB boundary).
+    """
+    size = min_chunk
+    offset = start_byte - (start_byte % size)
+    first_part_cut = start_byte - offset
+
+    parts = []
+    while offset <= end_byte:
+        parts.append((offset, size))
+        offset += size
+
+        remaining = end_byte - offset + 1
+        next_size = min(size * 2, max_chunk)
+        # do not fetch a bigger part than what is left of the range
+        while next_size > size and next_size // 2 >= remaining:
+            next_size //= 2
+        while offset % next_size:
+            next_size //= 2
+        size = next_size
+
+    last_offset = parts[-1][0]
+    last_part_cut = end_byte - last_offset + 1
+    return parts, first_part_cut, last_part_cut
+
+
 def is_media(message):
     return next((getattr(message, attr) for attr in ["document", "photo", "video", "audio", "voice", "video_note", "sticker", "animation"] if getattr(message, attr)), None)
 
@@ -26,6 +90,7 @@ async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optiona
     setattr(file_id, 'file_size', getattr(media, 'file_size', 0))
     setattr(file_id, 'mime_type', getattr(media, 'mime_type', ''))
     setattr(file_id, 'unique_id', file_unique_id)
+    setattr(file_id, 'msg_key', (chat_id, message_id))
     return file_id
 
 
@@ -34,118 +99,190 @@ class ByteStreamer:
         self.bot = bot
         self.client: Client = bot.client
 
-        self.clean_timer = 30 * 60
-        self.__cached_file_ids: Dict[int, FileId] = {}
-        self.__file_properties_cache: Dict[tuple, FileId] = {}  # Manual cache
+        self.file_id_cache = TTLCache(maxsize=Config.FILE_ID_CACHE_SIZE, ttl=Config.FILE_ID_CACHE_TTL)
+        self.property_flights = SingleFlight()
+        self.file_reference_renewals = 0
+        self.scheduler = FairScheduler(
+            bot_budget=Config.BOT_INFLIGHT_BUDGET * 1024 * 1024, client_budget=Config.CLIENT_INFLIGHT_BUDGET * 1024 * 1024
+        )
+        self.media_sessions = MediaSessionManager(
+            self.client, pool_size=Config.MEDIA_SESSIONS_PER_DC, keepalive=Config.MEDIA_SESSION_KEEPALIVE
+        )
 
-        asyncio.create_task(self.clean_cache())
+        asyncio.create_task(self.refresh_cache())
 
     async def get_file_properties(self, chat_id: int, message_id: int) -> FileId:
-        cache_key = (chat_id, message_id)
-        if cache_key in self.__file_properties_cache:
-            return self.__file_properties_cache[cache_key]
-
-        if message_id not in self.__cached_file_ids:
-            file_id = await get_file_ids(self.client, int(chat_id), int(message_id))
-            if not file_id:
-                LOGGER.info('Message with ID %s not found!', message_id)
-                raise FileNotFound
-            self.__cached_file_ids[message_id] = file_id
-
-        file_id = self.__cached_file_ids[message_id]
-        self.__file_properties_cache[cache_key] = file_id
+        cache_key = (int(chat_id), int(message_id))
+        file_id = self.file_id_cache.get(cache_key)
+        if file_id is not None:
+            return file_id
+
+        # concurrent listeners of an uncached message share one get_messages call
+        return await self.property_flights.do(cache_key, lambda: self._resolve_file_id(cache_key))
+
+    async def _resolve_file_id(self, cache_key: tuple) -> FileId:
+        chat_id, message_id = cache_key
+        file_id = await get_file_ids(self.client, chat_id, message_id)
+        if not file_id:
+            LOGGER.info(f'Message with ID {message_id} not found!')
+            raise FileNotFound
+        self.file_id_cache.set(cache_key, file_id)
         return file_id
 
-    async def yield_file(self, file_id: FileId, index: int, offset: int, first_part_cut: int, last_part_cut: int, part_count: int, chunk_size: int) -> AsyncGenerator[bytes, None]:
-        client = self.client
+    async def yield_file(self, file_id: FileId, index: int, parts: List[Tuple[int, int]], first_part_cut: int, last_part_cut: int, client: str = "", priority: Priority = Priority.PLAYBACK) -> AsyncGenerator[bytes, None]:
+        tg_client = self.client  # `client` is the listener key of the fair scheduler
         self.bot.increment_workload()
         LOGGER.debug(f"Starting to yield file with client {index}.")
-        media_session = await self.generate_media_session(client, file_id)
+        media_session = await self.generate_media_session(tg_client, file_id)
         current_part = 1
+        part_count = len(parts)
         location = await self.get_location(file_id)
+
+        # keep up to `read_ahead` GetFile requests in flight, consumed in order
+        read_ahead = max(1, Config.STREAM_READ_AHEAD)
+        pending: Deque[asyncio.Task] = deque()
+        scheduled = 0
         try:
             while current_part <= part_count:
-                # Retry logic for handling timeouts
-                max_retries = 3
-                retry_count = 0
-                retry_delay = 1  # Initial delay in seconds
-                
-                while True:
-                    try:
-                        r = await media_session.send(raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size))
-                        break  # Success - exit retry loop
-                    except TimeoutError:
-                        retry_count += 1
-                        if retry_count > max_retries:
-                            LOGGER.error(f"Request timed out after {max_retries} retries at offset {offset}")
-                            raise  # Re-raise if we've exhausted retries
-                        
-                        LOGGER.warning(f"Request timed out, retrying ({retry_count}/{max_retries}) at offset {offset}")
-                        await asyncio.sleep(retry_delay)
-                        retry_delay *= 2  # Exponential backoff
-                
-                if isinstance(r, raw.types.upload.File):
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    if part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
-
-                    current_part += 1
-                    offset += chunk_size
-                    LOGGER.debug(f"Yielded part {current_part-1}/{part_count}, offset {offset}")
-                else:
-                    LOGGER.error("Unexpected response type from Telegram")
+                while len(pending) < read_ahead and scheduled < part_count:
+                    part_offset, part_size = parts[scheduled]
+                    task = asyncio.create_task(
+                        self.get_chunk(file_id, media_session, location, part_offset, part_size, client, priority))
+                    task.add_done_callback(consume_task_exception)
+                    pending.append(task)
+                    scheduled += 1
+
+                chunk = await pending.popleft()
+                if not chunk:
                     break
+                yield cut_chunk(chunk, current_part, part_count, first_part_cut, last_part_cut)
+
+                LOGGER.debug(f"Yielded part {current_part}/{part_count}, offset {parts[current_part - 1][0]}")
+                current_part += 1
         except Exception as e:
             LOGGER.error(f"Error while streaming file: {e}")
             raise
         finally:
+            for task in pending:
+                task.cancel()
             LOGGER.debug(f"Finished yielding file with {current_part-1} parts.")
             self.bot.decrement_workload()
 
 
-    async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
-        media_session = client.media_sessions.get(file_id.dc_id, None)
-        if (media_session is None):
-            if file_id.dc_id != await client.storage.dc_id():
-                media_session = Session(client,
-                                        file_id.dc_id,
-                                        await Auth(client, file_id.dc_id, await client.storage.test_mode()).create(),
-                                        await client.storage.test_mode(),
-                                        is_media=True)
-                await media_session.start()
-                for _ in range(6):
-                    exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id))
-                    try:
-                        await media_session.send(raw.functions.auth.ImportAuthorization(id=exported_auth.id, bytes=exported_auth.bytes))
-                        break
-                    except AuthBytesInvalid:
-                        LOGGER.debug(
-                            'Invalid authorization bytes for DC %s!', file_id.dc_id)
-                        continue
-                else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
+    async def read_range(self, file_id: FileId, start_byte: int, end_byte: int, client: str = "", priority: Priority = Priority.PLAYBACK) -> bytes:
+        """Read a small inclusive byte range into memory, through the chunk cache"""
+        parts, first_part_cut, last_part_cut = plan_parts(start_byte, end_byte, Config.STREAM_MIN_CHUNK * 1024, Config.STREAM_MAX_CHUNK * 1024)
+        return b"".join([chunk async for chunk in self.yield_file(file_id, 0, parts, first_part_cut, last_part_cut, client, priority)])
+
+
+    async def get_chunk(self, file_id: FileId, media_session: Session, location, offset: int, chunk_size: int, client: str = "", priority: Priority = Priority.PLAYBACK) -> bytes:
+        """Get a single part of the file, from the chunk cache if possible"""
+        cache_key = (file_id.unique_id, offset, chunk_size) if file_id.unique_id else None
+        if not cache_key:
+            return await self._fetch(file_id, media_session, location, offset, chunk_size, client, priority)
+
+        chunk = await chunk_cache.find(file_id.unique_id, offset, chunk_size, Config.STREAM_MAX_CHUNK * 1024)
+        if chunk is not None:
+            return chunk
+
+        # concurrent streams of the same part (even on other bots) share one GetFile,
+        # started by a background call it still waits at the caller's priority
+        scheduler = chunk_flight_schedulers.get(cache_key)
+        if scheduler:
+            scheduler.promote(cache_key, client, priority)
+        return await chunk_flights.do(
+            cache_key, lambda: self._fetch_and_cache(cache_key, file_id, media_session, location, offset, chunk_size, client, priority)
+        )
+
+
+    async def _fetch_and_cache(self, cache_key, file_id: FileId, media_session: Session, location, offset: int, chunk_size: int, client: str, priority: Priority) -> bytes:
+        chunk_flight_schedulers[cache_key] = self.scheduler
+        try:
+            chunk = await self._fetch(file_id, media_session, location, offset, chunk_size, client, priority, cache_key)
+        finally:
+            chunk_flight_schedulers.pop(cache_key, None)
+        await chunk_cache.put(cache_key, chunk)
+        return chunk
+
+
+    async def _fetch(self, file_id: FileId, media_session: Session, location, offset: int, chunk_size: int, client: str = "", priority: Priority = Priority.PLAYBACK, flight_key: Optional[tuple] = None) -> bytes:
+        """fetch_chunk behind the fair scheduler, recovering once from an expired file_reference"""
+        async with self.scheduler.slot(client, priority, chunk_size, flight_key):
+            used_reference = getattr(location, "file_reference", None)
+            self.bot.add_inflight(chunk_size)
+            started = time.monotonic()
+            try:
+                try:
+                    chunk = await self.fetch_chunk(media_session, location, offset, chunk_size)
+                except FileReferenceExpired:
+                    if not getattr(file_id, "msg_key", None):
+                        raise
+                    LOGGER.info(f"File reference expired at offset {offset}, re-resolving message {file_id.msg_key}")
+                    await self.renew_file_reference(file_id, location, used_reference)
+                    chunk = await self.fetch_chunk(media_session, location, offset, chunk_size)
+            except FloodWait as e:
+                self.bot.record_flood_wait(e.value)
+                raise
+            except Exception:
+                self.bot.record_error()
+                raise
             else:
-                media_session = Session(client,
-                                        file_id.dc_id,
-                                        await client.storage.auth_key(),
-                                        await client.storage.test_mode(),
-                                        is_media=True)
-                await media_session.start()
-            LOGGER.debug(f"Created media session for DC {file_id.dc_id}")
-            client.media_sessions[file_id.dc_id] = media_session
-        else:
-            LOGGER.debug(f"Using cached media session for DC {file_id.dc_id}")
-        return media_session
+                self.bot.record_transfer(len(chunk), time.monotonic() - started)
+                return chunk
+            finally:
+                self.bot.add_inflight(-chunk_size)
+
+
+    async def renew_file_reference(self, file_id: FileId, location, used_reference: Optional[bytes]) -> None:
+        """
+        Re-resolve the message and patch the fresh file_reference into `file_id`
+        and `location` in place, so the parts still queued by the running
+        stream pick it up without restarting the response
+        """
+        if location.file_reference != used_reference:
+            return  # another part of this stream already renewed it
+
+        cache_key = file_id.msg_key
+        self.file_id_cache.pop(cache_key)
+        fresh = await self.property_flights.do(cache_key, lambda: self._resolve_file_id(cache_key))
+        fresh_location = await self.get_location(fresh)
+
+        file_id.file_reference = fresh.file_reference
+        location.file_reference = fresh_location.file_reference
+        self.file_reference_renewals += 1
+
+
+    @staticmethod
+    async def fetch_chunk(media_session: Session, location, offset: int, chunk_size: int) -> bytes:
+        """Fetch a single part from Telegram"""
+        # Retry logic for handling timeouts
+        max_retries = 3
+        retry_count = 0
+        retry_delay = 1  # Initial delay in seconds
+
+        while True:
+            try:
+                r = await media_session.send(raw.functions.upload.GetFile(
+                    location=location, offset=offset, limit=chunk_size))
+                break  # Success - exit retry loop
+            except TimeoutError:
+                retry_count += 1
+                if retry_count > max_retries:
+                    LOGGER.error(f"Request timed out after {max_retries} retries at offset {offset}")
+                    raise  # Re-raise if we've exhausted retries
+
+                LOGGER.warning(f"Request timed out, retrying ({retry_count}/{max_retries}) at offset {offset}")
+                await asyncio.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+
+        if not isinstance(r, raw.types.upload.File):
+            LOGGER.error("Unexpected response type from Telegram")
+            return b""
+        return r.bytes
+
+
+    async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
+        return await self.media_sessions.get(file_id.dc_id)
 
     @staticmethod
     async def get_location(file_id: FileId) -> Union[raw.types.InputPhotoFileLocation, raw.types.InputDocumentFileLocation, raw.types.InputPeerPhotoFileLocation]:
@@ -176,12 +313,20 @@ class ByteStreamer:
                                                            thumb_size=file_id.thumbnail_size)
         return location
 
-    async def clean_cache(self) -> None:
+    async def refresh_cache(self) -> None:
         """
-        function to clean the cache to reduce memory usage
+        Re-resolve FileIds that are still being streamed shortly before they
+        expire, so active tracks never miss the cache all at once
         """
+        ttl = self.file_id_cache.ttl
+        interval = max(30, ttl / 10)
         while True:
-            await asyncio.sleep(self.clean_timer)
-            self.__cached_file_ids.clear()
-            self.__file_properties_cache.clear()
-            LOGGER.debug("Cleaned the cache")
\ No newline at end of file
+            await asyncio.sleep(interval)
+            self.file_id_cache.purge()
+            for cache_key in self.file_id_cache.expiring(within=interval * 2, active_within=ttl / 2):
+                try:
+                    await self.property_flights.do(cache_key, lambda: self._resolve_file_id(cache_key))
+                except Exception as e:
+                    LOGGER.debug(f"Failed to refresh file {cache_key} - {e}")
+                    self.file_id_cache.pop(cache_key)
+            LOGGER.debug(f"Refreshed the file id cache ({len(self.file_id_cache)} entries)")
@@ -0,0 +1,234 @@
+import struct
+
+from typing import Dict, List, Optional, Tuple
+
+from bot.logger import LOGGER
+
+from .seek import Reader, build_seek_index
+
+
+HEAD_SIZE = 64 * 1024      # ID3v2 text frames and FLAC metadata sit at the start
+TAIL_SIZE = 8 * 1024       # APEv2 and ID3v1 sit at the end
+MAX_TAG_SIZE = 256 * 1024  # never read more of an ID3v2 tag / vorbis comment than this
+
+# frame id -> field, ID3v2.3/2.4 and the three letter ids of ID3v2.2
+ID3_FRAMES = {
+    "TIT2": "title", "TPE1": "artist", "TALB": "album", "TSRC": "isrc", "TLEN": "length",
+    "TT2": "title", "TP1": "artist", "TAL": "album", "TRC": "isrc", "TLE": "length",
+}
+VORBIS_FIELDS = {"TITLE": "title", "ARTIST": "artist", "ALBUM": "album", "ISRC": "isrc"}
+APE_FIELDS = {"title": "title", "artist": "artist", "album": "album", "isrc": "isrc"}
+ID3_ENCODINGS = {0: "latin-1", 1: "utf-16", 2: "utf-16-be", 3: "utf-8"}
+
+
+class _RangeBuffer:
+    """Serve reads from the ranges already fetched, the parsers read overlapping bits of the head"""
+    def __init__(self, read: Reader, file_size: int):
+        self._read = read
+        self.file_size = file_size
+        self._ranges: List[Tuple[int, bytes]] = []
+
+
+    async def read(self, start: int, end: int) -> bytes:
+        end = min(end, self.file_size - 1)
+        if start > end:
+            return b""
+        for offset, data in self._ranges:
+            if offset <= start and end < offset + len(data):
+                return data[start - offset:end - offset + 1]
+        data = await self._read(start, end)
+        self._ranges.append((start, data))
+        return data
+
+
+def _syncsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _decode_text(data: bytes, encoding: int) -> Optional[str]:
+    text = data.decode(ID3_ENCODINGS.get(encoding, "latin-1"), errors="replace")
+    # multiple values are null separated, the first one is the main one
+    text = text.split("\x00")[0].strip()
+    return text or None
+
+
+def parse_id3v2(tag: bytes) -> Dict[str, str]:
+    """Text frames of an ID3v2.2/2.3/2.4 tag, `tag` may be cut short"""
+    if tag[:3] != b"ID3" or len(tag) < 10:
+        return {}
+    version, flags = tag[3], tag[5]
+    size = _syncsafe(tag[6:10])
+    if flags & 0x80 and version < 4:
+        # whole tag unsynchronisation, undo it before reading the frames
+        tag = tag[:10] + tag[10:].replace(b"\xff\x00", b"\xff")
+
+    pos = 10
+    if flags & 0x40 and version >= 3:
+        extended = tag[10:14]
+        pos += _syncsafe(extended) if version == 4 else 4 + struct.unpack(">I", extended)[0]
+
+    id_size, header_size = (3, 6) if version == 2 else (4, 10)
+    end = min(len(tag), 10 + size)
+    fields = {}
+    while pos + header_size <= end:
+        frame_id = tag[pos:pos + id_size]
+        if not frame_id.strip(b"\x00") or not frame_id.isalnum():
+            break  # padding
+        if version == 2:
+            frame_size = int.from_bytes(tag[pos + 3:pos + 6], "big")
+        elif version == 4:
+            frame_size = _syncsafe(tag[pos + 4:pos + 8])
+        else:
+            frame_size = struct.unpack(">I", tag[pos + 4:pos + 8])[0]
+
+        body = tag[pos + header_size:pos + header_size + frame_size]
+        name = ID3_FRAMES.get(frame_id.decode("latin-1"))
+        if name and body and name not in fields:
+            value = _decode_text(body[1:], body[0])
+            if value:
+                fields[name] = value
+        pos += header_size + frame_size
+    return fields
+
+
+def parse_id3v1(tail: bytes) -> Dict[str, str]:
+    if len(tail) < 128 or tail[-128:-125] != b"TAG":
+        return {}
+    tag = tail[-128:]
+    fields = {}
+    for name, start in (("title", 3), ("artist", 33), ("album", 63)):
+        value = tag[start:start + 30].split(b"\x00")[0].decode("latin-1").strip()
+        if value:
+            fields[name] = value
+    return fields
+
+
+def parse_ape(data: bytes) -> Dict[str, str]:
+    """Text items of an APEv2 tag, `data` ends with the tag footer"""
+    footer = data[-32:]
+    if len(footer) < 32 or footer[:8] != b"APETAGEX":
+        return {}
+    size, count = struct.unpack("<II", footer[12:20])
+    items = data[-size:-32] if size <= len(data) else b""
+
+    fields = {}
+    pos = 0
+    for _ in range(count):
+        if pos + 8 > len(items):
+            break
+        value_size, flags = struct.unpack("<II", items[pos:pos + 8])
+        key_end = items.find(b"\x00", pos + 8)
+        if key_end < 0:
+            break
+        key = items[pos + 8:key_end].decode("ascii", errors="replace").lower()
+        value = items[key_end + 1:key_end + 1 + value_size]
+        pos = key_end + 1 + value_size
+
+        name = APE_FIELDS.get(key)
+        if name and not flags & 0x06:  # text items only
+            text = value.split(b"\x00")[0].decode("utf-8", errors="replace").strip()
+            if text:
+                fields[name] = text
+    return fields
+
+
+def parse_vorbis_comment(block: bytes) -> Dict[str, str]:
+    vendor_length = struct.unpack("<I", block[:4])[0]
+    pos = 4 + vendor_length
+    count = struct.unpack("<I", block[pos:pos + 4])[0]
+    pos += 4
+
+    fields = {}
+    for _ in range(count):
+        if pos + 4 > len(block):
+            break
+        length = struct.unpack("<I", block[pos:pos + 4])[0]
+        comment = block[pos + 4:pos + 4 + length].decode("utf-8", errors="replace")
+        pos += 4 + length
+
+        key, _, value = comment.partition("=")
+        name = VORBIS_FIELDS.get(key.upper())
+        if name and value.strip() and name not in fields:
+            fields[name] = value.strip()
+    return fields
+
+
+async def _flac_tags(read, offset: int, file_size: int) -> Dict[str, object]:
+    position = offset + 4
+    fields = {}
+    while position + 4 <= file_size:
+        block_header = await read(position, position + 3)
+        last = block_header[0] & 0x80
+        block_type = block_header[0] & 0x7F
+        length = int.from_bytes(block_header[1:4], "big")
+        body_start = position + 4
+
+        if block_type == 0:  # STREAMINFO
+            info = await read(body_start, body_start + length - 1)
+            packed = int.from_bytes(info[10:18], "big")
+            sample_rate, total_samples = packed >> 44, packed & 0xFFFFFFFFF
+            if sample_rate and total_samples:
+                fields["duration"] = round(total_samples * 1000 / sample_rate)
+        elif block_type == 4:  # VORBIS_COMMENT
+            block = await read(body_start, body_start + min(length, MAX_TAG_SIZE) - 1)
+            fields.update(parse_vorbis_comment(block))
+            break
+        # PICTURE and the other blocks are skipped without reading them
+
+        position = body_start + length
+        if last:
+            break
+    return fields
+
+
+async def probe_tags(read: Reader, file_size: int) -> Dict[str, object]:
+    """
+    Read title, artist, album, isrc and duration (milliseconds) of an MP3
+    or FLAC file from its first and last few KiB. ID3v2 and FLAC vorbis
+    comments win over APEv2, which wins over ID3v1. Missing fields are
+    left out, unknown formats give an empty dict.
+    """
+    buffer = _RangeBuffer(read, file_size)
+    fields: Dict[str, object] = {}
+    try:
+        head = await buffer.read(0, HEAD_SIZE - 1)
+        offset = 0
+        if head[:3] == b"ID3" and len(head) >= 10:
+            tag_size = 10 + _syncsafe(head[6:10])
+            fields.update(parse_id3v2(head))
+            if tag_size > len(head) and not ("title" in fields and "artist" in fields):
+                # text frames after the cover art, read further into the tag
+                fields.update(parse_id3v2(await buffer.read(0, min(tag_size, MAX_TAG_SIZE) - 1)))
+            offset = tag_size + (10 if head[5] & 0x10 else 0)
+
+        # the seek index reads the same window for the Xing/VBRI header
+        audio = (await buffer.read(offset, offset + HEAD_SIZE - 1))[:4]
+        if audio == b"fLaC":
+            for name, value in (await _flac_tags(buffer.read, offset, file_size)).items():
+                fields.setdefault(name, value)
+
+        tail = await buffer.read(max(0, file_size - TAIL_SIZE), file_size - 1)
+        footer_end = len(tail) - (128 if tail[-128:-125] == b"TAG" else 0)
+        ape = tail[:footer_end]
+        if ape[-32:-24] == b"APETAGEX":
+            ape_size = struct.unpack("<I", ape[-20:-16])[0]
+            if ape_size > len(ape) and ape_size <= MAX_TAG_SIZE:
+                ape_end = file_size - (len(tail) - footer_end)
+                ape = await buffer.read(max(0, ape_end - ape_size), ape_end - 1)
+            for name, value in parse_ape(ape).items():
+                fields.setdefault(name, value)
+        for name, value in parse_id3v1(tail).items():
+            fields.setdefault(name, value)
+
+        length = fields.get("length")
+        if "duration" not in fields and length and str(length).isdigit():
+            fields["duration"] = int(length)
+        if "duration" not in fields and audio != b"fLaC":
+            # MP3 without TLEN, the Xing/VBRI header or the CBR bitrate gives it
+            index = await build_seek_index(buffer.read, file_size)
+            if index and index.get("duration"):
+                fields["duration"] = round(index["duration"] * 1000)
+    except (IndexError, ValueError, struct.error) as e:
+        LOGGER.debug(f"Tag probe stopped early - {e}")
+    fields.pop("length", None)
+    return fields
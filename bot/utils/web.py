@@ -1,5 +1,7 @@
 import re
-from typing import Dict
+from typing import Dict, Optional, Tuple
+
+from .errors import RangeNotSatisfiable
 
 
 def paginate(limit: int = 10, page: int = 1) -> Dict[str, int]:
@@ -7,16 +9,49 @@ def paginate(limit: int = 10, page: int = 1) -> Dict[str, int]:
     return {"limit": limit, "skip": skip}
 
 
-def parse_range_header(range_header: str, file_size: int):
+def parse_range_header(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a `bytes=` Range header into an inclusive (start, end).
+    Supports `N-M`, open-ended `N-` and suffix `-N` ranges. Returns None when
+    the whole file should be served (no, malformed or multi range) and raises
+    RangeNotSatisfiable when the range lies outside the file.
+    """
     if not range_header or not range_header.startswith("bytes="):
-        return 0, file_size - 1
+        return None
+
+    ranges = range_header[len("bytes="):]
+    if "," in ranges:
+        return None  # multipart responses are not supported, serve everything
+
+    match = re.fullmatch(r"\s*(\d*)\s*-\s*(\d*)\s*", ranges)
+    if not match or not (match.group(1) or match.group(2)):
+        return None
 
-    match = re.match(r"bytes=(\d+)-(\d*)", range_header)
-    if not match:
-        return 0, file_size - 1
+    if not match.group(1):
+        suffix = int(match.group(2))
+        if suffix == 0 or file_size == 0:
+            raise RangeNotSatisfiable
+        return max(0, file_size - suffix), file_size - 1
 
     start = int(match.group(1))
-    end = int(match.group(2)) if match.group(2) else file_size - 1
+    end = int(match.group(2)) if match.group(2) else None
+    if end is not None and end < start:
+        return None
+    if start >= file_size:
+        raise RangeNotSatisfiable
+    if end is None:
+        end = file_size - 1
 
     end = min(end, file_size - 1)
-    return start, end
\ No newline at end of file
+    return start, end
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match / If-Range style header against an ETag"""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
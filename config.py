@@ -39,6 +39,84 @@ class Config(object):
     
     SECRET_ALGORITHM = getenv('SECRET_ALGORITHM', "HS256")
     ACCESS_TOKEN_EXPIRE = int(getenv('ACCESS_TOKEN_EXPIRE', 60))
+    # track_id -> stream location cache of /stream (TTL in seconds)
+    TRACK_CACHE_SIZE = int(getenv('TRACK_CACHE_SIZE', 10000))
+    TRACK_CACHE_TTL = int(getenv('TRACK_CACHE_TTL', 600))
+
+    # lifetime of signed /stream URLs in minutes
+    STREAM_URL_EXPIRE = int(getenv('STREAM_URL_EXPIRE', 360))
+
+    # streaming chunk cache (sizes in MiB, disk tier is disabled without a directory)
+    CHUNK_CACHE_SIZE = int(getenv('CHUNK_CACHE_SIZE', 256))
+    CHUNK_CACHE_DIR = getenv('CHUNK_CACHE_DIR', None)
+    CHUNK_CACHE_DISK_SIZE = int(getenv('CHUNK_CACHE_DISK_SIZE', 2048))
+
+    # POST /prefetch, bots above PREFETCH_MAX_LOAD (seconds of queued bytes) are left alone
+    PREFETCH_MAX_TRACKS = int(getenv('PREFETCH_MAX_TRACKS', 5))
+    PREFETCH_PARTS = int(getenv('PREFETCH_PARTS', 4))
+    PREFETCH_CONCURRENCY = int(getenv('PREFETCH_CONCURRENCY', 2))
+    PREFETCH_MAX_LOAD = float(getenv('PREFETCH_MAX_LOAD', 1.0))
+
+    # local copies of hot tracks (disabled without a directory), size in MiB, window in seconds
+    TRACK_STORE_DIR = getenv('TRACK_STORE_DIR', None)
+    TRACK_STORE_SIZE = int(getenv('TRACK_STORE_SIZE', 4096))
+    TRACK_STORE_PLAYS = int(getenv('TRACK_STORE_PLAYS', 3))
+    TRACK_STORE_WINDOW = int(getenv('TRACK_STORE_WINDOW', 24 * 60 * 60))
+
+    # resolved FileIds per bot (TTL in seconds)
+    FILE_ID_CACHE_SIZE = int(getenv('FILE_ID_CACHE_SIZE', 10000))
+    FILE_ID_CACHE_TTL = int(getenv('FILE_ID_CACHE_TTL', 3600))
+
+    # media sessions per DC for every bot, keepalive interval in seconds (0 to disable)
+    MEDIA_SESSIONS_PER_DC = int(getenv('MEDIA_SESSIONS_PER_DC', 1))
+    MEDIA_SESSION_KEEPALIVE = int(getenv('MEDIA_SESSION_KEEPALIVE', 60))
+    PREWARM_MEDIA_SESSIONS = getenv('PREWARM_MEDIA_SESSIONS', 'False').lower() == 'true'
+
+    # take a bot out of rotation on long FloodWaits (seconds) or a high GetFile error rate
+    CIRCUIT_FLOOD_THRESHOLD = int(getenv('CIRCUIT_FLOOD_THRESHOLD', 10))
+    CIRCUIT_ERROR_RATE = float(getenv('CIRCUIT_ERROR_RATE', 0.5))
+    CIRCUIT_COOLDOWN = int(getenv('CIRCUIT_COOLDOWN', 30))
+
+    # GetFile part sizes in KiB (powers of two between 4 and 1024), parts grow from min to max
+    STREAM_MIN_CHUNK = int(getenv('STREAM_MIN_CHUNK', 64))
+    STREAM_MAX_CHUNK = int(getenv('STREAM_MAX_CHUNK', 1024))
+
+    # GetFile bytes in flight (MiB) per bot and per client of a bot, fairly shared between clients
+    BOT_INFLIGHT_BUDGET = int(getenv('BOT_INFLIGHT_BUDGET', 32))
+    CLIENT_INFLIGHT_BUDGET = int(getenv('CLIENT_INFLIGHT_BUDGET', 4))
+
+    # reverse proxies whose X-Forwarded-For identifies the listener (space separated addresses)
+    TRUSTED_PROXIES = set(getenv('TRUSTED_PROXIES', '').split())
+
+    # number of GetFile requests kept in flight per stream
+    STREAM_READ_AHEAD = int(getenv('STREAM_READ_AHEAD', 4))
+
+    # split large ranges across several bots (STRIPE_MIN_SIZE in MiB)
+    STRIPED_STREAMING = getenv('STRIPED_STREAMING', 'False').lower() == 'true'
+    STRIPE_WIDTH = int(getenv('STRIPE_WIDTH', 3))
+    STRIPE_MIN_SIZE = int(getenv('STRIPE_MIN_SIZE', 8))
+
+    # serve /stream from this many processes, each with a share of MULTI_CLIENTS (0 = single process)
+    # the main process still relays every streamed byte, so its one core caps the total throughput
+    STREAM_WORKERS = int(getenv('STREAM_WORKERS', 0))
+    STREAM_WORKER_SOCKET_DIR = getenv('STREAM_WORKER_SOCKET_DIR', '/tmp/shizuru')
+
+    # indexing of new audio messages
+    INDEXING_WORKERS = int(getenv('INDEXING_WORKERS', 4))
+    INDEXING_QUEUE_SIZE = int(getenv('INDEXING_QUEUE_SIZE', 1000))
+    # failed messages are retried with exponential backoff (seconds), then moved to the dead letters
+    INDEXING_MAX_ATTEMPTS = int(getenv('INDEXING_MAX_ATTEMPTS', 5))
+    INDEXING_RETRY_DELAY = float(getenv('INDEXING_RETRY_DELAY', 30))
+    INDEXING_LEASE_TIME = float(getenv('INDEXING_LEASE_TIME', 600))
+    # expected number of ids and artist names in the database, sizes the existence filter
+    EXISTENCE_FILTER_CAPACITY = int(getenv('EXISTENCE_FILTER_CAPACITY', 1000000))
+    # inserts are batched into one bulk upsert per collection (delay in seconds)
+    WRITE_BATCH_SIZE = int(getenv('WRITE_BATCH_SIZE', 500))
+    WRITE_BATCH_DELAY = float(getenv('WRITE_BATCH_DELAY', 0.5))
+
+    # /backfill, number of bots fetching history at the same time and seconds between rounds
+    BACKFILL_PARALLEL = int(getenv('BACKFILL_PARALLEL', 3))
+    BACKFILL_DELAY = float(getenv('BACKFILL_DELAY', 1.0))
 
 
     # Do not touch (except for yk what you doin)
@@ -47,4 +125,10 @@ class Config(object):
             MULTI_CLIENTS = json.loads(MULTI_CLIENTS)
         except json.JSONDecodeError:
             print("CRITICAL: Invalid JSON in MULTI_CLIENTS")
-            MULTI_CLIENTS = None
\ No newline at end of file
+            MULTI_CLIENTS = None
+
+    # GetFile limits must divide 1 MiB and offsets stay aligned to them, see plan_parts
+    if not all(4 <= size <= 1024 and size & (size - 1) == 0 for size in (STREAM_MIN_CHUNK, STREAM_MAX_CHUNK)) \
+            or STREAM_MIN_CHUNK > STREAM_MAX_CHUNK:
+        print("CRITICAL: STREAM_MIN_CHUNK and STREAM_MAX_CHUNK must be powers of two between 4 and 1024 (KiB), min not above max")
+        exit(1)
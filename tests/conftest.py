@@ -0,0 +1,7 @@
+import os
+
+# the essential settings Config refuses to start without
+os.environ.setdefault("ENV", "test")
+os.environ.setdefault("APP_ID", "1")
+os.environ.setdefault("ADMINS", "1")
+os.environ.setdefault("MUSIC_CHANNELS", "-1001")
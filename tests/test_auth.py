@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from config import Config
+from bot.database.models import StreamTarget
+from bot.utils.auth import sign_stream_target, verify_stream_signature
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch):
+    monkeypatch.setattr(Config, "SECRET_KEY", "test-secret")
+
+
+TARGET = StreamTarget(
+    track_id="track\n1", chat_id=-1001, msg_id=42, file_size=1234,
+    mime_type="audio/mpeg", file_unique_id="AgADuid"
+)
+
+
+def url_params(target=TARGET, **overrides):
+    """The query params of a signed URL as the server receives them"""
+    params = {name: str(value) for name, value in sign_stream_target(target).items()}
+    params.update(overrides)
+    return params
+
+
+def test_round_trip():
+    assert verify_stream_signature(TARGET.track_id, url_params()) == TARGET
+
+
+def test_round_trip_with_missing_fields():
+    target = StreamTarget(track_id="t", chat_id=1, msg_id=0)
+    assert verify_stream_signature("t", url_params(target)) == target
+
+
+@pytest.mark.parametrize("field, value", [
+    ("chat_id", "-1002"),
+    ("msg_id", "43"),
+    ("size", "1235"),
+    ("size", ""),
+    ("mime", "audio/flac"),
+    ("uid", "AgADother"),
+    ("exp", str(int(time.time()) + 10 ** 6)),
+])
+def test_tampered_field_fails(field, value):
+    assert verify_stream_signature(TARGET.track_id, url_params(**{field: value})) is None
+
+
+def test_tampered_track_id_fails():
+    assert verify_stream_signature("track", url_params()) is None
+
+
+def test_moving_text_between_fields_fails():
+    # "\n" joined fields would sign both of these as the same string
+    target = TARGET._replace(mime_type="audio/mpeg\nAgAD", file_unique_id="uid")
+    params = url_params(target, mime="audio/mpeg", uid="AgAD\nuid")
+    assert verify_stream_signature(TARGET.track_id, params) is None
+
+
+@pytest.mark.parametrize("sig", ["", "not-a-signature", "ünïcode"])
+def test_bad_signature_fails(sig):
+    assert verify_stream_signature(TARGET.track_id, url_params(sig=sig)) is None
+
+
+def test_expired_url_fails():
+    params = url_params()
+    params["exp"] = str(int(time.time()) - 1)
+    assert verify_stream_signature(TARGET.track_id, params) is None
+
+
+@pytest.mark.parametrize("missing", ["chat_id", "msg_id", "exp"])
+def test_missing_param_fails(missing):
+    params = url_params()
+    del params[missing]
+    assert verify_stream_signature(TARGET.track_id, params) is None
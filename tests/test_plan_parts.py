@@ -0,0 +1,116 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+from bot.utils.streamer import cut_chunk, plan_parts
+
+
+KiB = 1024
+MiB = 1024 * KiB
+
+
+def assert_valid_parts(parts):
+    """Telegram's GetFile rules: 4 KiB aligned, limit divides 1 MiB, no part crosses a 1 MiB boundary"""
+    for offset, limit in parts:
+        assert limit % (4 * KiB) == 0
+        assert MiB % limit == 0
+        assert offset % limit == 0
+        assert offset // MiB == (offset + limit - 1) // MiB
+
+
+def assert_contiguous(parts):
+    for (offset, limit), (next_offset, _) in zip(parts, parts[1:]):
+        assert offset + limit == next_offset
+
+
+def stitched(start, end, min_chunk, max_chunk):
+    """The bytes plan_parts + cut_chunk produce for a range of a file whose byte i is i % 251"""
+    parts, first_part_cut, last_part_cut = plan_parts(start, end, min_chunk, max_chunk)
+    data = b""
+    for index, (offset, limit) in enumerate(parts, start=1):
+        chunk = bytes((offset + i) % 251 for i in range(limit))
+        data += cut_chunk(chunk, index, len(parts), first_part_cut, last_part_cut)
+    return data
+
+
+def expected(start, end):
+    return bytes(i % 251 for i in range(start, end + 1))
+
+
+def test_aligned_range():
+    parts, first_part_cut, last_part_cut = plan_parts(0, 4 * MiB - 1, 64 * KiB, MiB)
+    assert_valid_parts(parts)
+    assert_contiguous(parts)
+    assert parts[0] == (0, 64 * KiB)
+    assert parts[-1][0] + parts[-1][1] == 4 * MiB
+    assert first_part_cut == 0
+    assert last_part_cut == parts[-1][1]
+
+
+def test_parts_grow_to_max_chunk():
+    parts, _, _ = plan_parts(0, 8 * MiB - 1, 64 * KiB, MiB)
+    sizes = [limit for _, limit in parts]
+    assert sizes == sorted(sizes)
+    assert sizes[-1] == MiB
+
+
+@pytest.mark.parametrize("start, end", [
+    (1, 100),
+    (12345, 987654),
+    (64 * KiB - 1, 64 * KiB),
+    (3 * MiB + 17, 5 * MiB + 3),
+])
+def test_unaligned_range(start, end):
+    parts, first_part_cut, _ = plan_parts(start, end, 64 * KiB, MiB)
+    assert_valid_parts(parts)
+    assert_contiguous(parts)
+    assert parts[0][0] + first_part_cut == start
+    assert stitched(start, end, 64 * KiB, MiB) == expected(start, end)
+
+
+@pytest.mark.parametrize("position", [0, 1, 4 * KiB - 1, MiB - 1, MiB, 7 * MiB + 12345])
+def test_single_byte(position):
+    parts, first_part_cut, last_part_cut = plan_parts(position, position, 64 * KiB, MiB)
+    assert_valid_parts(parts)
+    assert len(parts) == 1
+    assert last_part_cut - first_part_cut == 1
+    assert stitched(position, position, 64 * KiB, MiB) == expected(position, position)
+
+
+@pytest.mark.parametrize("start, end", [
+    (MiB - 4 * KiB, MiB + 4 * KiB - 1),
+    (MiB - 1, MiB),
+    (2 * MiB - 100, 2 * MiB + 100),
+    (MiB - 64 * KiB - 5, 3 * MiB + 5),
+])
+def test_range_across_1mib_boundary(start, end):
+    parts, _, _ = plan_parts(start, end, 64 * KiB, MiB)
+    assert_valid_parts(parts)
+    assert_contiguous(parts)
+    assert stitched(start, end, 64 * KiB, MiB) == expected(start, end)
+
+
+def test_tail_does_not_overfetch():
+    # a short range after the first part should not be read with a max sized part
+    parts, _, _ = plan_parts(0, 64 * KiB + 10, 64 * KiB, MiB)
+    assert_valid_parts(parts)
+    assert sum(limit for _, limit in parts) < 256 * KiB
+
+
+@pytest.mark.parametrize("min_chunk, max_chunk", [(4 * KiB, 4 * KiB), (4 * KiB, MiB), (MiB, MiB), (128 * KiB, 512 * KiB)])
+def test_chunk_size_settings(min_chunk, max_chunk):
+    start, end = 333, 3 * MiB + 777
+    parts, _, _ = plan_parts(start, end, min_chunk, max_chunk)
+    assert_valid_parts(parts)
+    assert all(limit <= max_chunk for _, limit in parts)
+    assert stitched(start, end, min_chunk, max_chunk) == expected(start, end)
+
+
+@pytest.mark.parametrize("min_chunk, max_chunk", [("48", "1024"), ("2", "1024"), ("64", "2048"), ("256", "128")])
+def test_invalid_chunk_settings_stop_startup(min_chunk, max_chunk):
+    env = {**os.environ, "STREAM_MIN_CHUNK": min_chunk, "STREAM_MAX_CHUNK": max_chunk}
+    result = subprocess.run([sys.executable, "-c", "import config"], env=env, capture_output=True, text=True)
+    assert result.returncode == 1
+    assert "STREAM_MIN_CHUNK" in result.stdout
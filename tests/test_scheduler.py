@@ -0,0 +1,61 @@
+import asyncio
+
+from bot.utils.scheduler import FairScheduler, Priority
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def admitted_order(scheduler, calls, promote=None):
+    """Queue `calls` (client, priority, key) behind a full bot, free it and return the admission order"""
+    order = []
+    blocker = await scheduler.acquire("blocker", Priority.PLAYBACK, scheduler.bot_budget)
+
+    async def call(client, priority, key):
+        admitted_for = await scheduler.acquire(client, priority, 1, key)
+        order.append((client, admitted_for))
+        scheduler.release(admitted_for, 1)
+
+    tasks = [asyncio.create_task(call(*args)) for args in calls]
+    await asyncio.sleep(0)
+    if promote:
+        promote()
+    scheduler.release(blocker, scheduler.bot_budget)
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_priority_order():
+    scheduler = FairScheduler(bot_budget=1, client_budget=1)
+    order = run(admitted_order(scheduler, [
+        ("prefetch", Priority.PREFETCH, None),
+        ("listener", Priority.PLAYBACK, None),
+    ]))
+    assert [client for client, _ in order] == ["listener", "prefetch"]
+
+
+def test_promote_moves_a_waiting_call_up_and_charges_the_new_client():
+    scheduler = FairScheduler(bot_budget=1, client_budget=1)
+    order = run(admitted_order(
+        scheduler,
+        [("prefetch", Priority.PREFETCH, "part"), ("download", Priority.BULK, None)],
+        promote=lambda: scheduler.promote("part", "listener", Priority.PLAYBACK),
+    ))
+    assert order[0] == ("prefetch", "listener")
+    assert scheduler.stats()["promoted"] == 1
+    assert scheduler.stats()["inflight_bytes"] == 0
+
+
+def test_promote_ignores_lower_priority_and_unknown_keys():
+    async def main():
+        scheduler = FairScheduler(bot_budget=1, client_budget=1)
+        blocker = await scheduler.acquire("blocker", Priority.PLAYBACK, 1)
+        task = asyncio.create_task(scheduler.acquire("listener", Priority.PLAYBACK, 1, "part"))
+        await asyncio.sleep(0)
+        assert not scheduler.promote("part", "prefetch", Priority.PREFETCH)
+        assert not scheduler.promote("other", "listener", Priority.PLAYBACK)
+        scheduler.release(blocker, 1)
+        assert await task == "listener"
+
+    run(main())
@@ -0,0 +1,192 @@
+import asyncio
+import struct
+
+import pytest
+
+from bot.utils.seek import build_seek_index, find_frame_start, parse_mp3_header, seek_offset
+
+
+# MPEG1 layer III, 128 kbps, 44100 Hz, stereo: 417 byte frames of 1152 samples
+MP3_HEADER = b"\xff\xfb\x90\x00"
+FRAME_LENGTH = 417
+SIDE_INFO = 32
+
+
+def mp3_frame(payload=b""):
+    return MP3_HEADER + payload.ljust(FRAME_LENGTH - 4, b"\x00")
+
+
+def mp3_frames(count):
+    return mp3_frame() * count
+
+
+def id3v2_tag(size):
+    body = b"\x00" * size
+    return b"ID3\x03\x00\x00" + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F]) + body
+
+
+def xing_frame(frames, audio_bytes, toc):
+    payload = b"\x00" * SIDE_INFO + b"Xing" + struct.pack(">III", 0x7, frames, audio_bytes) + bytes(toc)
+    return mp3_frame(payload)
+
+
+def vbri_frame(frames, audio_bytes, entries, scale=1, frames_per_entry=10):
+    table = b"".join(struct.pack(">H", entry) for entry in entries)
+    header = struct.pack(">HHHIIHHHH", 1, 0, 75, audio_bytes, frames, len(entries), scale, 2, frames_per_entry)
+    return mp3_frame(b"\x00" * 32 + b"VBRI" + header + table)
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def flac_frame_header():
+    # 4096 samples, 44.1 kHz, stereo, 16 bit, frame number 0
+    header = b"\xff\xf8\xc9\x18\x00"
+    return header + bytes([crc8(header)])
+
+
+def flac_file(sample_rate, total_samples, seek_points, audio_size=100_000):
+    packed = (sample_rate << 44) | (1 << 41) | (15 << 36) | total_samples
+    streaminfo = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    table = b"".join(struct.pack(">QQH", sample, offset, 4096) for sample, offset in seek_points)
+    data = b"fLaC"
+    data += bytes([0]) + len(streaminfo).to_bytes(3, "big") + streaminfo
+    data += bytes([0x80 | 3]) + len(table).to_bytes(3, "big") + table
+    return data + flac_frame_header() + b"\x00" * (audio_size - 6)
+
+
+def index_of(data):
+    async def read(start, end):
+        return data[start:end + 1]
+    return asyncio.run(build_seek_index(read, len(data)))
+
+
+def test_parse_mp3_header():
+    header = parse_mp3_header(MP3_HEADER, 0)
+    assert header["bitrate"] == 128000
+    assert header["sample_rate"] == 44100
+    assert header["samples"] == 1152
+    assert header["length"] == FRAME_LENGTH
+    assert not header["mono"]
+    assert parse_mp3_header(b"\xff\xfb\xf0\x00", 0) is None  # bitrate index 15
+    assert parse_mp3_header(b"\xff\xfb\x9c\x00", 0) is None  # sample rate index 3
+
+
+def test_cbr_index_is_linear():
+    data = id3v2_tag(1000) + mp3_frames(100)
+    index = index_of(data)
+    audio_start = 1010
+    audio_bytes = len(data) - audio_start
+    assert index["format"] == "mp3"
+    assert index["audio_start"] == audio_start
+    assert index["duration"] == pytest.approx(audio_bytes * 8 / 128000)
+    assert seek_offset(index, 0) == audio_start
+    end_time = index["points"][-1][0]  # the duration rounded to ms
+    assert index["points"] == [[0, audio_start], [end_time, len(data)]]
+    assert seek_offset(index, end_time / 2) == pytest.approx(audio_start + audio_bytes / 2, abs=1)
+    assert seek_offset(index, index["duration"] + 10) == len(data)
+
+
+def test_xing_toc():
+    frames = 1000
+    audio_bytes = frames * FRAME_LENGTH
+    # a file whose second half holds most of the bytes
+    toc = [i * 128 // 50 if i < 50 else 128 + (i - 50) * 127 // 50 for i in range(100)]
+    data = xing_frame(frames, audio_bytes, toc) + mp3_frames(frames)
+    index = index_of(data)
+
+    duration = frames * 1152 / 44100
+    assert index["duration"] == pytest.approx(duration)
+    assert len(index["points"]) == 101
+    assert index["points"][-1] == [round(duration, 3), audio_bytes]
+    halfway = index["points"][50]
+    assert halfway == [round(duration / 2, 3), toc[50] * audio_bytes // 256]
+    assert seek_offset(index, halfway[0]) == halfway[1]
+
+
+def test_xing_without_toc_keeps_the_ends():
+    payload = b"\x00" * SIDE_INFO + b"Info" + struct.pack(">II", 0x1, 500)
+    data = mp3_frame(payload) + mp3_frames(500)
+    index = index_of(data)
+    assert index["duration"] == pytest.approx(500 * 1152 / 44100)
+    assert index["points"][0] == [0, 0]
+    assert index["points"][-1][1] == len(data)
+
+
+def test_vbri_table():
+    entries = [100, 200, 300]
+    data = vbri_frame(frames=30, audio_bytes=600, entries=entries, scale=2) + mp3_frames(10)
+    index = index_of(data)
+
+    seconds_per_entry = 10 * 1152 / 44100
+    assert index["duration"] == pytest.approx(30 * 1152 / 44100)
+    assert index["points"][0] == [0, 0]
+    assert [point[1] for point in index["points"][1:]] == [200, 600, 1200]
+    assert index["points"][1][0] == round(seconds_per_entry, 3)
+    assert seek_offset(index, seconds_per_entry * 1.5) == pytest.approx(400, abs=1)
+
+
+def test_flac_seektable():
+    placeholder = (0xFFFFFFFFFFFFFFFF, 0)
+    data = flac_file(44100, 441000, [(0, 0), (220500, 40_000), placeholder])
+    index = index_of(data)
+
+    audio_start = data.index(flac_frame_header())
+    assert index["format"] == "flac"
+    assert index["duration"] == 10
+    assert index["audio_start"] == audio_start
+    assert index["points"] == [[0, audio_start], [5.0, audio_start + 40_000], [10.0, len(data)]]
+    assert seek_offset(index, 5) == audio_start + 40_000
+    assert seek_offset(index, 7.5) == (audio_start + 40_000 + len(data)) // 2
+
+
+def test_flac_without_seektable():
+    data = flac_file(48000, 480000, [])
+    index = index_of(data)
+    audio_start = data.index(flac_frame_header())
+    assert index["points"] == [[0, audio_start], [10.0, len(data)]]
+
+
+def test_unknown_format_has_no_index():
+    assert index_of(b"\x00" * 5000) is None
+
+
+def test_seek_offset_edges():
+    index = {"points": [[0, 100], [10, 100], [10, 200], [20, 300]]}
+    assert seek_offset(index, -5) == 100
+    assert seek_offset(index, 10) == 100
+    assert seek_offset(index, 15) == 250
+    assert seek_offset(index, 99) == 300
+
+
+@pytest.mark.parametrize("garbage", [b"", b"\x00" * 7, b"\xff\xfb\x00" * 3, b"\xff" * 50])
+def test_find_mp3_frame_start_lands_on_a_sync_word(garbage):
+    data = garbage + mp3_frames(3)
+    position = find_frame_start(data, "mp3")
+    assert position == len(garbage)
+    assert data[position] == 0xFF and data[position + 1] & 0xE0 == 0xE0
+
+
+def test_find_mp3_frame_start_needs_a_following_frame():
+    # a lone header-looking word inside the payload is not a frame start
+    data = b"\x00" * 10 + MP3_HEADER + b"\x01" * 20 + mp3_frames(2)
+    assert find_frame_start(data, "mp3") == 34
+
+
+def test_find_flac_frame_start_checks_the_crc():
+    bad = b"\xff\xf8\xc9\x18\x00\x00"
+    data = b"\x00" * 9 + bad + b"\x00" * 5 + flac_frame_header() + b"\x00" * 100
+    position = find_frame_start(data, "flac")
+    assert position == 20
+    assert data[position:position + 2] == b"\xff\xf8"
+
+
+def test_find_frame_start_without_frames():
+    assert find_frame_start(b"\x00" * 100, "mp3") is None
+    assert find_frame_start(b"\x00" * 100, "flac") is None
@@ -0,0 +1,177 @@
+import random
+import asyncio
+import struct
+
+import pytest
+
+from bot.utils.tags import parse_ape, parse_id3v1, parse_id3v2, parse_vorbis_comment, probe_tags
+
+
+def syncsafe(size):
+    return bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+
+
+def text_frame(frame_id, text, version=3, encoding=3):
+    body = bytes([encoding]) + text.encode({0: "latin-1", 1: "utf-16", 3: "utf-8"}[encoding])
+    if version == 2:
+        return frame_id.encode() + len(body).to_bytes(3, "big") + body
+    size = syncsafe(len(body)) if version == 4 else struct.pack(">I", len(body))
+    return frame_id.encode() + size + b"\x00\x00" + body
+
+
+def id3v2(frames, version=3, flags=0, extended=b"", padding=16, encoding=3):
+    """An ID3v2 tag, `frames` are (id, text) pairs"""
+    body = extended + b"".join(text_frame(frame_id, text, version, encoding) for frame_id, text in frames) + b"\x00" * padding
+    if flags & 0x80:
+        body = body.replace(b"\xff", b"\xff\x00")
+    return b"ID3" + bytes([version, 0, flags]) + syncsafe(len(body)) + body
+
+
+def id3v1(title="", artist="", album=""):
+    fields = b"".join(value.encode("latin-1").ljust(30, b"\x00") for value in (title, artist, album))
+    return b"TAG" + fields + b"2001" + b"\x00" * 30 + b"\x00"
+
+
+def ape(items):
+    body = b""
+    for key, value in items:
+        value = value.encode()
+        body += struct.pack("<II", len(value), 0) + key.encode() + b"\x00" + value
+    footer = b"APETAGEX" + struct.pack("<IIII", 2000, len(body) + 32, len(items), 0) + b"\x00" * 8
+    return body + footer
+
+
+def flac(comments, sample_rate=44100, total_samples=441000, picture_size=0):
+    packed = (sample_rate << 44) | (1 << 41) | (15 << 36) | total_samples
+    streaminfo = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    vendor = b"test"
+    vorbis = struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(comments))
+    for comment in comments:
+        vorbis += struct.pack("<I", len(comment.encode())) + comment.encode()
+
+    blocks = [(0, streaminfo)]
+    if picture_size:
+        blocks.append((6, b"\x00" * picture_size))
+    blocks.append((4, vorbis))
+    data = b"fLaC"
+    for i, (block_type, block) in enumerate(blocks):
+        last = 0x80 if i == len(blocks) - 1 else 0
+        data += bytes([last | block_type]) + len(block).to_bytes(3, "big") + block
+    return data + b"\xff\xf8" + b"\x00" * 4096
+
+
+def probe(data):
+    async def read(start, end):
+        return data[start:end + 1]
+    return asyncio.run(probe_tags(read, len(data)))
+
+
+@pytest.mark.parametrize("version", [2, 3, 4])
+def test_id3v2_versions(version):
+    ids = ("TT2", "TP1", "TAL") if version == 2 else ("TIT2", "TPE1", "TALB")
+    tag = id3v2(zip(ids, ("Song", "Artist", "Album")), version=version)
+    assert parse_id3v2(tag) == {"title": "Song", "artist": "Artist", "album": "Album"}
+
+
+def test_id3v2_encodings_and_first_value():
+    body = text_frame("TIT2", "Sóng", encoding=1) + text_frame("TPE1", "One\x00Two", encoding=0)
+    tag = b"ID3\x03\x00\x00" + syncsafe(len(body)) + body
+    assert parse_id3v2(tag) == {"title": "Sóng", "artist": "One"}
+
+
+def test_id3v2_unsynchronisation():
+    tag = id3v2([("TIT2", "ÿÿ title"), ("TPE1", "Artist")], flags=0x80, encoding=0)
+    assert b"\xff\x00" in tag
+    assert parse_id3v2(tag)["title"] == "ÿÿ title"
+    assert parse_id3v2(tag)["artist"] == "Artist"
+
+
+def test_id3v2_3_extended_header():
+    extended = struct.pack(">I", 6) + b"\x00" * 6
+    tag = id3v2([("TIT2", "Song")], version=3, flags=0x40, extended=extended)
+    assert parse_id3v2(tag) == {"title": "Song"}
+
+
+def test_id3v2_4_extended_header():
+    extended = syncsafe(6) + b"\x01\x00"
+    tag = id3v2([("TIT2", "Song")], version=4, flags=0x40, extended=extended)
+    assert parse_id3v2(tag) == {"title": "Song"}
+
+
+def test_id3v2_stops_at_padding_and_cut_tags():
+    tag = id3v2([("TIT2", "Song"), ("TPE1", "Artist")])
+    assert parse_id3v2(tag[:-30]) == {"title": "Song"}
+    assert parse_id3v2(b"ID3\x03") == {}
+    assert parse_id3v2(b"not a tag") == {}
+
+
+def test_id3v1():
+    assert parse_id3v1(b"audio" + id3v1("Song", "Artist")) == {"title": "Song", "artist": "Artist"}
+    assert parse_id3v1(b"\x00" * 128) == {}
+    assert parse_id3v1(b"TAG") == {}
+
+
+def test_ape():
+    tag = ape([("Title", "Song"), ("ARTIST", "Artist"), ("Year", "2001")])
+    assert parse_ape(b"audio" + tag) == {"title": "Song", "artist": "Artist"}
+    assert parse_ape(b"\x00" * 32) == {}
+
+
+def test_ape_cut_items():
+    tag = ape([("Title", "Song")])
+    cut = tag[:10] + tag[-32:]  # the footer claims more items than there are
+    assert parse_ape(cut) == {}
+
+
+def test_vorbis_comment():
+    block = flac(["title=Song", "ARTIST=Artist", "ARTIST=Second", "isrc=US1234567890"])
+    vorbis = block[4 + 4 + 34 + 4:]
+    assert parse_vorbis_comment(vorbis) == {"title": "Song", "artist": "Artist", "isrc": "US1234567890"}
+
+
+def test_probe_id3v2_wins_over_ape_and_id3v1():
+    data = id3v2([("TIT2", "Tagged"), ("TLEN", "215000")]) + b"\x00" * 2048 + ape([("Album", "From APE")]) + id3v1("Old", "Old Artist")
+    assert probe(data) == {"title": "Tagged", "album": "From APE", "artist": "Old Artist", "duration": 215000}
+
+
+def test_probe_reads_past_the_cover_art():
+    cover = ("APIC", "x" * 100_000)
+    data = id3v2([cover, ("TIT2", "Song"), ("TPE1", "Artist")]) + b"\x00" * 1024
+    assert probe(data)["title"] == "Song"
+
+
+def test_probe_flac():
+    data = flac(["TITLE=Song", "ARTIST=Artist"], sample_rate=48000, total_samples=480000, picture_size=200_000)
+    assert probe(data) == {"title": "Song", "artist": "Artist", "duration": 10000}
+
+
+def test_probe_flac_after_id3v2():
+    data = id3v2([("TIT2", "From ID3")]) + flac(["TITLE=From FLAC", "ARTIST=Artist"])
+    assert probe(data) == {"title": "From ID3", "artist": "Artist", "duration": 10000}
+
+
+@pytest.mark.parametrize("data", [
+    b"",
+    b"ID3",
+    b"ID3\x04\x00\x00\x7f\x7f\x7f\x7f",
+    b"fLaC",
+    b"fLaC\x84\x00\x00\x10vorbis",
+    b"\x00" * 200,
+    b"APETAGEX" * 8,
+])
+def test_probe_garbage_gives_empty(data):
+    assert probe(data) == {}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_probe_random_bytes_does_not_raise(seed):
+    rng = random.Random(seed)
+    data = bytes(rng.getrandbits(8) for _ in range(rng.randrange(1, 4096)))
+    for prefix in (b"", b"ID3\x03\x00\x00", b"fLaC"):
+        assert isinstance(probe(prefix + data), dict)
+
+
+@pytest.mark.parametrize("cut", [10, 25, 60, 200])
+def test_probe_truncated_tags(cut):
+    data = id3v2([("TIT2", "Song"), ("TPE1", "Artist")]) + flac(["TITLE=Song"])
+    assert isinstance(probe(data[:cut]), dict)
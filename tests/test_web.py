@@ -0,0 +1,76 @@
+import pytest
+
+from bot.utils.errors import RangeNotSatisfiable
+from bot.utils.web import etag_matches, parse_range_header
+
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    # N-M, the end is capped at the last byte
+    ("bytes=0-0", (0, 0)),
+    ("bytes=0-499", (0, 499)),
+    ("bytes=500-999", (500, 999)),
+    ("bytes=500-5000", (500, 999)),
+    ("bytes= 10 - 20 ", (10, 20)),
+    # open-ended N-
+    ("bytes=0-", (0, 999)),
+    ("bytes=999-", (999, 999)),
+    # suffix -N, longer than the file is the whole file
+    ("bytes=-1", (999, 999)),
+    ("bytes=-200", (800, 999)),
+    ("bytes=-5000", (0, 999)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range_header(header, SIZE) == expected
+
+
+@pytest.mark.parametrize("header", [
+    None,
+    "",
+    # other units and malformed ranges are ignored, the whole file is served
+    "items=0-10",
+    "bytes=",
+    "bytes=-",
+    "bytes=abc-def",
+    "bytes=1-2-3",
+    "bytes=0x10-20",
+    "bytes=20-10",
+    # multi-range is not supported
+    "bytes=0-10,20-30",
+    "bytes=0-10, -5",
+])
+def test_whole_file(header):
+    assert parse_range_header(header, SIZE) is None
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=1000-", SIZE),
+    ("bytes=1000-2000", SIZE),
+    ("bytes=-0", SIZE),
+    ("bytes=0-", 0),
+    ("bytes=-10", 0),
+])
+def test_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range_header(header, size)
+
+
+ETAG = '"AgADuid"'
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ("", False),
+    ('"AgADuid"', True),
+    ('W/"AgADuid"', True),
+    ("*", True),
+    ('"other", "AgADuid"', True),
+    ('"other" ,W/"AgADuid" ', True),
+    ('"other"', False),
+    ("AgADuid", False),
+    ('"AgADuid-2"', False),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, ETAG) is expected